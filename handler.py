@@ -1,2 +1,12 @@
 # Root wrapper. Real handler lives in src/handler.py.
+# In the image the src/ modules are copied flat into /, so make them
+# importable the same way when running from a checkout.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
 from src.handler import *  # noqa
+
+if __name__ == "__main__":
+    start()  # noqa: F405
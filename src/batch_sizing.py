@@ -0,0 +1,73 @@
+"""
+How many scenes to chain in one ComfyUI prompt.
+
+Every batch boundary costs a prompt, a last-frame handoff, an upload and
+another pass over the models, so fewer, longer batches are faster, as long
+as they fit on the GPU. Scenes in a chain are sampled one after another, so
+sampling memory does not grow with the chain. What grows is the decoded
+frames the chain carries forward, which ImageBatchExtendWithOverlap merges
+into one batch:
+
+    per scene  = frames_per_scene * width * height * SCENE_BYTES_PER_PIXEL
+    scenes     = (free VRAM - BATCH_VRAM_RESERVE_BYTES) // per scene
+
+Free VRAM is ComfyUI's ``/system_stats`` ``vram_free``, which already
+counts what torch has cached but not in use. The result is clamped to
+1..MAX_SCENES_PER_BATCH. SCENES_PER_BATCH=auto turns this on; the default
+stays the fixed 3 scenes per batch, and a job's ``scenes_per_batch`` (a
+number or ``"auto"``) overrides either.
+"""
+
+import os
+
+SCENES_PER_BATCH         = os.environ.get("SCENES_PER_BATCH", "3").lower()
+MAX_SCENES_PER_BATCH     = int(os.environ.get("MAX_SCENES_PER_BATCH", "8"))
+BATCH_VRAM_RESERVE_BYTES = int(os.environ.get("BATCH_VRAM_RESERVE_BYTES", str(6 * 1024**3)))
+# float32 RGB frames, plus headroom for the copies VAE decode and the
+# overlap merge make of them.
+SCENE_BYTES_PER_PIXEL    = float(os.environ.get("SCENE_BYTES_PER_PIXEL", "24"))
+
+# Used when neither the workflow nor /system_stats says otherwise.
+FALLBACK_SCENES_PER_BATCH = 3
+FALLBACK_RESOLUTION       = (832, 480)
+
+
+def workflow_resolution(graph):
+    """Largest width x height set on any node of the workflow."""
+    best = None
+    for node in graph.values():
+        inputs = node.get("inputs", {}) if isinstance(node, dict) else {}
+        w, h = inputs.get("width"), inputs.get("height")
+        if isinstance(w, int) and isinstance(h, int) and (best is None or w * h > best[0] * best[1]):
+            best = (w, h)
+    return best or FALLBACK_RESOLUTION
+
+
+def free_vram(system_stats):
+    """Free bytes on the first GPU per /system_stats, or None."""
+    devices = (system_stats or {}).get("devices") or []
+    if not devices:
+        return None
+    dev = devices[0]
+    if dev.get("vram_free") is None:
+        return None
+    return int(dev["vram_free"])
+
+
+def choose_scenes_per_batch(frames_per_scene, resolution, get_stats, requested=None):
+    """
+    Scenes per batch for a job; get_stats() returns /system_stats and is
+    only called in auto mode. Returns (scenes, reason).
+    """
+    pinned = requested if requested is not None else SCENES_PER_BATCH
+    if str(pinned).lower() != "auto":
+        return max(1, int(pinned)), "fixed"
+    free = free_vram(get_stats())
+    if free is None:
+        return FALLBACK_SCENES_PER_BATCH, "no VRAM stats"
+    width, height = resolution
+    per_scene = frames_per_scene * width * height * SCENE_BYTES_PER_PIXEL
+    fits = int((free - BATCH_VRAM_RESERVE_BYTES) // per_scene)
+    scenes = max(1, min(MAX_SCENES_PER_BATCH, fits))
+    return scenes, (f"{free/1024**3:.1f} GB free, {per_scene/1024**3:.2f} GB/scene "
+                    f"at {width}x{height}x{frames_per_scene}")
@@ -0,0 +1,414 @@
+"""
+Cold-start orchestrator, run by start.sh in place of the handler.
+
+Boot used to be strictly serial: LoRA preflight, then the ComfyUI launch,
+then a 1 s curl loop on /system_stats, then the handler polling it again,
+and the first job paid for loading every model. Here:
+
+  1. The model cache (model_cache.py) is put first in extra_model_paths.yaml
+     and ComfyUI is launched. While it starts, these run in parallel: the LoRA
+     preflight (against the model manifest), the handler import (runpod,
+     requests, ...), the copy of the workflow's models from the volume to
+     local disk, the LoRA registry load, and the volume diagnostics if
+     NETWORK_VOLUME_DEBUG is set.
+  2. Readiness is event driven: ComfyUI's "To see the GUI go to" log line
+     triggers an immediate /system_stats probe. Between events, probes back
+     off from 50 ms to 1 s, and a ComfyUI process that exits fails the boot
+     at once instead of after the timeout.
+  3. If BOOT_WARMUP is true, a minimal graph derived from /workflow.json (one
+     scene, a few frames, a tiny resolution) is queued. It loads the
+     diffusion models, LoRAs, text encoder and VAE before the first job.
+     Warmup problems are logged and never fail the boot. It is off by
+     default: it costs a render on every cold start.
+  4. The RunPod worker starts in this process. It doesn't wait for the
+     model copy, which can run for minutes on a cold volume: until a file
+     is copied ComfyUI reads it from the volume, and the copy's stats are
+     recorded when it finishes.
+
+Every phase is timed. The report is printed, written to BOOT_TIMINGS_PATH and
+attached to the first job's ``timings`` as ``cold_start``.
+"""
+
+import json
+import os
+import shlex
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from janitor import JANITOR
+from lora_registry import LORA_REGISTRY
+from model_cache import MODEL_CACHE
+from model_manifest import MODEL_MANIFEST_ROOT, manifest_for
+from network_volume import is_network_volume_debug_enabled, run_network_volume_diagnostics
+from timings import METRICS, record_boot
+
+COMFY_HOST = os.environ.get("COMFY_HOST", "127.0.0.1")
+COMFY_PORT = int(os.environ.get("COMFY_PORT", "8188"))
+COMFY_LAUNCH_CMD = os.environ.get(
+    "COMFY_LAUNCH_CMD",
+    f"comfy --workspace /comfyui/ComfyUI launch -- --listen 0.0.0.0 --port {COMFY_PORT}",
+)
+COMFY_BOOT_TIMEOUT_S = float(os.environ.get("COMFY_BOOT_TIMEOUT_S", "240"))
+
+WORKFLOW_PATH = os.environ.get("WORKFLOW_PATH", "/workflow.json")
+LORA_DIR      = os.environ.get("LORA_DIR", "/comfyui/models/loras")
+
+BOOT_WARMUP           = os.environ.get("BOOT_WARMUP", "false").lower() == "true"
+BOOT_WARMUP_FRAMES    = int(os.environ.get("BOOT_WARMUP_FRAMES", "5"))
+BOOT_WARMUP_SIZE      = int(os.environ.get("BOOT_WARMUP_SIZE", "256"))
+BOOT_WARMUP_TIMEOUT_S = float(os.environ.get("BOOT_WARMUP_TIMEOUT_S", "900"))
+BOOT_TIMINGS_PATH     = os.environ.get("BOOT_TIMINGS_PATH", "/tmp/boot_timings.json")
+
+# ComfyUI prints this once its HTTP server is listening.
+READY_LOG_MARKERS = ("To see the GUI go to", "Starting server")
+POLL_MIN_S = 0.05
+POLL_MAX_S = 1.0
+
+
+class BootTimer:
+    """Wall time per boot phase; phases may overlap."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases = {}
+
+    def run(self, phase, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.phases[phase] = round(seconds, 3)
+            print(f"[boot] {phase}: {seconds:.2f}s")
+
+    def report(self, **extra):
+        return dict({"started": self.started,
+                     "total_seconds": round(time.perf_counter() - self._t0, 3),
+                     "phases": dict(self.phases)}, **extra)
+
+
+# ---- readiness ---------------------------------------------------------------
+
+def wait_until_ready(base, timeout, proc=None, hint=None):
+    """
+    Block until GET {base}/system_stats answers 200. Probes back off from
+    POLL_MIN_S to POLL_MAX_S; setting ``hint`` (a threading.Event) probes
+    immediately. Raises RuntimeError on timeout or if ``proc`` exits.
+    """
+    deadline = time.monotonic() + timeout
+    delay = POLL_MIN_S
+    last_err = None
+    while True:
+        try:
+            r = requests.get(f"{base}/system_stats", timeout=3)
+            if r.status_code == 200:
+                return
+            last_err = f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            last_err = e
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"ComfyUI exited with code {proc.returncode} before it was ready")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError(f"ComfyUI not ready: {last_err}")
+        wait = min(delay, remaining)
+        if hint is not None:
+            if hint.wait(wait):
+                hint.clear()
+                delay = POLL_MIN_S
+                continue
+        else:
+            time.sleep(wait)
+        delay = min(delay * 2, POLL_MAX_S)
+
+
+def launch_comfy(hint):
+    """
+    Start ComfyUI; its output is forwarded and watched for READY_LOG_MARKERS.
+    It gets its own process group, so stop_comfy reaches the ComfyUI child
+    and not only the comfy-cli wrapper.
+    """
+    print(f"[boot] Launching ComfyUI: {COMFY_LAUNCH_CMD}")
+    proc = subprocess.Popen(shlex.split(COMFY_LAUNCH_CMD), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, bufsize=1, text=True,
+                            errors="replace", start_new_session=True)
+
+    def forward():
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            if any(marker in line for marker in READY_LOG_MARKERS):
+                hint.set()
+        sys.stdout.flush()
+
+    threading.Thread(target=forward, name="comfy-log", daemon=True).start()
+    return proc
+
+
+def stop_comfy(proc, timeout=10.0):
+    """SIGTERM ComfyUI's process group, wait for the wrapper, then SIGKILL what is left."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[boot] ComfyUI ignored SIGTERM for {timeout:.0f}s; killing it")
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# ---- preflight ---------------------------------------------------------------
+
+def lora_preflight(workflow_path=WORKFLOW_PATH, lora_dirs=None):
+    """
+    Check that every lora_name referenced in the workflow exists in one of
+    lora_dirs (the image's and the volume's by default), using the model
+    manifest. Returns a list of problems (empty when everything is in place).
+    """
+    if not os.path.isfile(workflow_path):
+        print(f"[preflight] WARNING: {workflow_path} not found, skipping check.")
+        return []
+    with open(workflow_path) as f:
+        wf = json.load(f)
+
+    referenced = set()
+    for node_id, node in wf.items():
+        if isinstance(node, dict) and node.get("class_type") == "LoraLoaderModelOnly":
+            name = node.get("inputs", {}).get("lora_name")
+            if name:
+                referenced.add((node_id, node.get("_meta", {}).get("title", ""), name))
+    if not referenced:
+        print("[preflight] No LoraLoaderModelOnly nodes found in workflow.json.")
+        return []
+
+    lora_dirs = [d for d in (lora_dirs or (LORA_DIR, os.path.join(MODEL_MANIFEST_ROOT, "loras")))
+                 if os.path.isdir(d)]
+    if not lora_dirs:
+        return [f"lora directory {LORA_DIR} does not exist"]
+    on_disk = set()
+    for lora_dir in lora_dirs:
+        manifest, folder = manifest_for(lora_dir)
+        on_disk |= set(manifest.ensure().files(folder))
+    print(f"[preflight] {len(referenced)} lora node(s) referenced, "
+          f"{len(on_disk)} file(s) found in {', '.join(lora_dirs)}")
+    missing = sorted((nid, title, name) for nid, title, name in referenced
+                     if name not in on_disk)
+    if missing:
+        return [f"node {nid} ({title}): '{name}' referenced in workflow.json but not on disk"
+                for nid, title, name in missing]
+
+    print("[preflight] All referenced LoRAs found on disk. OK.")
+    for nid, title, name in sorted(referenced):
+        print(f"  - node {nid} ({title}): {name}")
+    return []
+
+
+# ---- warmup ------------------------------------------------------------------
+
+def blank_png(size):
+    """A size x size mid-grey RGB PNG."""
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+    rows = b"".join(b"\x00" + b"\x80" * (3 * size) for _ in range(size))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 9))
+            + chunk(b"IEND", b""))
+
+
+def warmup_workflow(handler, image_name):
+    """
+    One scene of the default workflow with BOOT_WARMUP_FRAMES frames, every
+    width/height input shrunk to BOOT_WARMUP_SIZE, and its own output prefix.
+    Every loader node stays in the graph, so all models get loaded.
+    """
+    template = handler.compile_template(handler.load_default_workflow())
+    wf = handler.build_batch_workflow(
+        template, ["warmup"], negative_text="", frames_per_scene=BOOT_WARMUP_FRAMES,
+        sampling_steps=None, uploaded_filename=image_name, fps=handler.DEFAULT_FPS,
+        batch_start_idx=0, output_prefix="warmup",
+    )
+    for node_id, node in list(wf.items()):
+        inputs = node.get("inputs", {})
+        if isinstance(inputs.get("width"), int) and isinstance(inputs.get("height"), int):
+            wf[node_id] = dict(node, inputs=dict(inputs, width=BOOT_WARMUP_SIZE,
+                                                 height=BOOT_WARMUP_SIZE))
+    return wf
+
+
+def run_warmup(handler):
+    """Queue the warmup graph, wait for it, and delete its input and outputs."""
+    image_name = handler.upload_image_bytes_to_comfy(blank_png(BOOT_WARMUP_SIZE),
+                                                     "warmup_input.png")
+    try:
+        history = handler.run_prompt(warmup_workflow(handler, image_name),
+                                     client_id="boot-warmup", timeout=BOOT_WARMUP_TIMEOUT_S)
+    finally:
+        input_path = os.path.join(handler.find_input_dir(), image_name)
+        if os.path.isfile(input_path):
+            os.remove(input_path)
+            handler.forget_input(input_path)
+    output_dir = handler.find_output_dir()
+    for node_output in history.get("outputs", {}).values():
+        for key in ("images", "videos", "gifs", "files"):
+            for item in node_output.get(key, []):
+                if item.get("type") == "temp":
+                    continue
+                path = os.path.join(output_dir, item.get("subfolder", ""), item.get("filename", ""))
+                if os.path.isfile(path):
+                    os.remove(path)
+
+
+# ---- orchestration -----------------------------------------------------------
+
+def write_report(report):
+    print(f"[boot] Cold start {report['total_seconds']:.2f}s: "
+          + ", ".join(f"{k} {v:.2f}s" for k, v in report["phases"].items()))
+    if not BOOT_TIMINGS_PATH:
+        return
+    try:
+        with open(BOOT_TIMINGS_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        print(f"[boot] Could not write {BOOT_TIMINGS_PATH}: {e}")
+
+
+def import_handler():
+    import handler
+    return handler
+
+
+def prefetch_models():
+    """Copy the default workflow's models to the local cache; returns its stats."""
+    if not os.path.isfile(WORKFLOW_PATH):
+        return MODEL_CACHE.snapshot()
+    with open(WORKFLOW_PATH) as f:
+        workflow = json.load(f)
+    try:
+        return MODEL_CACHE.prefetch(workflow)
+    except OSError as e:
+        print(f"[boot] WARNING: model prefetch failed ({e}); ComfyUI reads the volume")
+        return MODEL_CACHE.snapshot()
+
+
+def in_background(name, fn, *args):
+    """
+    fn(*args) on a daemon thread; returns its Future. Unlike a pool task,
+    it never holds up the pool's shutdown or the process's exit.
+    """
+    fut = Future()
+
+    def run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return fut
+
+
+def record_prefetch(fut):
+    """Done-callback of the model prefetch: fold its stats into METRICS."""
+    if fut.cancelled() or fut.exception() is not None:
+        print(f"[boot] WARNING: model prefetch failed: {fut.exception()}")
+        return
+    stats = fut.result()
+    METRICS.transfer("model_prefetch", stats["bytes_prefetched"], stats["prefetch_seconds"])
+    METRICS.count("model_cache_hits", stats["hits"])
+    METRICS.count("model_cache_misses", stats["misses"])
+
+
+def sweep_leftovers(imported):
+    """Startup janitor sweep of ComfyUI's output and input dirs."""
+    handler = imported.result()
+    return JANITOR.sweep(handler.find_output_dir(), handler.find_input_dir())
+
+
+def main():
+    timer = BootTimer()
+    hint = threading.Event()
+    caching = MODEL_CACHE.enabled
+    if caching:
+        try:
+            MODEL_CACHE.write_model_paths()
+        except OSError as e:
+            print(f"[boot] WARNING: model cache disabled: {e}")
+            caching = False
+    proc = timer.run("comfy_launch", launch_comfy, hint)
+    base = f"http://{COMFY_HOST}:{COMFY_PORT}"
+
+    # The model copy can outlast everything else by minutes; it runs on its
+    # own thread so neither the worker start nor a failed boot waits for it.
+    prefetch = None
+    if caching:
+        prefetch = in_background("boot-prefetch", timer.run, "model_prefetch", prefetch_models)
+        prefetch.add_done_callback(record_prefetch)
+
+    pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="boot")
+    preflight = pool.submit(timer.run, "lora_preflight", lora_preflight)
+    imported  = pool.submit(timer.run, "handler_import", import_handler)
+    swept     = pool.submit(timer.run, "janitor_sweep", sweep_leftovers, imported)
+    if os.path.isfile(LORA_REGISTRY.path):
+        pool.submit(timer.run, "lora_registry", LORA_REGISTRY.refresh, True)
+    if is_network_volume_debug_enabled():
+        pool.submit(timer.run, "volume_diagnostics", run_network_volume_diagnostics)
+    ready     = pool.submit(timer.run, "comfy_ready", wait_until_ready,
+                            base, COMFY_BOOT_TIMEOUT_S, proc, hint)
+
+    def fail():
+        stop_comfy(proc)
+        pool.shutdown(wait=False, cancel_futures=True)
+        sys.exit(1)
+
+    problems = preflight.result()
+    if problems:
+        print("[preflight] ERROR: the following LoRAs are missing:")
+        for problem in problems:
+            print(f"  - {problem}")
+        fail()
+    try:
+        ready.result()
+    except RuntimeError as e:
+        print(f"[boot] ERROR: {e}")
+        fail()
+    handler = imported.result()
+    pool.shutdown(wait=False)
+
+    handler._comfy_ready = True
+    warmup = "skipped"
+    if BOOT_WARMUP:
+        try:
+            timer.run("warmup", run_warmup, handler)
+            warmup = "ok"
+        except Exception as e:
+            warmup = f"failed: {type(e).__name__}: {e}"
+            print(f"[boot] WARNING: warmup {warmup}; the first job will load the models")
+
+    extra = {"warmup": warmup, "janitor": swept.result()}
+    if prefetch is not None:
+        extra["model_cache"] = (prefetch.result() if prefetch.done() and not prefetch.exception()
+                                else "prefetch running")
+    report = timer.report(**extra)
+    write_report(report)
+    record_boot(report)
+    print("[boot] Starting RunPod handler...")
+    handler.start()
+
+
+if __name__ == "__main__":
+    main()
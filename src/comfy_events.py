@@ -0,0 +1,251 @@
+"""
+Event-driven prompt completion for worker-comfyui.
+
+ComfyUI pushes execution events over ``/ws?clientId=<client_id>``. Waiting on
+that stream lets the handler move on the moment a prompt finishes instead of
+sleeping between ``/history`` polls.
+
+The socket must be opened *before* the prompt is queued, otherwise a fast
+prompt can finish before we are listening:
+
+    with ComfyEventStream(COMFY_HOST, COMFY_PORT, client_id) as events:
+        prompt_id = submit_prompt(wf, client_id)["prompt_id"]
+        history = events.wait(prompt_id, timeout=14400)
+
+If the socket cannot be opened at all, ``wait`` falls back to polling
+``/history/{prompt_id}`` so a worker with a broken websocket still completes
+jobs, just with the old latency.
+"""
+
+import json
+import os
+import time
+
+import requests
+import websocket
+
+WEBSOCKET_RECONNECT_ATTEMPTS = int(os.environ.get("WEBSOCKET_RECONNECT_ATTEMPTS", "5"))
+WEBSOCKET_RECONNECT_DELAY_S  = float(os.environ.get("WEBSOCKET_RECONNECT_DELAY_S", "3"))
+WEBSOCKET_TRACE              = os.environ.get("WEBSOCKET_TRACE", "false").lower() == "true"
+
+# How long a single recv() may block before we re-check the deadline and take
+# a cheap look at /history (covers events lost while the socket was down).
+WEBSOCKET_RECV_TIMEOUT_S = float(os.environ.get("WEBSOCKET_RECV_TIMEOUT_S", "30"))
+
+FALLBACK_POLL_INTERVAL_S = 2.0
+
+if WEBSOCKET_TRACE:
+    websocket.enableTrace(True)
+
+
+class ComfyExecutionError(RuntimeError):
+    """Raised when ComfyUI reports execution_error / execution_interrupted."""
+
+    def __init__(self, prompt_id, data):
+        self.prompt_id = prompt_id
+        self.data = data or {}
+        node = self.data.get("node_id")
+        node_type = self.data.get("node_type")
+        message = self.data.get("exception_message") or "execution interrupted"
+        where = f" in node {node} ({node_type})" if node else ""
+        super().__init__(f"Prompt {prompt_id} failed{where}: {message.strip()}")
+
+
+class ComfyEventStream:
+    """
+    One websocket connection to ComfyUI for a given client_id.
+
+    The stream can be reused for several prompts queued under the same
+    client_id (e.g. every batch of one job).
+    """
+
+    def __init__(self, host, port, client_id, on_event=None):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.on_event = on_event
+        self.ws = None
+        self.http_base = f"http://{host}:{port}"
+        self.ws_url = f"ws://{host}:{port}/ws?clientId={client_id}"
+
+    # ---- connection management -------------------------------------------
+
+    def connect(self):
+        """Open the socket. Returns True on success, False if unavailable."""
+        try:
+            ws = websocket.WebSocket()
+            ws.connect(self.ws_url, timeout=10)
+            ws.settimeout(WEBSOCKET_RECV_TIMEOUT_S)
+            self.ws = ws
+            return True
+        except Exception as e:
+            print(f"[comfy_ws] Could not open {self.ws_url}: {e}")
+            self.ws = None
+            return False
+
+    def reconnect(self):
+        self.close()
+        for attempt in range(1, WEBSOCKET_RECONNECT_ATTEMPTS + 1):
+            print(f"[comfy_ws] Reconnecting ({attempt}/{WEBSOCKET_RECONNECT_ATTEMPTS})...")
+            if self.connect():
+                return True
+            time.sleep(WEBSOCKET_RECONNECT_DELAY_S)
+        return False
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+        self.ws = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # ---- history helpers ---------------------------------------------------
+
+    def fetch_history(self, prompt_id):
+        """Return the history entry for prompt_id, or None if not there yet."""
+        r = requests.get(f"{self.http_base}/history/{prompt_id}", timeout=30)
+        r.raise_for_status()
+        return r.json().get(prompt_id)
+
+    def poll_history(self, prompt_id, timeout):
+        """Legacy polling path, used only when the socket is unavailable."""
+        for _, entry in self.poll_each([prompt_id], timeout):
+            return entry
+
+    def poll_each(self, prompt_ids, timeout):
+        """Polling counterpart of wait_each."""
+        pending = list(prompt_ids)
+        deadline = time.time() + timeout
+        while pending and time.time() < deadline:
+            for prompt_id in list(pending):
+                try:
+                    entry = self.fetch_history(prompt_id)
+                except requests.exceptions.ConnectionError:
+                    print("[comfy_ws] /history connection dropped, retrying...")
+                    break
+                if entry is not None:
+                    pending.remove(prompt_id)
+                    yield prompt_id, self._check_history(prompt_id, entry)
+            if pending:
+                time.sleep(FALLBACK_POLL_INTERVAL_S)
+        if pending:
+            raise RuntimeError(f"Prompt(s) {', '.join(pending)} did not finish within {timeout}s")
+
+    def _check_history(self, prompt_id, entry):
+        status = entry.get("status") or {}
+        if status.get("status_str") == "error":
+            data = {}
+            for name, msg in status.get("messages", []):
+                if name in ("execution_error", "execution_interrupted"):
+                    data = msg
+            raise ComfyExecutionError(prompt_id, data)
+        return entry
+
+    # ---- main wait loop ----------------------------------------------------
+
+    def wait(self, prompt_id, timeout=14400):
+        """
+        Block until prompt_id finishes and return its /history entry.
+
+        Raises ComfyExecutionError if ComfyUI reports a failure and
+        RuntimeError on timeout.
+        """
+        for _, entry in self.wait_each([prompt_id], timeout):
+            return entry
+
+    def wait_each(self, prompt_ids, timeout=14400):
+        """
+        Yield (prompt_id, history entry) for several queued prompts in the
+        order they finish. The timeout covers all of them; errors are raised
+        as in ``wait``.
+        """
+        pending = list(prompt_ids)
+        deadline = time.time() + timeout
+        if self.ws is None:
+            if not self.connect():
+                yield from self.poll_each(pending, timeout)
+                return
+            # Opened after the prompts were queued: their events may be gone.
+            yield from self._finished_in_history(pending)
+
+        while pending and time.time() < deadline:
+            try:
+                raw = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                yield from self._finished_in_history(pending)
+                continue
+            except (websocket.WebSocketConnectionClosedException, OSError) as e:
+                print(f"[comfy_ws] Connection lost: {e}")
+                if not self.reconnect():
+                    print("[comfy_ws] Giving up on websocket, falling back to polling.")
+                    yield from self.poll_each(pending, max(0.0, deadline - time.time()))
+                    return
+                # Prompts may have finished while we were disconnected.
+                yield from self._finished_in_history(pending)
+                continue
+
+            # Binary frames are latent previews; nothing to do with them.
+            if not isinstance(raw, str):
+                continue
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+
+            msg_type = message.get("type")
+            data = message.get("data") or {}
+            prompt_id = data.get("prompt_id")
+            if prompt_id not in pending:
+                continue
+            if self.on_event is not None:
+                self.on_event(msg_type, data)
+
+            if msg_type in ("execution_error", "execution_interrupted"):
+                raise ComfyExecutionError(prompt_id, data)
+            if msg_type == "execution_success" or (
+                msg_type == "executing" and data.get("node") is None
+            ):
+                pending.remove(prompt_id)
+                yield prompt_id, self._wait_for_history_entry(prompt_id, deadline)
+
+        if pending:
+            raise RuntimeError(f"Prompt(s) {', '.join(pending)} did not finish within {timeout}s")
+
+    def _finished_in_history(self, pending):
+        # Called when ComfyUI may be briefly unreachable (recv timeout, right
+        # after a reconnect); a failed look just means keep waiting.
+        for prompt_id in list(pending):
+            try:
+                entry = self.fetch_history(prompt_id)
+            except requests.exceptions.ConnectionError:
+                print("[comfy_ws] /history connection dropped, will check again...")
+                return
+            if entry is not None:
+                pending.remove(prompt_id)
+                yield prompt_id, self._check_history(prompt_id, entry)
+
+    def _wait_for_history_entry(self, prompt_id, deadline):
+        # History is written right before the final event is sent, but give
+        # ComfyUI a few short retries in case of a race.
+        delay = 0.05
+        while True:
+            try:
+                entry = self.fetch_history(prompt_id)
+            except requests.exceptions.ConnectionError:
+                print("[comfy_ws] /history connection dropped, retrying...")
+                entry = None
+            if entry is not None:
+                return self._check_history(prompt_id, entry)
+            if time.time() >= deadline:
+                raise RuntimeError(f"Prompt {prompt_id} finished but has no history entry")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
@@ -0,0 +1,114 @@
+"""
+Resolve a finished prompt's video output to a local file.
+
+The batch video is the output of one known node: the mapping's ``output``
+selector (``204``, the VHS_VideoCombine node, in the default workflow) or a
+job's ``output_node``. Only that node's ``gifs`` / ``videos`` entries are
+looked at, so the PNG frames, previews and metadata images other nodes save
+are never stat'ed or downloaded.
+
+The file is then taken from wherever it already is:
+
+  1. the ``fullpath`` VHS reports, or ``<output dir>/<subfolder>/<filename>``
+     when ComfyUI shares this container's filesystem (one stat), otherwise
+  2. streamed from ComfyUI's ``/view`` into the job's temp dir, so the
+     handler also works when ComfyUI runs on another host or container.
+"""
+
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+COMFY_VIEW_TIMEOUT_S = float(os.environ.get("COMFY_VIEW_TIMEOUT_S", "60"))
+
+VIDEO_NODE_TYPES = ("VHS_VideoCombine", "SaveVideo", "SaveAnimatedWEBP", "SaveAnimatedPNG")
+VIDEO_KEYS = ("gifs", "videos")
+READ_SIZE = 1024 * 1024
+
+
+class OutputNotFoundError(RuntimeError):
+    pass
+
+
+def output_node_ids(template, mapping=None, override=None):
+    """Node ids whose output is the batch video, most specific first."""
+    if override is not None:
+        return [str(override)]
+    selector = (mapping or {}).get("output")
+    node_ids = template.select(selector) if selector else []
+    if node_ids:
+        return node_ids
+    return [n for cls in VIDEO_NODE_TYPES for n in template.by_class.get(cls, [])]
+
+
+def video_item(node_output):
+    """The last saved (non-temp) video entry of one node's history output."""
+    for key in VIDEO_KEYS:
+        items = [i for i in (node_output or {}).get(key, [])
+                 if i.get("filename") and i.get("type", "output") != "temp"]
+        videos = [i for i in items if str(i.get("format", "video/")).startswith("video/")]
+        if videos or items:
+            return (videos or items)[-1]
+    return None
+
+
+class OutputResolver:
+    def __init__(self, comfy_base):
+        self.comfy_base = comfy_base
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def target(self, history, node_ids):
+        """(node_id, item) for the video in history; falls back to any video node."""
+        outputs = history.get("outputs", {})
+        for node_id in node_ids:
+            item = video_item(outputs.get(str(node_id)))
+            if item:
+                return str(node_id), item
+        for node_id, node_output in outputs.items():
+            item = video_item(node_output)
+            if item:
+                print(f"[output] Node(s) {', '.join(map(str, node_ids))} saved no video; "
+                      f"using node {node_id}")
+                return node_id, item
+        return None, None
+
+    def fetch(self, item, output_dir, dest_dir):
+        """
+        Local path of item: the file itself if it's on this filesystem, else
+        a copy streamed from /view into dest_dir. Returns (path, bytes
+        downloaded, seconds).
+        """
+        name, subfolder = item["filename"], item.get("subfolder", "")
+        local = item.get("fullpath") or os.path.join(output_dir, subfolder, name)
+        if os.path.isfile(local):
+            return local, 0, 0.0
+
+        start = time.perf_counter()
+        dest = os.path.join(dest_dir, os.path.basename(name))
+        part = f"{dest}.part"
+        received = 0
+        params = {"filename": name, "subfolder": subfolder, "type": item.get("type", "output")}
+        try:
+            with self.session.get(f"{self.comfy_base}/view", params=params, stream=True,
+                                  timeout=COMFY_VIEW_TIMEOUT_S) as r:
+                if r.status_code == 404:
+                    raise OutputNotFoundError(
+                        f"ComfyUI has no output {os.path.join(subfolder, name)}")
+                r.raise_for_status()
+                with open(part, "wb") as f:
+                    for block in r.iter_content(READ_SIZE):
+                        f.write(block)
+                        received += len(block)
+            os.replace(part, dest)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        seconds = time.perf_counter() - start
+        print(f"[output] {name} streamed from /view ({received/1024/1024:.1f} MB, {seconds:.2f}s)")
+        return dest, received, seconds
@@ -0,0 +1,205 @@
+"""
+Incremental fragmented-MP4 assembly.
+
+Instead of concatenating every chunk once the last batch is done, each chunk
+is remuxed (stream copy) into MP4 fragments and appended to a growing file as
+soon as it is produced:
+
+    <ftyp><moov>                      init segment, from the first chunk
+    <moof><mdat><moof><mdat>...       chunk 1
+    <moof><mdat>...                   chunk 2, tfdt shifted to follow chunk 1
+
+The file only ever grows, so it is a valid video after every append and can
+be uploaded while it is still being written. Fragments use
+``default_base_moof`` so their data offsets are relative to their own moof
+box and survive being moved into another file. Decode times (``tfdt``) and
+sequence numbers (``mfhd``) are rewritten so the fragments form one
+continuous timeline.
+
+All chunks must share codec parameters (same ``stsd`` box), which is the case
+for batches rendered by the same workflow. If a chunk doesn't match,
+``append`` raises IncompatibleChunkError and the caller should fall back to a
+regular ffmpeg concat.
+"""
+
+import os
+import struct
+import subprocess
+import threading
+
+
+class IncompatibleChunkError(RuntimeError):
+    pass
+
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, box_start, box_end) for ISO-BMFF boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, btype = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f"Corrupt MP4 box at offset {pos}")
+        yield btype.decode("latin-1"), pos, pos + size
+        pos += size
+
+
+def find_box(data, path, start=0, end=None):
+    """Return (start, end) of the first box matching a path like 'moov/trak/mdia'."""
+    head, _, rest = path.partition("/")
+    for btype, b_start, b_end in iter_boxes(data, start, end):
+        if btype == head:
+            if not rest:
+                return b_start, b_end
+            return find_box(data, rest, b_start + 8, b_end)
+    return None
+
+
+def sample_description(init):
+    """Raw stsd box of the first track; identifies the codec configuration."""
+    span = find_box(init, "moov/trak/mdia/minf/stbl/stsd")
+    return bytes(init[span[0]:span[1]]) if span else b""
+
+
+def track_timescale(init):
+    span = find_box(init, "moov/trak/mdia/mdhd")
+    if not span:
+        return 0
+    version = init[span[0] + 8]
+    pos = span[0] + 12 + (16 if version == 1 else 8)
+    return struct.unpack(">I", init[pos:pos + 4])[0]
+
+
+def _shift_traf(moof, traf_start, traf_end, base):
+    """Add base to the traf's tfdt and return the fragment's duration."""
+    default_duration = 0
+    duration = 0
+    for btype, start, end in iter_boxes(moof, traf_start + 8, traf_end):
+        flags = struct.unpack(">I", moof[start + 8:start + 12])[0] & 0xFFFFFF
+        if btype == "tfhd":
+            pos = start + 16
+            if flags & 0x01:
+                pos += 8
+            if flags & 0x02:
+                pos += 4
+            if flags & 0x08:
+                default_duration = struct.unpack(">I", moof[pos:pos + 4])[0]
+        elif btype == "tfdt":
+            if moof[start + 8] == 1:
+                old = struct.unpack(">Q", moof[start + 12:start + 20])[0]
+                struct.pack_into(">Q", moof, start + 12, old + base)
+            else:
+                old = struct.unpack(">I", moof[start + 12:start + 16])[0]
+                struct.pack_into(">I", moof, start + 12, old + base)
+        elif btype == "trun":
+            count = struct.unpack(">I", moof[start + 12:start + 16])[0]
+            pos = start + 16
+            if flags & 0x01:
+                pos += 4
+            if flags & 0x04:
+                pos += 4
+            if not flags & 0x100:
+                duration += count * default_duration
+                continue
+            stride = 4 * bin(flags & 0xF00).count("1")
+            for i in range(count):
+                duration += struct.unpack(">I", moof[pos + i * stride:pos + i * stride + 4])[0]
+    return duration
+
+
+def fragment_chunk(chunk_path):
+    """Stream-copy chunk_path into fragmented MP4 bytes."""
+    cmd = ["ffmpeg", "-v", "error", "-i", chunk_path, "-c", "copy",
+           "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+           "-f", "mp4", "pipe:1"]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(f"FFmpeg fragment failed: {result.stderr.decode(errors='replace')}")
+    return result.stdout
+
+
+class FragmentedAssembler:
+    """
+    Appends chunks, in batch order, to one growing fragmented MP4.
+
+    ``append`` may be called from worker threads; chunk ``index`` values
+    start at 0 and each call waits until every earlier index has been
+    written, so submission order doesn't need to match completion order.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.bytes_written = 0
+        self.failed = None
+        self._stsd = None
+        self._timescale = 0
+        self._decode_time = 0
+        self._sequence = 0
+        self._next_index = 0
+        self._cond = threading.Condition()
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+
+    def append(self, index, chunk_path):
+        with self._cond:
+            self._cond.wait_for(lambda: self._next_index == index)
+            try:
+                if self.failed is not None:
+                    raise self.failed
+                self._append_locked(chunk_path)
+            except Exception as e:
+                self.failed = self.failed or e
+                raise
+            finally:
+                self._next_index += 1
+                self._cond.notify_all()
+        return self.bytes_written
+
+    @property
+    def duration(self):
+        """Seconds of video written so far."""
+        return self._decode_time / self._timescale if self._timescale else 0.0
+
+    def _append_locked(self, chunk_path):
+        data = fragment_chunk(chunk_path)
+        out = bytearray()
+        chunk_duration = 0
+        for btype, start, end in iter_boxes(data):
+            if btype == "moov":
+                stsd = sample_description(data)
+                timescale = track_timescale(data)
+                if self._stsd is None:
+                    self._stsd, self._timescale = stsd, timescale
+                elif stsd != self._stsd or timescale != self._timescale:
+                    raise IncompatibleChunkError(
+                        f"{os.path.basename(chunk_path)} has different codec parameters"
+                    )
+                if self.bytes_written == 0:
+                    out += data[:end]
+            elif btype == "moof":
+                self._sequence += 1
+                moof = bytearray(data[start:end])
+                for child, c_start, c_end in iter_boxes(moof, 8):
+                    if child == "mfhd":
+                        struct.pack_into(">I", moof, c_start + 12, self._sequence)
+                    elif child == "traf":
+                        # Single video track, so one traf per moof.
+                        chunk_duration += _shift_traf(moof, c_start, c_end, self._decode_time)
+                out += moof
+            elif btype == "mdat":
+                out += data[start:end]
+            # ftyp is written as part of the init segment; mfra/sidx/free are
+            # per-file indexes that would be wrong after appending.
+
+        with open(self.output_path, "ab") as f:
+            f.write(out)
+        self.bytes_written += len(out)
+        self._decode_time += chunk_duration
+        print(f"[fmp4] Appended {os.path.basename(chunk_path)} -> "
+              f"{self.bytes_written/1024/1024:.1f} MB, {self.duration:.1f}s")
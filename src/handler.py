@@ -1,12 +1,36 @@
 import os
+import re
+import shutil
+import asyncio
 import time
 import json
-import base64
+import hashlib
+import io
 import subprocess
 import tempfile
-import copy
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
 import runpod
+
+from comfy_events import ComfyEventStream
+from resumable_upload import ResumableUploader
+from pipeline import JobPipeline
+from fmp4 import FragmentedAssembler
+from workflow_template import (WorkflowTemplate, compile_template, DEFAULT_MAPPING, scene_capacity,
+                               supports_latent_handoff, LATENT_SAVE_ID)
+from result_cache import ResultCache, IMAGE_PLACEHOLDER, LATENT_PLACEHOLDER
+from image_ingest import ImageIngestor
+from job_journal import JobJournal, journal_enabled, prune_journals, check_resume_from
+from timings import JobTimings, METRICS
+from model_cache import MODEL_CACHE
+from janitor import JANITOR, REUSABLE_INPUT, ref_path, job_output_files, job_input_files
+from lora_registry import LORA_REGISTRY
+from comfy_outputs import OutputResolver, output_node_ids
+from hls import HlsPackager, HLS_ENABLED
+from batch_sizing import choose_scenes_per_batch, workflow_resolution
+from boot import wait_until_ready
    
 COMFY_HOST = os.environ.get("COMFY_HOST", "127.0.0.1")
 COMFY_PORT = int(os.environ.get("COMFY_PORT", "8188"))
@@ -22,13 +46,15 @@ SUPABASE_BUCKET = os.environ.get("SUPABASE_BUCKET", "videos")
 
 
 
-DEFAULT_WORKFLOW_PATH = "/workflow.json"
+DEFAULT_WORKFLOW_PATH = os.environ.get("WORKFLOW_PATH", "/workflow.json")
 
 COMFY_OUTPUT_DIRS = [
     "/comfyui/output",
     "/comfyui/ComfyUI/output",
     "/root/comfyui/output",
 ]
+if os.environ.get("COMFY_OUTPUT_DIR"):
+    COMFY_OUTPUT_DIRS.insert(0, os.environ["COMFY_OUTPUT_DIR"])
 
 OUTPUT_NODE_TYPES = {
     "SaveImage", "SaveAnimatedWEBP", "SaveAnimatedPNG",
@@ -38,49 +64,48 @@ OUTPUT_NODE_TYPES = {
 MAX_FRAMES_PER_SCENE     = 257
 DEFAULT_FRAMES_PER_SCENE = 81
 DEFAULT_FPS              = 16
-SCENES_PER_BATCH         = 3
+
+# Jobs this worker runs at once. Each job spends much of its time in ffmpeg,
+# uploads and handoffs; with more than one, ComfyUI's queue keeps the GPU
+# busy through those CPU stages.
+JOB_CONCURRENCY = max(1, int(os.environ.get("JOB_CONCURRENCY", "1")))
+
+# Serve jobs with a generator handler that yields each chunk as soon as it
+# is uploaded (RunPod /stream), then the final result.
+STREAM_RESULTS = os.environ.get("STREAM_RESULTS", "false").lower() == "true"
+
+# How a batch continues from the previous one: "image" decodes its last
+# frame and re-encodes it as the next batch's input, "latent" passes the
+# sampler latents on directly (see workflow_template).
+HANDOFF_MODE  = os.environ.get("HANDOFF_MODE", "image").lower()
+HANDOFF_MODES = ("image", "latent")
 
 _comfy_ready = False
 
 
-def supabase_upload(local_path: str, remote_filename: str) -> str:
+_uploader = ResumableUploader(SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET)
+
+
+def supabase_upload_with_stats(local_path: str, remote_filename: str,
+                               content_type: str = "video/mp4"):
+    """Upload through the shared resumable engine; returns an UploadResult."""
     if not SUPABASE_KEY:
         raise RuntimeError("SUPABASE_KEY env var not set.")
-    url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{remote_filename}"
-    with open(local_path, "rb") as f:
-        resp = requests.post(
-            url,
-            headers={
-                "Authorization": f"Bearer {SUPABASE_KEY}",
-                "Content-Type": "video/mp4",
-                "x-upsert": "true",
-            },
-            data=f,
-            timeout=300,
-        )
-    if resp.status_code not in (200, 201):
-        raise RuntimeError(f"Supabase upload failed {resp.status_code}: {resp.text}")
-    public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{remote_filename}"
-    print(f"[supabase] -> {public_url}")
-    return public_url
+    result = _uploader.upload(local_path, remote_filename, content_type)
+    print(f"[supabase] -> {result.url}")
+    return result
+
+
+def supabase_upload(local_path: str, remote_filename: str) -> str:
+    return supabase_upload_with_stats(local_path, remote_filename).url
 
 
 def wait_for_comfy():
     global _comfy_ready
     if _comfy_ready:
         return
-    start = time.time()
-    last_err = None
-    while time.time() - start < COMFY_READY_TIMEOUT:
-        try:
-            r = requests.get(f"{COMFY_BASE}/system_stats", timeout=3)
-            if r.status_code == 200:
-                _comfy_ready = True
-                return
-        except Exception as e:
-            last_err = e
-        time.sleep(1.0)
-    raise RuntimeError(f"ComfyUI not ready: {last_err}")
+    wait_until_ready(COMFY_BASE, COMFY_READY_TIMEOUT)
+    _comfy_ready = True
 
 
 def comfy_get(path):
@@ -89,9 +114,17 @@ def comfy_get(path):
     return r.json()
 
 
+_default_workflow = (None, None)   # (mtime, parsed workflow)
+
+
 def load_default_workflow():
-    with open(DEFAULT_WORKFLOW_PATH) as f:
-        return json.load(f)
+    """Parse /workflow.json once; re-read only if the file changes."""
+    global _default_workflow
+    mtime = os.path.getmtime(DEFAULT_WORKFLOW_PATH)
+    if _default_workflow[0] != mtime:
+        with open(DEFAULT_WORKFLOW_PATH) as f:
+            _default_workflow = (mtime, json.load(f))
+    return _default_workflow[1]
 
 
 def find_output_dir():
@@ -101,66 +134,84 @@ def find_output_dir():
     return COMFY_OUTPUT_DIRS[0]
 
 
-def fetch_image_from_url(url: str, filename: str = "input_image.png") -> str:
-    resp = requests.get(url, timeout=60)
-    resp.raise_for_status()
-    image_bytes = resp.content
-    ct = resp.headers.get("Content-Type", "")
-    if "jpeg" in ct or "jpg" in ct:
-        filename = filename.replace(".png", ".jpg")
-    elif "webp" in ct:
-        filename = filename.replace(".png", ".webp")
-    upload_resp = requests.post(
-        f"{COMFY_BASE}/upload/image",
-        files={"image": (filename, image_bytes, ct or "image/png")},
-        data={"overwrite": "true"},
-        timeout=60,
-    )
-    upload_resp.raise_for_status()
-    return upload_resp.json().get("name", filename)
+def find_input_dir():
+    return os.environ.get("COMFY_INPUT_DIR") or os.path.join(
+        os.path.dirname(find_output_dir().rstrip("/")), "input")
+
+
+def forget_input(path):
+    """Janitor hook: a deleted input must be uploaded again next time."""
+    input_dir = find_input_dir()
+    if path.startswith(input_dir + os.sep):
+        _ingestor.forget(os.path.relpath(path, input_dir))
+
+
+_ingestor = ImageIngestor(COMFY_BASE)
+_outputs  = OutputResolver(COMFY_BASE)
+JANITOR.on_delete.append(forget_input)
+
+INPUT_URL_KEYS = ("image_url", "source_url", "target_url")
+
+
+def fetch_image_from_url(url: str):
+    """Stream url into ComfyUI's input dir. Returns (name, sha256 of bytes)."""
+    return _ingestor.ingest_url(url)
 
 
 def upload_image_bytes_to_comfy(image_bytes: bytes, filename: str) -> str:
-    resp = requests.post(
-        f"{COMFY_BASE}/upload/image",
-        files={"image": (filename, image_bytes, "image/png")},
-        data={"overwrite": "true"},
-        timeout=60,
-    )
-    resp.raise_for_status()
-    return resp.json().get("name", filename)
+    return _ingestor.upload(io.BytesIO(image_bytes), filename)
 
 
 def upload_images_to_comfy(images):
-    uploaded = []
-    for img in images:
-        name = img["name"]
-        b64 = img["image"]
-        if "," in b64:
-            b64 = b64.split(",", 1)[1]
-        image_bytes = base64.b64decode(b64)
-        resp = requests.post(
-            f"{COMFY_BASE}/upload/image",
-            files={"image": (name, image_bytes, "image/png")},
-            data={"overwrite": "true"},
-            timeout=60,
-        )
-        resp.raise_for_status()
-        uploaded.append(resp.json().get("name", name))
-    return uploaded
+    """
+    Upload base64 payload images in parallel, decoding them in blocks.
+    Returns [(name, sha256 of bytes)]; raises before uploading anything if
+    an image header is malformed.
+    """
+    return _ingestor.ingest_base64(images)
 
 
-def resolve_input_image(payload: dict):
-    for key in ("image_url", "source_url", "target_url"):
-        url = payload.get(key)
-        if url:
-            return fetch_image_from_url(url, f"{key.replace('_url','')}_image.png")
-    images = payload.get("images", [])
-    if images:
-        uploaded = upload_images_to_comfy(images)
-        if uploaded:
-            return uploaded[0]
-    return None
+def resolve_input_image(payload: dict, job_id=None):
+    """
+    Ingest every URL and base64 input in parallel. Returns (uploaded name,
+    content digest) of the primary one (image_url, source_url, target_url,
+    then images[0]), or (None, None) if there is no image, plus
+    {payload name: stored name} for the base64 images. With job_id, the
+    inputs are tracked for the janitor.
+    """
+    urls = [payload[key] for key in INPUT_URL_KEYS if payload.get(key)]
+    images = payload.get("images") or []
+    if not urls and not images:
+        return None, None, {}
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-b64") as pool:
+        pending = pool.submit(upload_images_to_comfy, images) if images else None
+        fetched = _ingestor.ingest_urls(urls)
+        uploaded = pending.result() if pending else []
+    inputs = fetched + uploaded
+    if job_id:
+        input_dir = find_input_dir()
+        for name, _ in inputs:
+            JANITOR.track(job_id, os.path.join(input_dir, name),
+                          reusable=bool(REUSABLE_INPUT.match(os.path.basename(name))))
+    renamed = {img["name"]: name for img, (name, _) in zip(images, uploaded) if img["name"] != name}
+    return (inputs[0] if inputs else (None, None)) + (renamed,)
+
+
+def rename_inputs(graph, renamed):
+    """
+    graph with every LoadImage naming a payload image pointed at its stored
+    name. Other inputs are left alone, even a prompt that happens to equal an
+    image name.
+    """
+    changed = {}
+    for node_id, node in graph.items():
+        if not isinstance(node, dict) or node.get("class_type") != "LoadImage":
+            continue
+        inputs = node.get("inputs", {})
+        image = inputs.get("image")
+        if isinstance(image, str) and image in renamed:
+            changed[node_id] = {**node, "inputs": {**inputs, "image": renamed[image]}}
+    return {**graph, **changed} if changed else graph
 
 
 def submit_prompt(prompt, client_id="runpod"):
@@ -173,50 +224,36 @@ def submit_prompt(prompt, client_id="runpod"):
     return r.json()
 
 
-def wait_for_history(prompt_id, poll_interval=2.0, timeout=14400):
-    start = time.time()
-    while time.time() - start < timeout:
-        try:
-            r = requests.get(f"{COMFY_BASE}/history/{prompt_id}", timeout=30)
-            r.raise_for_status()
-            data = r.json()
-            if prompt_id in data:
-                return data[prompt_id]
-        except requests.exceptions.ConnectionError:
-            print("[wait_for_history] Connection dropped, retrying...")
-            time.sleep(5)
-            continue
-        time.sleep(poll_interval)
-    raise RuntimeError(f"Prompt {prompt_id} did not finish within {timeout}s")
+def cancel_prompts(prompt_ids):
+    """Remove still-pending prompts from ComfyUI's queue (running ones finish)."""
+    if not prompt_ids:
+        return
+    try:
+        requests.post(f"{COMFY_BASE}/queue", json={"delete": list(prompt_ids)}, timeout=10)
+        print(f"[handler] Removed {len(prompt_ids)} queued prompt(s) from ComfyUI")
+    except requests.RequestException as e:
+        print(f"[handler] WARNING: could not clear queued prompts: {e}")
 
 
-def get_largest_output_file(history):
-    output_dir = find_output_dir()
-    files = []
-    for _, node_output in history.get("outputs", {}).items():
-        for key in ("images", "videos", "gifs", "files"):
-            for item in node_output.get(key, []):
-                if item.get("type") == "temp":
-                    continue
-                fname     = item.get("filename", "")
-                subfolder = item.get("subfolder", "")
-                fpath = (
-                    os.path.join(output_dir, subfolder, fname)
-                    if subfolder else
-                    os.path.join(output_dir, fname)
-                )
-                if os.path.isfile(fpath):
-                    size = os.path.getsize(fpath)
-                    files.append({"filename": fname, "filepath": fpath, "size": size})
-                    print(f"[output] {fname} ({size/1024/1024:.1f} MB)")
-
-    if not files:
-        return None
+def wait_for_history(prompt_id, timeout=14400, events=None):
+    """
+    Block until prompt_id finishes and return its history entry.
+
+    events is the job's ComfyEventStream, opened before the prompt was
+    queued; ComfyEventStream falls back to /history polling by itself if the
+    socket can't be opened. Without one /history is polled, since a socket
+    opened now could already have missed the prompt's events.
+    """
+    if events is None:
+        return ComfyEventStream(COMFY_HOST, COMFY_PORT, "runpod").poll_history(prompt_id, timeout)
+    return events.wait(prompt_id, timeout=timeout)
 
-    files.sort(key=lambda x: x["size"], reverse=True)
-    chosen = files[0]
-    print(f"[output] Using largest: {chosen['filename']} ({chosen['size']/1024/1024:.1f} MB)")
-    return chosen["filepath"]
+
+def run_prompt(prompt, client_id="runpod", timeout=14400):
+    """Queue prompt and return its history entry, listening from before it is queued."""
+    with ComfyEventStream(COMFY_HOST, COMFY_PORT, client_id) as events:
+        prompt_id = submit_prompt(prompt, client_id=client_id)["prompt_id"]
+        return wait_for_history(prompt_id, timeout=timeout, events=events)
 
 
 def workflow_has_output_node(workflow):
@@ -226,20 +263,98 @@ def workflow_has_output_node(workflow):
     )
 
 
-def extract_last_frame(video_path: str, output_path: str):
-    # -sseof -1 seeks to ~1s before EOF (small margin, safely before the end).
-    # -update 1 tells the image2 muxer to keep overwriting output_path with
-    # each decoded frame instead of grabbing just the first one after the
-    # seek (which is what "-vframes 1" alone was doing — that was the bug,
-    # since the first frame after a seek is NOT guaranteed to be the last
-    # frame in the file). Letting it decode to true EOF means the final
-    # write is always the actual last frame, regardless of seek imprecision.
-    cmd = ["ffmpeg", "-y", "-sseof", "-1", "-i", video_path,
-           "-update", "1", "-q:v", "1", output_path]
+def last_frame_timestamp(video_path: str) -> float:
+    """
+    Time of the final video frame relative to the stream's start_time, which
+    is what input-side -ss seeks by. Read from the container's packet index
+    (demux only, nothing is decoded).
+    """
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=start_time:packet=pts_time", "-of", "compact",
+           video_path]
     result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
-        raise RuntimeError(f"FFmpeg frame extract failed: {result.stderr}")
-    return output_path
+        raise RuntimeError(f"FFprobe packet scan failed: {result.stderr}")
+    times, start = [], 0.0
+    for line in result.stdout.split():
+        section, _, value = line.partition("|")
+        try:
+            value = float(value.partition("=")[2])
+        except ValueError:
+            continue
+        if section == "packet":
+            times.append(value)
+        elif section == "stream":
+            start = value
+    if not times:
+        raise RuntimeError(f"FFprobe found no video packets in {video_path}")
+    # max(), not the last line: with B-frames decode order != display order.
+    return max(times) - start
+
+
+def last_frame_png_bytes(video_path: str, tmp_dir=None) -> bytes:
+    """
+    Encode the exact last frame of video_path as PNG and return the bytes.
+
+    Input-side -ss seeks to the keyframe before the last frame and decodes
+    forward only as far as that timestamp, and the PNG is read straight from
+    ffmpeg's stdout, so nothing is written to disk.
+    """
+    ts = last_frame_timestamp(video_path)
+    cmd = ["ffmpeg", "-v", "error", "-ss", f"{ts:.6f}", "-i", video_path,
+           "-frames:v", "1", "-f", "image2pipe", "-c:v", "png", "pipe:1"]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        # Seeking can overshoot on files with broken timestamps; fall back to
+        # decoding the final second and keeping the last frame written.
+        print(f"[handoff] Seek to {ts:.3f}s in {os.path.basename(video_path)} found no frame; "
+              f"decoding the final second instead")
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+            out = os.path.join(tmp, "last.png")
+            cmd = ["ffmpeg", "-y", "-v", "error", "-sseof", "-1", "-i", video_path,
+                   "-update", "1", out]
+            fallback = subprocess.run(cmd, capture_output=True, text=True)
+            if fallback.returncode != 0 or not os.path.isfile(out):
+                raise RuntimeError(f"FFmpeg frame extract failed: {fallback.stderr}")
+            with open(out, "rb") as f:
+                return f.read()
+    return result.stdout
+
+
+def history_last_frame_ref(history, node_id, key="images"):
+    """
+    If node_id saved images in this batch (e.g. an ImageFromBatch -> SaveImage
+    branch), return a LoadImage reference to the last one. ComfyUI resolves
+    "name [output]" itself, so no bytes are decoded or transferred. With
+    key="latents" the same works for a SaveLatent node and LoadLatent.
+    """
+    node_output = history.get("outputs", {}).get(str(node_id)) or {}
+    images = node_output.get(key) or []
+    if not images:
+        return None
+    item = images[-1]
+    name = item.get("filename")
+    if not name:
+        return None
+    if item.get("subfolder"):
+        name = f"{item['subfolder']}/{name}"
+    return f"{name} [{item.get('type', 'output')}]"
+
+
+def handoff_last_frame(history, chunk_path, upload_name, last_frame_node=None, tmp_dir=None):
+    """
+    Make the final frame of a finished batch available as the next batch's
+    LoadImage input. Returns (image_name, seconds_taken, method).
+    """
+    start = time.time()
+    if last_frame_node is not None:
+        ref = history_last_frame_ref(history, last_frame_node)
+        if ref:
+            return ref, time.time() - start, "history"
+        print(f"[handoff] Node {last_frame_node} produced no image; decoding video instead")
+    png = last_frame_png_bytes(chunk_path, tmp_dir)
+    name = upload_image_bytes_to_comfy(png, upload_name)
+    return name, time.time() - start, "ffmpeg"
 
 
 # ===========================================================================
@@ -257,9 +372,21 @@ def extract_last_frame(video_path: str, output_path: str):
 #     e.g. "lora_strengths": {"HIGH Lora 5": 0.6, "2007": 0.4}
 #     Titles are matched case-insensitively. Per-node overrides take
 #     priority over the global "lora_strength" value if both are given.
+#
+# payload["loras"]:
+#     dict keyed by node title OR node id -> registry alias, swapping which
+#     LoRA file the node loads (see lora_registry.py)
+#     e.g. "loras": {"HIGH Lora 4": "soft-light",
+#                    "2005": {"alias": "soft-light", "strength": 0.6},
+#                    "2008": null}            # null bypasses the node
+#     A strength given here wins over both strength overrides above.
 # ===========================================================================
 
-def apply_lora_strengths(wf, global_strength=None, per_lora=None):
+def resolve_lora_strengths(wf, global_strength=None, per_lora=None):
+    """
+    Work out which LoraLoaderModelOnly nodes an override applies to, without
+    touching wf. Returns [(node_id, title, old_strength, new_strength)].
+    """
     per_lora = per_lora or {}
     # normalize per_lora keys for case-insensitive title matching
     per_lora_titles = {k.lower(): v for k, v in per_lora.items() if not k.isdigit()}
@@ -281,104 +408,76 @@ def apply_lora_strengths(wf, global_strength=None, per_lora=None):
             new_strength = global_strength
 
         if new_strength is not None:
-            node["inputs"]["strength_model"] = float(new_strength)
-            applied.append((node_id, title, old_strength, new_strength))
+            applied.append((node_id, title, old_strength, float(new_strength)))
 
     if applied:
         print(f"[lora_strength] Applied {len(applied)} override(s):")
         for node_id, title, old, new in applied:
             print(f"  - node {node_id} ({title}): {old} -> {new}")
 
+    return applied
+
+
+def apply_lora_strengths(wf, global_strength=None, per_lora=None):
+    for node_id, _, _, new in resolve_lora_strengths(wf, global_strength, per_lora):
+        wf[node_id]["inputs"]["strength_model"] = new
     return wf
 
 
 def build_batch_workflow(base_workflow, scene_prompts, negative_text,
                          frames_per_scene, sampling_steps,
                          uploaded_filename, fps, batch_start_idx,
-                         lora_strength=None, lora_strengths=None):
+                         lora_strength=None, lora_strengths=None,
+                         mapping=None, output_prefix="batch", lora_overrides=None,
+                         prev_latent=None, save_latent=False):
     """
+    Build one batch graph from a compiled template (or a raw workflow, which
+    is compiled and cached on first use). Which nodes get patched comes from
+    the declarative mapping in workflow_template; the default one wires the
+    Wan SVI Pro scenes together:
+
     ImageBatchExtendWithOverlap output slots:
       slot 0 = source images only
       slot 1 = new images only
       slot 2 = COMBINED extended images  <-- this is what VHS must use
-    """
-    wf = copy.deepcopy(base_workflow)
-    n  = len(scene_prompts)
 
-    # LoRA strength override, applied first so it's carried through the
-    # rest of this batch's graph unchanged.
-    if lora_strength is not None or lora_strengths:
-        apply_lora_strengths(wf, global_strength=lora_strength, per_lora=lora_strengths)
-
-    # Patch LoadImage
-    if uploaded_filename:
-        for nid, node in wf.items():
-            if isinstance(node, dict) and node.get("class_type") == "LoadImage":
-                node["inputs"]["image"] = uploaded_filename
-
-    # Patch BasicScheduler steps
-    if sampling_steps:
-        for nid, node in wf.items():
-            if isinstance(node, dict) and node.get("class_type") == "BasicScheduler":
-                node["inputs"]["steps"] = int(sampling_steps)
-
-    # Vary seeds per batch
-    if "189" in wf: wf["189"]["inputs"]["noise_seed"] = 43 + batch_start_idx
-    if "182" in wf: wf["182"]["inputs"]["noise_seed"] = 44 + batch_start_idx
-    if "199" in wf: wf["199"]["inputs"]["noise_seed"] = 45 + batch_start_idx
-
-    # Always configure Scene 1 (193:xxx)
-    wf["193:211"]["inputs"]["text"] = scene_prompts[0]
-    wf["193:209"]["inputs"]["text"] = negative_text
-    wf["193:215"]["inputs"]["length"] = frames_per_scene
-    wf["193:215"]["inputs"]["motion_latent_count"] = 0
-
-    if n == 1:
-        wf["204"]["inputs"]["images"] = ["193:217", 0]
-        wf["204"]["inputs"]["frame_rate"] = fps
-        to_remove = [k for k in wf if k.startswith("181:") or k.startswith("203:")]
-        for k in to_remove:
-            del wf[k]
-
-    elif n == 2:
-        wf["181:152"]["inputs"]["text"] = scene_prompts[1]
-        wf["181:206"]["inputs"]["text"] = negative_text
-        wf["181:160"]["inputs"]["length"] = frames_per_scene
-        wf["181:160"]["inputs"]["motion_latent_count"] = 1
-        wf["181:160"]["inputs"]["prev_samples"]  = ["193:216", 0]
-        wf["181:168"]["inputs"]["source_images"] = ["193:217", 0]
-        wf["181:168"]["inputs"]["new_images"]    = ["181:162", 0]
-        wf["204"]["inputs"]["images"] = ["181:168", 2]
-        wf["204"]["inputs"]["frame_rate"] = fps
-        to_remove = [k for k in wf if k.startswith("203:")]
-        for k in to_remove:
-            del wf[k]
-
-    else:
-        wf["181:152"]["inputs"]["text"] = scene_prompts[1]
-        wf["181:206"]["inputs"]["text"] = negative_text
-        wf["181:160"]["inputs"]["length"] = frames_per_scene
-        wf["181:160"]["inputs"]["motion_latent_count"] = 1
-        wf["181:160"]["inputs"]["prev_samples"]  = ["193:216", 0]
-        wf["181:168"]["inputs"]["source_images"] = ["193:217", 0]
-        wf["181:168"]["inputs"]["new_images"]    = ["181:162", 0]
-
-        wf["203:222"]["inputs"]["text"] = scene_prompts[2]
-        wf["203:220"]["inputs"]["text"] = negative_text
-        wf["203:219"]["inputs"]["length"] = frames_per_scene
-        wf["203:219"]["inputs"]["motion_latent_count"] = 1
-        wf["203:219"]["inputs"]["prev_samples"]  = ["181:208", 0]
-        wf["203:227"]["inputs"]["source_images"] = ["181:168", 2]
-        wf["203:227"]["inputs"]["new_images"]    = ["203:218", 0]
-        wf["204"]["inputs"]["images"] = ["203:227", 2]
-        wf["204"]["inputs"]["frame_rate"] = fps
-
-    wf["204"]["inputs"]["filename_prefix"] = f"batch_{batch_start_idx:02d}"
-    return wf
+    prev_latent (a LoadLatent reference) continues the first scene from the
+    previous batch's latents; save_latent saves this batch's for the next.
 
+    The returned graph shares unpatched nodes with the template, so it must
+    not be mutated in place.
+    """
+    template = (base_workflow if isinstance(base_workflow, WorkflowTemplate)
+                else compile_template(base_workflow))
+    plan = template.plan(len(scene_prompts), mapping)
 
-def ffmpeg_concat(video_paths: list, output_path: str):
-    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+    # LoRA strength override, carried through the rest of this batch's graph.
+    overrides = {}
+    if lora_strength is not None or lora_strengths:
+        for node_id, _, _, new in resolve_lora_strengths(
+            template.graph, global_strength=lora_strength, per_lora=lora_strengths
+        ):
+            overrides[node_id] = {"strength_model": new}
+    # LoRA swaps from the registry ({node_id: {input: value}}), applied last.
+    for node_id, inputs in (lora_overrides or {}).items():
+        overrides.setdefault(node_id, {}).update(inputs)
+
+    return plan.build({
+        "image":       uploaded_filename or None,
+        "steps":       int(sampling_steps) if sampling_steps else None,
+        "seed_offset": batch_start_idx,
+        "prompts":     scene_prompts,
+        "negative":    negative_text,
+        "frames":      frames_per_scene,
+        "fps":         fps,
+        "prefix":      f"{output_prefix}_{batch_start_idx:02d}",
+        "prev_latent": prev_latent,
+        "latent_prefix": f"latents/{output_prefix}_{batch_start_idx:02d}" if save_latent else None,
+    }, overrides)
+
+
+def ffmpeg_concat(video_paths: list, output_path: str, tmp_dir=None):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, dir=tmp_dir) as f:
         for vp in video_paths:
             f.write(f"file '{os.path.abspath(vp)}'\n")
         list_file = f.name
@@ -391,7 +490,161 @@ def ffmpeg_concat(video_paths: list, output_path: str):
     return output_path
 
 
-def handler(job):
+def append_to_final(assembler, stream, index, chunk_path):
+    """
+    Append one chunk to the growing final video and stream whatever is ready.
+    Returns False (instead of raising) when incremental assembly had to be
+    abandoned, so the caller can fall back to ffmpeg_concat.
+    """
+    try:
+        assembler.append(index, chunk_path)
+    except Exception as e:
+        print(f"[handler] WARNING: incremental assembly failed, will concat instead: {e}")
+        return False
+    try:
+        stream.push(assembler.output_path)
+    except Exception as e:
+        # The finish() call re-sends from the acknowledged offset.
+        print(f"[handler] WARNING: streaming final upload stalled: {e}")
+    return True
+
+
+def concat_final(timings, stream, chunk_paths, final_local, tmp_dir=None):
+    """
+    Fallback when incremental assembly was abandoned: cancel the partly
+    streamed final upload, then stitch the chunks with ffmpeg.
+    """
+    if stream is not None:
+        stream.abort()
+    print(f"[handler] Stitching {len(chunk_paths)} chunks...")
+    with timings.span("ffmpeg_concat", chunks=len(chunk_paths)):
+        ffmpeg_concat(chunk_paths, final_local, tmp_dir=tmp_dir)
+
+
+def file_tag(job_id):
+    """
+    Filename-safe, unique stand-in for job_id. Long ids keep a hash of the
+    full id instead of being cut, so two jobs never share a tag.
+    """
+    tag = re.sub(r"[^A-Za-z0-9_-]", "_", job_id)
+    if tag == job_id and len(tag) <= 48:
+        return tag
+    return f"{tag[:39]}_{hashlib.sha256(job_id.encode()).hexdigest()[:8]}"
+
+
+def comfy_system_stats():
+    """/system_stats, or None if ComfyUI can't be asked."""
+    try:
+        return comfy_get("/system_stats")
+    except (requests.RequestException, ValueError) as e:
+        print(f"[handler] WARNING: /system_stats failed: {e}")
+        return None
+
+
+def batch_cache_keys(batch_workflow, batches, image_digest, has_image,
+                     independent=False, latent_handoff=False):
+    """
+    Result-cache key of every batch. batch_workflow(scene_idx, prompts,
+    image, latent=None, save_latent=False) builds a batch graph; it gets
+    placeholders instead of real input names, so keys don't depend on what
+    an upload happened to be called.
+    """
+    keys     = []
+    source   = image_digest or "no-input-image"
+    upstream = source
+    for i, (scene_idx, batch_prompts) in enumerate(batches):
+        if independent:
+            key_wf = batch_workflow(scene_idx, batch_prompts,
+                                    IMAGE_PLACEHOLDER if has_image else None)
+            keys.append(ResultCache.batch_key(key_wf, source))
+            continue
+        # Later batches always load the previous batch's last frame, or its
+        # latents (and keep the source image as anchor).
+        key_wf = batch_workflow(scene_idx, batch_prompts,
+                                IMAGE_PLACEHOLDER if has_image or (i and not latent_handoff)
+                                else None,
+                                latent=LATENT_PLACEHOLDER if latent_handoff and i else None,
+                                save_latent=latent_handoff and i < len(batches) - 1)
+        upstream = ResultCache.batch_key(key_wf, upstream)
+        keys.append(upstream)
+    return keys
+
+
+def plan_batches(num_scenes, prompts, scenes_per_batch):
+    """[(scene_idx, batch_prompts)] for every batch of the job, in order."""
+    batches = []
+    scene_idx = 0
+    while scene_idx < num_scenes:
+        batch_size = min(scenes_per_batch, num_scenes - scene_idx)
+        batches.append((scene_idx, [
+            prompts[min(scene_idx + i, len(prompts) - 1)]
+            for i in range(batch_size)
+        ]))
+        scene_idx += batch_size
+    return batches
+
+
+def upload_chunk(timings, local_path, remote_filename):
+    """Pipeline task: upload a file and record its throughput."""
+    result = supabase_upload_with_stats(local_path, remote_filename)
+    timings.transfer("supabase_upload", result.size, result.seconds,
+                     file=remote_filename, mode=result.mode)
+    return result.url
+
+
+def finish_final_stream(timings, stream, local_path):
+    """Pipeline task: send the rest of the incrementally built final video."""
+    result = stream.finish(local_path)
+    timings.transfer("supabase_upload", result.size, result.seconds,
+                     file=os.path.basename(local_path), mode=result.mode)
+    return result.url
+
+
+def cache_batch_result(cache, key, chunk_path, chunk_url):
+    """Background task: remember a batch once its upload has finished."""
+    cache.put_batch(key, chunk_path, chunk_url)
+
+
+def journal_batch(journal, batch_num, scene_idx, next_scene_idx, chunk_path, chunk_url):
+    """Background task: checkpoint a batch once its chunk is safely uploaded."""
+    journal.record_batch(batch_num, scene_idx, next_scene_idx, chunk_url, chunk_path)
+
+
+def comfy_has_image(ref):
+    """True if ComfyUI can still serve an image reference like 'x.png [output]'."""
+    name, kind = ref, "input"
+    if ref.endswith("]") and " [" in ref:
+        name, kind = ref[:-1].rsplit(" [", 1)
+    subfolder, _, filename = name.rpartition("/")
+    try:
+        r = requests.get(f"{COMFY_BASE}/view", stream=True, timeout=10,
+                         params={"filename": filename, "subfolder": subfolder, "type": kind})
+        r.close()
+        return r.status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def restore_chunk(entry, local_path):
+    """
+    Local copy of a journaled chunk: the original file if this worker still
+    has it, otherwise a fresh download of the uploaded chunk.
+    """
+    path = entry.get("chunk_path")
+    if path and os.path.isfile(path):
+        return path
+    with requests.get(entry["chunk_url"], stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(local_path, "wb") as f:
+            for block in r.iter_content(1024 * 1024):
+                f.write(block)
+    return local_path
+
+
+_result_cache = ResultCache()
+
+
+def handler(job, progress=None):
     payload = job.get("input") or {}
     action  = payload.get("action")
 
@@ -401,7 +654,27 @@ def handler(job):
         wait_for_comfy()
         return comfy_get("/system_stats")
 
-    wait_for_comfy()
+    timings = JobTimings(job.get("id", f"job_{int(time.time())}"))
+    try:
+        result = run_job(payload, timings, progress)
+    except Exception:
+        JANITOR.release(timings.job_id, uploaded=False)
+        timings.finish("error")
+        raise
+    # Everything is uploaded; the job's files in ComfyUI's dirs can go.
+    with timings.span("janitor"):
+        JANITOR.release(timings.job_id, uploaded=True)
+    result["timings"] = timings.finish()
+    return result
+
+
+def run_job(payload, timings, progress=None):
+    """
+    Render and upload one job. progress, if given, is called from worker
+    threads with a dict for each chunk as soon as its upload has finished.
+    """
+    with timings.span("comfy_ready"):
+        wait_for_comfy()
 
     base_workflow = payload.get("workflow") or payload.get("prompt")
     if base_workflow:
@@ -413,7 +686,35 @@ def handler(job):
     if not workflow_has_output_node(base_workflow):
         raise RuntimeError("Workflow has no output node.")
 
-    uploaded_filename = resolve_input_image(payload)
+    # Names another job's journal on the shared volume; checked up front.
+    resume_from = payload.get("resume_from")
+    if resume_from:
+        check_resume_from(resume_from)
+
+    # Indexed once per workflow content; batches are built from patch plans.
+    workflow_mapping = payload.get("workflow_mapping")
+    if isinstance(workflow_mapping, str):
+        workflow_mapping = json.loads(workflow_mapping)
+    with timings.span("workflow_compile"):
+        template = compile_template(base_workflow)
+
+    # LoRA swaps by alias; unknown aliases fail here, before any GPU time.
+    job_loras = payload.get("loras")
+    if isinstance(job_loras, str):
+        job_loras = json.loads(job_loras)
+    lora_overrides = {}
+    if job_loras:
+        with timings.span("lora_resolve", slots=len(job_loras)):
+            lora_overrides = LORA_REGISTRY.overrides(template, job_loras)
+
+    with timings.span("input_fetch"):
+        uploaded_filename, image_digest, renamed = resolve_input_image(payload, timings.job_id)
+    if renamed:
+        # Base64 images are stored under content names, so concurrent jobs
+        # sending the same file name never overwrite each other's input.
+        graph = rename_inputs(template.graph, renamed)
+        if graph is not template.graph:
+            template = compile_template(graph)
 
     raw_prompts = payload.get("prompts")
     prompt_text = payload.get("prompt_text") or payload.get("prompt")
@@ -434,10 +735,35 @@ def handler(job):
     lora_strength  = payload.get("lora_strength")     # float, applies to all loras
     lora_strengths = payload.get("lora_strengths")     # dict, per-lora override
 
-    job_id      = job.get("id", f"job_{int(time.time())}")
+    # Optional node id whose saved image is the batch's last frame; lets the
+    # handoff skip decoding the video entirely.
+    last_frame_node = payload.get("last_frame_node")
+
+    # The node whose saved video is the batch chunk; other outputs are ignored.
+    output_nodes = output_node_ids(template, workflow_mapping or DEFAULT_MAPPING,
+                                   payload.get("output_node"))
+
+    # Segment chunks into an HLS playlist as they finish, for live playback.
+    use_hls = bool(payload.get("hls", HLS_ENABLED))
+
+    # Independent scenes (variations, storyboards) all start from the source
+    # image, so every scene is its own graph and all of them are queued at
+    # once instead of waiting on each other's last frame.
+    independent = bool(payload.get("independent_scenes", False))
+
+    # Chained batches continue from the previous batch's last frame or, with
+    # "handoff": "latent", from its saved sampler latents.
+    handoff_mode = str(payload.get("handoff") or HANDOFF_MODE).lower()
+    if handoff_mode not in HANDOFF_MODES:
+        raise ValueError(f"Unknown handoff mode {handoff_mode!r}; "
+                         f"expected one of {', '.join(HANDOFF_MODES)}")
+
+    job_id      = timings.job_id
+    # Prefix for every file this job creates in ComfyUI's input/output dirs,
+    # so concurrent jobs never overwrite each other's batches or frames.
+    job_tag     = file_tag(job_id)
     output_dir  = find_output_dir()
-    chunk_urls  = []
-    chunk_paths = []
+    handoff_timings = []
 
     total_frames  = frames_per_scene * num_scenes
     expected_secs = total_frames / fps
@@ -448,80 +774,447 @@ def handler(job):
     if lora_strengths:
         print(f"[handler] Per-lora strength overrides: {lora_strengths}")
 
-    scene_idx = 0
-    batch_num = 0
-
-    while scene_idx < num_scenes:
-        batch_num  += 1
-        batch_size  = min(SCENES_PER_BATCH, num_scenes - scene_idx)
-        batch_prompts = [
-            prompts[min(scene_idx + i, len(prompts) - 1)]
-            for i in range(batch_size)
-        ]
-
-        print(f"[handler] Batch {batch_num}: scenes {scene_idx+1}-{scene_idx+batch_size} "
-              f"({batch_size} scene(s) chained)")
-
-        wf = build_batch_workflow(
-            base_workflow,
+    def batch_workflow(scene_idx, batch_prompts, image, prefix="batch", latent=None,
+                       save_latent=False):
+        return build_batch_workflow(
+            template,
             scene_prompts=batch_prompts,
             negative_text=negative_text,
             frames_per_scene=frames_per_scene,
             sampling_steps=sampling_steps,
-            uploaded_filename=uploaded_filename,
+            uploaded_filename=image,
             fps=fps,
             batch_start_idx=scene_idx,
             lora_strength=lora_strength,
             lora_strengths=lora_strengths,
+            mapping=workflow_mapping,
+            output_prefix=prefix,
+            lora_overrides=lora_overrides,
+            prev_latent=latent,
+            save_latent=save_latent,
         )
 
-        result    = submit_prompt(wf, f"runpod_b{batch_num}")
-        prompt_id = result.get("prompt_id")
+    # Chained scenes: as many per prompt as fit on the GPU (see batch_sizing).
+    scenes_per_batch = 1
+    if not independent:
+        requested = payload.get("scenes_per_batch")
+        if requested is None and journal_enabled():
+            # A resumed job keeps its batching, or its journal wouldn't match.
+            requested = JobJournal.scenes_per_batch(resume_from or job_id)
+        with timings.span("batch_sizing") as attrs:
+            scenes_per_batch, reason = choose_scenes_per_batch(
+                frames_per_scene, workflow_resolution(template.graph), comfy_system_stats,
+                requested)
+            capacity = scene_capacity(workflow_mapping)
+            if capacity is not None and scenes_per_batch > capacity:
+                scenes_per_batch, reason = capacity, f"mapping chains at most {capacity}"
+            attrs["scenes_per_batch"] = scenes_per_batch
+        print(f"[handler] {scenes_per_batch} scene(s) per batch ({reason})")
+    batches = plan_batches(num_scenes, prompts, scenes_per_batch)
+
+    latent_handoff = handoff_mode == "latent" and not independent and len(batches) > 1
+    if latent_handoff and not supports_latent_handoff(workflow_mapping):
+        print("[handler] WARNING: workflow mapping can't continue a batch from latents; "
+              "handing off last frames instead")
+        latent_handoff = False
+    if latent_handoff:
+        print(f"[handler] Latent handoff between {len(batches)} batches")
+
+    # Cache keys for every batch and for the whole job, computed before any
+    # GPU work: batch N's input is a pure function of batch N-1 (or, for
+    # independent scenes, of the source image). The job key also identifies
+    # the job's inputs for the resume journal.
+    use_cache  = _result_cache.enabled and payload.get("cache", True)
+    key_start  = time.perf_counter()
+    batch_keys = batch_cache_keys(batch_workflow, batches, image_digest,
+                                  has_image=bool(uploaded_filename), independent=independent,
+                                  latent_handoff=latent_handoff)
+    job_key = ResultCache.job_key(batch_keys)
+    timings.add("cache_keys", time.perf_counter() - key_start, key_start, batches=len(batches))
+
+    # Models this job needs (after LoRA swaps) that aren't on local disk yet
+    # are copied in the background; ComfyUI reads them from the volume meanwhile.
+    if MODEL_CACHE.enabled:
+        with timings.span("model_cache") as attrs:
+            attrs["hits"], attrs["misses"] = MODEL_CACHE.record_use(batch_workflow(*batches[0], None))
+        METRICS.count("model_cache_hits", attrs["hits"])
+        METRICS.count("model_cache_misses", attrs["misses"])
+    if use_cache:
+        cached_job = _result_cache.get_job(job_key)
+        if cached_job:
+            print(f"[handler] Job result cache hit ({job_key[:12]}), skipping generation")
+            return {
+                "status":                    "success",
+                "final_video_url":           cached_job["final_video_url"],
+                "chunk_urls":                cached_job["chunk_urls"],
+                "cached":                    True,
+                "total_scenes":              num_scenes,
+                "total_frames":              total_frames,
+                "expected_duration_seconds": round(expected_secs),
+                "expected_duration_minutes": round(expected_secs / 60, 1),
+            }
+
+    # Progress journal: a re-delivered job (same id) or one submitted with
+    # "resume_from" picks up after the last batch whose chunk was uploaded.
+    journal = None
+    resumed = {}
+    if journal_enabled():
+        prune_journals()
+        journal = JobJournal.load(job_id, job_key, resume_from=resume_from)
+        journal.state["scenes_per_batch"] = scenes_per_batch
+        if journal.state["final_video_url"]:
+            print(f"[handler] Journal: job already finished -> {journal.state['final_video_url']}")
+            done = journal.completed()
+            return {
+                "status":                    "success",
+                "final_video_url":           journal.state["final_video_url"],
+                "chunk_urls":                [entry["chunk_url"] for _, entry in done],
+                "resumed_batches":           len(done),
+                "total_scenes":              num_scenes,
+                "total_frames":              total_frames,
+                "expected_duration_seconds": round(expected_secs),
+                "expected_duration_minutes": round(expected_secs / 60, 1),
+            }
+        # Independent batches don't depend on each other, so any finished
+        # one can be reused; chained ones only as an unbroken prefix.
+        resumed = journal.recorded() if independent else dict(journal.completed())
+        if resumed:
+            print(f"[handler] Journal: resuming after batch {max(resumed)} "
+                  f"(scene {journal.state['scene_idx'] + 1} of {num_scenes})")
+
+    # One websocket per job, opened before the first prompt is queued so no
+    # completion event can be missed.
+    client_id = f"runpod_{uuid.uuid4().hex}"
+    events    = ComfyEventStream(COMFY_HOST, COMFY_PORT, client_id,
+                                 on_event=timings.comfy_event)
+    events.connect()
+    job_tmp   = tempfile.mkdtemp(prefix=f"{job_tag}_")
+    if not os.path.isdir(output_dir):
+        # ComfyUI runs elsewhere; chunks are streamed from /view into job_tmp.
+        output_dir = job_tmp
+    input_dir = find_input_dir()
+    # Chunks (and VHS's PNG next to each) and last-frame handoff images.
+    JANITOR.track_matching(job_id, output_dir, job_output_files(job_tag))
+    JANITOR.track_matching(job_id, input_dir, job_input_files(job_tag))
+
+    # Uploads run in the background; only the last-frame handoff blocks the
+    # next batch.
+    pipeline = JobPipeline(job_id)
+
+    # Multi-batch jobs build the final video as chunks arrive, so it is
+    # complete (and mostly uploaded) when the last batch lands.
+    final_filename = f"{job_id}_final.mp4"
+    final_local    = os.path.join(output_dir, final_filename)
+    JANITOR.track(job_id, final_local)
+    incremental    = len(batches) > 1
+    if incremental:
+        assembler    = FragmentedAssembler(final_local)
+        final_stream = _uploader.open_stream(final_filename)
+    final_appends = []
+    hls = None
+    if use_hls:
+        hls = HlsPackager(_uploader, job_id, len(batches), job_tmp, timings=timings,
+                          max_chunk_seconds=max(len(p) for _, p in batches) * frames_per_scene / fps)
+        print(f"[handler] HLS playlist -> {hls.playlist_url}")
+    cached_batches = 0
+    resumed_batches = 0
+
+    # Filled by batch position; independent batches may finish in any order.
+    chunk_uploads = [None] * len(batches)   # futures resolving to chunk URLs
+    chunk_paths   = [None] * len(batches)
+    next_append = 0
+    batch_clock = {}    # batch_num -> {"queued", "render_seconds", "upload_start"}
+    chunks_done = []
+    chunks_reported = []    # one Event per chunk, set once its update went out
+    progress_lock = threading.Lock()
+
+    def lookup_batch(batch_num, chunk_filename, allow_resume=True):
+        """A finished copy of this batch from the result cache or the journal."""
+        nonlocal cached_batches, resumed_batches
+        cached = None
+        if use_cache:
+            with timings.span("cache_lookup", batch=batch_num):
+                cached = _result_cache.get_batch(batch_keys[batch_num - 1])
+        if cached and batch_num not in resumed:
+            print(f"[handler] Batch {batch_num}: cache hit -> {cached['url']}")
+            cached_batches += 1
+        elif not cached and batch_num in resumed and allow_resume:
+            entry = resumed[batch_num]
+            try:
+                with timings.span("restore_chunk", batch=batch_num):
+                    cached = {
+                        "url":  entry["chunk_url"],
+                        "path": restore_chunk(entry, os.path.join(output_dir, chunk_filename)),
+                    }
+                JANITOR.track(job_id, cached["path"])
+                resumed_batches += 1
+                print(f"[handler] Batch {batch_num}: resumed from journal -> {entry['chunk_url']}")
+            except Exception as e:
+                print(f"[handler] WARNING: could not restore batch {batch_num} chunk: {e}")
+        return cached
+
+    def start_upload(batch_num, chunk_path, chunk_filename):
+        batch_clock.setdefault(batch_num, {})["upload_start"] = time.perf_counter()
+        upload = pipeline.submit(
+            f"batch {batch_num} upload",
+            timings.timed("upload", upload_chunk, batch=batch_num),
+            timings, chunk_path, chunk_filename,
+        )
+        if use_cache:
+            pipeline.submit_after(f"batch {batch_num} cache", upload, cache_batch_result,
+                                  _result_cache, batch_keys[batch_num - 1], chunk_path)
+        print(f"[handler] Batch {batch_num} done -> uploading {chunk_filename} in background")
+        return upload
+
+    def report_chunk(batch_num, upload, reported):
+        """Done-callback of a chunk upload: tell the caller about the chunk."""
+        try:
+            if not upload.cancelled() and upload.exception() is None:
+                send_chunk_update(batch_num, upload)
+        finally:
+            reported.set()
+
+    def send_chunk_update(batch_num, upload):
+        clock = batch_clock.get(batch_num, {})
+        with progress_lock:
+            chunks_done.append(batch_num)
+            done = len(chunks_done)
+        timing = {"render_seconds": round(clock.get("render_seconds", 0.0), 3)}
+        if "upload_start" in clock:
+            timing["upload_seconds"] = round(time.perf_counter() - clock["upload_start"], 3)
+        progress({
+            "type":      "chunk",
+            "batch":     batch_num,
+            "batches":   len(batches),
+            "chunk_url": upload.result(),
+            "source":    "rendered" if "queued" in clock else
+                         "journal" if batch_num in resumed else "cache",
+            # The final stitch is the last step, so chunks stop short of 100.
+            "progress":  round(100.0 * done / (len(batches) + (1 if incremental else 0)), 1),
+            "timing":    timing,
+            **({"hls_playlist_url": hls.playlist_url} if hls else {}),
+        })
+
+    def batch_ready(batch_num, scene_idx, next_scene_idx, chunk_path, upload):
+        nonlocal next_append
+        chunk_paths[batch_num - 1]   = chunk_path
+        chunk_uploads[batch_num - 1] = upload
+        if hls:
+            hls.add(batch_num - 1, chunk_path)
+        if progress:
+            reported = threading.Event()
+            chunks_reported.append(reported)
+            upload.add_done_callback(lambda f, n=batch_num, e=reported: report_chunk(n, f, e))
+        if journal and batch_num not in resumed:
+            pipeline.submit_after(f"batch {batch_num} journal", upload, journal_batch, journal,
+                                  batch_num, scene_idx, next_scene_idx, chunk_path)
+        # Appends are queued strictly in scene order, so no pipeline worker
+        # ever blocks waiting for a chunk that isn't queued yet.
+        while incremental and next_append < len(batches) and chunk_paths[next_append]:
+            final_appends.append(pipeline.submit(
+                f"batch {next_append + 1} append",
+                timings.timed("append", append_to_final, batch=next_append + 1),
+                assembler, final_stream, next_append, chunk_paths[next_append],
+            ))
+            next_append += 1
+
+    def queue_batch(batch_num, wf):
+        # Don't queue more GPU work if an earlier upload already failed.
+        pipeline.raise_if_failed()
+        with timings.span("submit", batch=batch_num):
+            prompt_id = submit_prompt(wf, client_id).get("prompt_id")
         if not prompt_id:
             raise RuntimeError(f"Batch {batch_num}: no prompt_id")
-
-        history = wait_for_history(prompt_id, timeout=14400)
-
-        chunk_path = get_largest_output_file(history)
-        if not chunk_path:
-            raise RuntimeError(f"Batch {batch_num}: no output files found")
-
-        chunk_filename = f"{job_id}_batch{batch_num:02d}.mp4"
-        chunk_url      = supabase_upload(chunk_path, chunk_filename)
-        chunk_urls.append(chunk_url)
-        chunk_paths.append(chunk_path)
-        print(f"[handler] Batch {batch_num} done -> {chunk_url}")
-
-        if scene_idx + batch_size < num_scenes:
-            last_frame_path = os.path.join(output_dir, f"last_frame_b{batch_num}.png")
+        timings.watch_prompt(prompt_id, f"batch {batch_num}", wf)
+        batch_clock[batch_num] = {"queued": time.perf_counter()}
+        return prompt_id
+
+    def batch_output(batch_num, history):
+        clock = batch_clock.get(batch_num)
+        if clock:
+            clock["render_seconds"] = time.perf_counter() - clock["queued"]
+        node_id, item = _outputs.target(history, output_nodes)
+        if not item:
+            raise RuntimeError(f"Batch {batch_num}: no video output found")
+        with timings.span("output_fetch", batch=batch_num, node=node_id):
+            chunk_path, nbytes, secs = _outputs.fetch(item, output_dir, job_tmp)
+        if nbytes:
+            timings.transfer("comfy_view", nbytes, secs, batch=batch_num)
+        if last_frame_node is not None:
+            ref = history_last_frame_ref(history, last_frame_node)
+            if ref:
+                JANITOR.track(job_id, ref_path(ref, input_dir, output_dir))
+        if latent_handoff:
+            ref = history_last_frame_ref(history, LATENT_SAVE_ID, "latents")
+            if ref:
+                JANITOR.track(job_id, ref_path(ref, input_dir, output_dir))
+        return chunk_path
+
+    try:
+        if independent:
+            queued = {}   # prompt_id -> (batch_num, scene_idx, chunk_filename)
+            for batch_num, (scene_idx, batch_prompts) in enumerate(batches, 1):
+                chunk_filename = f"{job_id}_batch{batch_num:02d}.mp4"
+                cached = lookup_batch(batch_num, chunk_filename)
+                if cached:
+                    upload = Future()
+                    upload.set_result(cached["url"])
+                    batch_ready(batch_num, scene_idx, scene_idx + 1, cached["path"], upload)
+                    continue
+                wf = batch_workflow(scene_idx, batch_prompts, uploaded_filename,
+                                    prefix=f"{job_tag}_batch")
+                queued[queue_batch(batch_num, wf)] = (batch_num, scene_idx, chunk_filename)
+            if queued:
+                print(f"[handler] Queued {len(queued)} independent scene(s) on ComfyUI")
+
+            waiting = set(queued)
+            wait_start = time.perf_counter()
             try:
-                extract_last_frame(chunk_path, last_frame_path)
-                uploaded_filename = upload_image_bytes_to_comfy(
-                    open(last_frame_path, "rb").read(),
-                    f"last_frame_b{batch_num}.png"
-                )
-                print(f"[handler] Last frame -> {uploaded_filename} (next batch input)")
-            except Exception as e:
-                print(f"[handler] WARNING: last frame extract failed: {e}")
-
-        scene_idx += batch_size
-
-    if len(chunk_paths) == 1:
-        final_local    = chunk_paths[0]
-        final_filename = os.path.basename(final_local)
-    else:
-        print(f"[handler] Stitching {len(chunk_paths)} chunks...")
-        final_filename = f"{job_id}_final.mp4"
-        final_local    = os.path.join(output_dir, final_filename)
-        ffmpeg_concat(chunk_paths, final_local)
-
-    final_url = supabase_upload(final_local, final_filename)
+                for prompt_id, history in events.wait_each(list(queued), timeout=14400):
+                    timings.add("comfy_wait", time.perf_counter() - wait_start, wait_start,
+                                batch=queued[prompt_id][0])
+                    waiting.discard(prompt_id)
+                    batch_num, scene_idx, chunk_filename = queued[prompt_id]
+                    chunk_path = batch_output(batch_num, history)
+                    upload = start_upload(batch_num, chunk_path, chunk_filename)
+                    batch_ready(batch_num, scene_idx, scene_idx + 1, chunk_path, upload)
+            except Exception:
+                # Don't leave this job's remaining scenes on the GPU queue.
+                cancel_prompts(waiting)
+                raise
+        else:
+            # The last frame of the previous batch is only extracted when a batch
+            # actually has to be rendered; a run of cache hits needs no handoffs.
+            pending_handoff = None
+            rendered_any    = False
+            source_image    = uploaded_filename
+
+            for batch_num, (scene_idx, batch_prompts) in enumerate(batches, 1):
+                batch_size = len(batch_prompts)
+                chunk_filename = f"{job_id}_batch{batch_num:02d}.mp4"
+                next_scene_idx = scene_idx + batch_size
+                # Only a contiguous run of finished batches can be resumed; once
+                # one is re-rendered, everything after it is too.
+                cached = lookup_batch(batch_num, chunk_filename, allow_resume=not rendered_any)
+
+                if cached:
+                    history    = {}
+                    chunk_path = cached["path"]
+                    upload     = Future()
+                    upload.set_result(cached["url"])
+                else:
+                    prev_latent = None
+                    if pending_handoff:
+                        prev_history, prev_chunk, prev_num = pending_handoff
+                        journaled = journal.last_frame(prev_num) if journal and prev_num in resumed else None
+                    if pending_handoff and latent_handoff:
+                        with timings.span("handoff", batch=prev_num, method="latent"):
+                            if journaled and comfy_has_image(journaled):
+                                prev_latent = journaled
+                            else:
+                                prev_latent = history_last_frame_ref(prev_history, LATENT_SAVE_ID,
+                                                                     "latents")
+                                if prev_latent and journal:
+                                    journal.record_last_frame(prev_num, prev_latent)
+                        if prev_latent:
+                            uploaded_filename = source_image
+                            JANITOR.track(job_id, ref_path(prev_latent, input_dir, output_dir))
+                            handoff_timings.append(0.0)
+                            print(f"[handler] Latents -> {prev_latent} (next batch continues from them)")
+                        else:
+                            # A cached batch has no latents on this worker.
+                            print(f"[handler] Batch {prev_num} has no saved latents; "
+                                  f"handing off its last frame instead")
+                            use_cache = False
+                    if pending_handoff and not prev_latent:
+                        try:
+                            if journaled and comfy_has_image(journaled):
+                                uploaded_filename, handoff_secs, method = journaled, 0.0, "journal"
+                            else:
+                                with timings.span("handoff", batch=prev_num) as attrs:
+                                    uploaded_filename, handoff_secs, method = handoff_last_frame(
+                                        prev_history, prev_chunk,
+                                        f"{job_tag}_last_frame_b{prev_num}.png",
+                                        last_frame_node=last_frame_node, tmp_dir=job_tmp,
+                                    )
+                                    attrs["method"] = method
+                                if journal:
+                                    journal.record_last_frame(prev_num, uploaded_filename)
+                            JANITOR.track(job_id, ref_path(uploaded_filename, input_dir, output_dir))
+                            handoff_timings.append(round(handoff_secs, 3))
+                            print(f"[handler] Last frame -> {uploaded_filename} "
+                                  f"({method}, {handoff_secs:.2f}s, next batch input)")
+                        except Exception as e:
+                            print(f"[handler] WARNING: last frame extract failed: {e}")
+                            # This batch won't start from the frame its key
+                            # assumes, so neither it nor anything after it may
+                            # be cached.
+                            use_cache = False
+
+                    print(f"[handler] Batch {batch_num}: scenes {scene_idx+1}-{scene_idx+batch_size} "
+                          f"({batch_size} scene(s) chained)")
+
+                    rendered_any = True
+                    wf = batch_workflow(scene_idx, batch_prompts, uploaded_filename,
+                                        prefix=f"{job_tag}_batch", latent=prev_latent,
+                                        save_latent=latent_handoff and batch_num < len(batches))
+                    prompt_id  = queue_batch(batch_num, wf)
+                    with timings.span("comfy_wait", batch=batch_num):
+                        history = wait_for_history(prompt_id, timeout=14400, events=events)
+                    chunk_path = batch_output(batch_num, history)
+                    upload     = start_upload(batch_num, chunk_path, chunk_filename)
+
+                batch_ready(batch_num, scene_idx, next_scene_idx, chunk_path, upload)
+                pending_handoff = (history, chunk_path, batch_num)
+
+        if len(chunk_paths) == 1:
+            # A single batch is already the final video; don't upload it twice.
+            final_upload = chunk_uploads[0]
+        elif incremental and all([f.result() for f in final_appends]):
+            print(f"[handler] Final assembled incrementally ({assembler.duration:.1f}s), "
+                  f"finishing upload...")
+            final_upload = pipeline.submit(
+                "final upload", timings.timed("final_upload", finish_final_stream),
+                timings, final_stream, final_local,
+            )
+        else:
+            # Every append (and its push) has finished by now, so nothing
+            # else is still writing to the streamed upload.
+            concat_final(timings, final_stream if incremental else None,
+                         chunk_paths, final_local, tmp_dir=job_tmp)
+            final_upload = pipeline.submit(
+                "final upload", timings.timed("final_upload", upload_chunk),
+                timings, final_local, final_filename,
+            )
+
+        pipeline.join()
+        hls_url = hls.finish() if hls else None
+        # A Future wakes its waiters before it runs its done-callbacks, so
+        # the last chunk's update may still be on its way; it must go out
+        # before the result does.
+        for reported in chunks_reported:
+            reported.wait()
+    finally:
+        events.close()
+        pipeline.shutdown()
+        shutil.rmtree(job_tmp, ignore_errors=True)
+
+    chunk_urls = [f.result() for f in chunk_uploads]
+    final_url  = final_upload.result()
     print(f"[handler] Final -> {final_url}")
+    if use_cache:
+        _result_cache.put_job(job_key, final_url, chunk_urls)
+    if journal:
+        journal.record_final(final_url)
 
     return {
         "status":                    "success",
         "final_video_url":           final_url,
         "chunk_urls":                chunk_urls,
+        "handoff_seconds":           handoff_timings,
+        "cached_batches":            cached_batches,
+        "resumed_batches":           resumed_batches,
+        **({"hls_playlist_url": hls_url} if hls else {}),
         "total_scenes":              num_scenes,
         "total_frames":              total_frames,
         "expected_duration_seconds": round(expected_secs),
@@ -529,4 +1222,61 @@ def handler(job):
     }
 
 
-runpod.serverless.start({"handler": handler})
+def concurrency_modifier(current_concurrency):
+    return JOB_CONCURRENCY
+
+
+async def async_handler(job):
+    # The SDK awaits handlers on its event loop; run the blocking handler in
+    # a thread so several jobs can be in flight at once.
+    return await asyncio.to_thread(handler, job)
+
+
+async def stream_handler(job):
+    """
+    Generator handler for STREAM_RESULTS: yields a "chunk" update per
+    uploaded chunk while the job runs, then the job result as "final".
+    """
+    loop    = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+
+    def progress(update):
+        loop.call_soon_threadsafe(updates.put_nowait, update)
+
+    job_task = asyncio.ensure_future(asyncio.to_thread(handler, job, progress))
+    while True:
+        next_update = asyncio.ensure_future(updates.get())
+        await asyncio.wait({next_update, job_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not next_update.done():
+            next_update.cancel()
+            break
+        yield next_update.result()
+    # Callbacks scheduled just before the job returned are still queued.
+    await asyncio.sleep(0)
+    while not updates.empty():
+        yield updates.get_nowait()
+    result = await job_task
+    if "final_video_url" in result:
+        result = dict(result, type="final", progress=100.0)
+    yield result
+
+
+def start():
+    """Start the RunPod worker loop (blocks)."""
+    config = {"handler": handler}
+    if STREAM_RESULTS:
+        # /run still returns everything: the aggregated list of updates.
+        print("[handler] Streaming chunk results as they are uploaded")
+        config = {"handler": stream_handler, "return_aggregate_stream": True}
+    elif JOB_CONCURRENCY > 1:
+        config["handler"] = async_handler
+    if JOB_CONCURRENCY > 1:
+        print(f"[handler] Running up to {JOB_CONCURRENCY} jobs concurrently")
+        config["concurrency_modifier"] = concurrency_modifier
+    runpod.serverless.start(config)
+
+
+# Only start the worker when run as a script (start.sh runs /handler.py), so
+# the module can be imported by tools and benchmarks.
+if __name__ == "__main__":
+    start()
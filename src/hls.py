@@ -0,0 +1,167 @@
+"""
+HLS packaging of batch chunks, for watching a job while it renders.
+
+Each finished chunk is cut into CMAF (fragmented MP4) segments with ffmpeg's
+HLS muxer. The streams are copied, not re-encoded, so a chunk is segmented
+in about the time it takes to read it. The init segment and media segments
+are uploaded under ``<job_id>/hls/``, and an EVENT media playlist there is
+rewritten after every chunk:
+
+    #EXTM3U
+    #EXT-X-VERSION:7
+    #EXT-X-TARGETDURATION:16
+    #EXT-X-PLAYLIST-TYPE:EVENT
+    #EXT-X-MAP:URI="b01_init.mp4"
+    #EXTINF:15.187,
+    b01_00000.m4s
+    #EXT-X-DISCONTINUITY
+    #EXT-X-MAP:URI="b02_init.mp4"
+    ...
+    #EXT-X-ENDLIST                    once the last chunk is in
+
+Every chunk starts its own timeline with its own init segment, so chunks
+are separated by EXT-X-DISCONTINUITY. Chunks are segmented as they finish,
+on a pool of HLS_WORKERS ffmpeg processes shared by all jobs. They are
+published in batch order: a chunk that finishes early is held back until
+the ones before it are in the playlist. The playlist is uploaded with a
+short Cache-Control so players polling it see new chunks.
+
+Packaging is best effort. If it fails the playlist stops growing, and the
+job still finishes with its MP4 chunks and final video.
+"""
+
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HLS_ENABLED   = os.environ.get("HLS_ENABLED", "false").lower() == "true"
+HLS_SEGMENT_S = float(os.environ.get("HLS_SEGMENT_S", "4"))
+HLS_WORKERS   = int(os.environ.get("HLS_WORKERS", "2"))
+
+PLAYLIST_NAME = "index.m3u8"
+PLAYLIST_CACHE_S = "1"
+PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_TYPE  = "video/iso.segment"
+
+# ffmpeg runs in its own process; these threads only wait on it and upload.
+_pool = ThreadPoolExecutor(max_workers=max(1, HLS_WORKERS), thread_name_prefix="hls")
+
+
+def segment_chunk(chunk_path, out_dir, stem):
+    """
+    Stream-copy chunk_path into CMAF segments in out_dir. Returns (init
+    file name, [(segment file name, seconds), ...]).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    playlist = os.path.join(out_dir, f"{stem}.m3u8")
+    cmd = ["ffmpeg", "-y", "-v", "error", "-i", chunk_path, "-c", "copy",
+           "-f", "hls", "-hls_time", f"{HLS_SEGMENT_S:g}", "-hls_playlist_type", "vod",
+           "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", f"{stem}_init.mp4",
+           "-hls_segment_filename", os.path.join(out_dir, f"{stem}_%05d.m4s"), playlist]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg HLS segmenting failed: {result.stderr}")
+
+    init, segments, duration = f"{stem}_init.mp4", [], None
+    with open(playlist) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                match = re.search(r'URI="([^"]+)"', line)
+                init = match.group(1) if match else init
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[8:].split(",")[0])
+            elif line and not line.startswith("#"):
+                segments.append((line, duration or 0.0))
+                duration = None
+    if not segments:
+        raise RuntimeError(f"FFmpeg produced no HLS segments for {chunk_path}")
+    return init, segments
+
+
+class HlsPackager:
+    """
+    Packages one job's chunks. ``add`` may be called from any thread, in
+    any order; ``finish`` waits for every chunk and closes the playlist.
+    """
+
+    def __init__(self, uploader, job_id, num_chunks, tmp_dir, max_chunk_seconds=0,
+                 timings=None):
+        self.uploader = uploader
+        self.prefix = f"{job_id}/hls"
+        self.num_chunks = num_chunks
+        self.tmp_dir = os.path.join(tmp_dir, "hls")
+        self.timings = timings
+        self.playlist_url = uploader.public_url(f"{self.prefix}/{PLAYLIST_NAME}")
+        self.failed = None
+        self._target = max(1, math.ceil(max_chunk_seconds))
+        self._ready = {}       # index -> (init, segments), waiting for earlier chunks
+        self._published = []  # [(init, segments)] in batch order
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def add(self, index, chunk_path):
+        """Segment and upload chunk index (0-based) in the background."""
+        self._futures.append(_pool.submit(self._package, index, chunk_path))
+
+    def _package(self, index, chunk_path):
+        if self.failed is not None:
+            return
+        start = time.perf_counter()
+        stem = f"b{index + 1:02d}"
+        try:
+            out_dir = os.path.join(self.tmp_dir, stem)
+            init, segments = segment_chunk(chunk_path, out_dir, stem)
+            for name, content_type in [(init, "video/mp4")] + [(s, SEGMENT_TYPE) for s, _ in segments]:
+                self.uploader.upload(os.path.join(out_dir, name), f"{self.prefix}/{name}",
+                                     content_type)
+            with self._lock:
+                self._ready[index] = (init, segments)
+                published = False
+                while len(self._published) in self._ready:
+                    self._published.append(self._ready.pop(len(self._published)))
+                    published = True
+                if published:
+                    self._upload_playlist()
+        except Exception as e:
+            self.failed = self.failed or e
+            print(f"[hls] WARNING: packaging chunk {index + 1} failed, playlist stops here: {e}")
+            return
+        if self.timings is not None:
+            self.timings.add("hls_package", time.perf_counter() - start, start, batch=index + 1)
+
+    def _upload_playlist(self):
+        """Write and upload the playlist of everything published. Needs _lock."""
+        done = len(self._published) == self.num_chunks
+        longest = max(d for _, segs in self._published for _, d in segs)
+        self._target = max(self._target, math.ceil(longest))
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", f"#EXT-X-TARGETDURATION:{self._target}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:EVENT",
+                 "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for i, (init, segments) in enumerate(self._published):
+            if i:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f'#EXT-X-MAP:URI="{init}"')
+            for name, seconds in segments:
+                lines += [f"#EXTINF:{seconds:.3f},", name]
+        if done:
+            lines.append("#EXT-X-ENDLIST")
+        path = os.path.join(self.tmp_dir, PLAYLIST_NAME)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        self.uploader.upload(path, f"{self.prefix}/{PLAYLIST_NAME}", PLAYLIST_TYPE,
+                             cache_control=PLAYLIST_CACHE_S)
+        print(f"[hls] Playlist: {len(self._published)}/{self.num_chunks} chunk(s)"
+              + (" (complete)" if done else ""))
+
+    def finish(self):
+        """Wait for every chunk; returns the playlist URL, or None if packaging failed."""
+        for fut in self._futures:
+            fut.result()
+        if self.failed is not None or len(self._published) != self.num_chunks:
+            return None
+        return self.playlist_url
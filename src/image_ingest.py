@@ -0,0 +1,341 @@
+"""
+Input image ingestion for ComfyUI.
+
+URL inputs are streamed (never held whole in memory beyond a small spool),
+capped at INPUT_MAX_BYTES, and hashed while they download. The upload name is
+derived from the content hash, so:
+
+  - concurrent jobs never overwrite each other's inputs,
+  - an image ComfyUI already has (same hash) is not uploaded again.
+
+Source URLs are remembered with their ETag / Last-Modified, so a repeated URL
+is revalidated with a conditional GET and a ``304`` skips the download too.
+All HTTP goes through one pooled session.
+
+Base64 ``images`` payloads are decoded block by block, once to hash them
+(they are stored under the same content names, never under the name the
+client sent) and once straight into a streamed multipart body of known
+length, so a large image is never held as a second full-size string or
+byte copy. Every input's magic bytes are checked
+before anything is uploaded, so a malformed payload fails before any GPU
+work is queued.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+INPUT_MAX_BYTES       = int(os.environ.get("INPUT_MAX_BYTES", str(64 * 1024 * 1024)))
+INPUT_FETCH_WORKERS   = int(os.environ.get("INPUT_FETCH_WORKERS", "4"))
+INPUT_FETCH_TIMEOUT_S = float(os.environ.get("INPUT_FETCH_TIMEOUT_S", "60"))
+
+# Downloads spill from memory to a temp file past this size.
+SPOOL_BYTES = 8 * 1024 * 1024
+READ_SIZE   = 256 * 1024
+
+CONTENT_TYPE_EXT = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+}
+
+# Must be a multiple of 4 so every block decodes on its own.
+B64_BLOCK = 1024 * 1024
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+class InputTooLargeError(RuntimeError):
+    pass
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def sniff_image_type(head):
+    """Content type from an image's first bytes, or None if unrecognised."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class Base64Image:
+    """
+    A base64 (optionally data-URI) image string, decoded lazily in blocks.
+    The header is decoded and checked on construction; ``digest()`` hashes
+    the decoded bytes in a separate pass.
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        comma = data.find(",")
+        start = comma + 1 if comma >= 0 else 0
+        if re.search(r"\s", data):
+            # Line-wrapped base64 can't be sliced on block boundaries.
+            data, start = "".join(data[start:].split()), 0
+        length = len(data) - start
+        if length == 0 or length % 4:
+            raise InvalidImageError(f"{name}: truncated base64 ({length} characters)")
+        self.data = data
+        self.start = start
+        self.size = length // 4 * 3 - (2 if data.endswith("==") else 1 if data.endswith("=") else 0)
+        if self.size > INPUT_MAX_BYTES:
+            raise InputTooLargeError(
+                f"{name}: {self.size} bytes exceeds INPUT_MAX_BYTES={INPUT_MAX_BYTES}"
+            )
+        try:
+            head = base64.b64decode(data[start:start + 64], validate=True)
+        except ValueError as e:
+            raise InvalidImageError(f"{name}: invalid base64: {e}") from e
+        self.content_type = sniff_image_type(head)
+        if self.content_type is None:
+            raise InvalidImageError(f"{name}: not a PNG, JPEG, WEBP, GIF or BMP image")
+        self._digest = None
+
+    def __iter__(self):
+        for i in range(self.start, len(self.data), B64_BLOCK):
+            try:
+                block = base64.b64decode(self.data[i:i + B64_BLOCK], validate=True)
+            except ValueError as e:
+                raise InvalidImageError(f"{self.name}: invalid base64: {e}") from e
+            yield block
+
+    def digest(self):
+        """sha256 hex digest of the decoded image."""
+        if self._digest is None:
+            h = hashlib.sha256()
+            for block in self:
+                h.update(block)
+            self._digest = h.hexdigest()
+        return self._digest
+
+
+class MultipartFile:
+    """
+    A multipart/form-data body with one streamed file field plus small text
+    fields. Has a length, so requests sends it with Content-Length instead
+    of chunked encoding.
+    """
+
+    def __init__(self, field, filename, content_type, blocks, size, fields=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        pre = b""
+        for key, value in (fields or {}).items():
+            pre += (f"--{self.boundary}\r\n"
+                    f'Content-Disposition: form-data; name="{key}"\r\n\r\n'
+                    f"{value}\r\n").encode()
+        safe_name = filename.replace('"', "%22")
+        pre += (f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{field}"; filename="{safe_name}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n").encode()
+        self.pre = pre
+        self.post = f"\r\n--{self.boundary}--\r\n".encode()
+        self.blocks = blocks
+        self.size = size
+
+    def __len__(self):
+        return len(self.pre) + self.size + len(self.post)
+
+    def __iter__(self):
+        yield self.pre
+        sent = 0
+        for block in self.blocks:
+            sent += len(block)
+            yield block
+        if sent != self.size:
+            raise InvalidImageError(f"Streamed {sent} bytes, expected {self.size}")
+        yield self.post
+
+
+def content_name(digest, ext=".png"):
+    """Upload name for an image with this sha256."""
+    return f"input_{digest[:24]}{ext}"
+
+
+class ImageIngestor:
+    def __init__(self, comfy_base, max_bytes=INPUT_MAX_BYTES, max_workers=INPUT_FETCH_WORKERS):
+        self.comfy_base = comfy_base
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(8, max_workers * 2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._known = set()    # names ComfyUI is known to have
+        self._sources = {}     # url -> {"etag", "last_modified", "name", "digest"}
+
+    # ---- ComfyUI side --------------------------------------------------------
+
+    def comfy_has(self, name):
+        with self._lock:
+            if name in self._known:
+                return True
+        try:
+            r = self.session.head(f"{self.comfy_base}/view", timeout=10,
+                                  params={"filename": name, "type": "input"})
+        except requests.RequestException:
+            return False
+        if r.status_code == 200:
+            with self._lock:
+                self._known.add(name)
+            return True
+        return False
+
+    def forget(self, name):
+        """Drop name from the known set, e.g. after the janitor deleted it."""
+        with self._lock:
+            self._known.discard(name)
+            for url in [u for u, src in self._sources.items() if src["name"] == name]:
+                del self._sources[url]
+
+    def _post_image(self, body, name):
+        resp = self.session.post(f"{self.comfy_base}/upload/image", data=body,
+                                 headers={"Content-Type": body.content_type},
+                                 timeout=INPUT_FETCH_TIMEOUT_S)
+        resp.raise_for_status()
+        stored = resp.json().get("name", name)
+        with self._lock:
+            self._known.add(stored)
+        return stored
+
+    def upload(self, fileobj, name, content_type="image/png"):
+        """Stream an open file to /upload/image; returns ComfyUI's name for it."""
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        blocks = iter(lambda: fileobj.read(READ_SIZE), b"")
+        # Content-addressed or per-job names: overwriting only rewrites our own bytes.
+        body = MultipartFile("image", name, content_type, blocks, size,
+                             fields={"overwrite": "true"})
+        return self._post_image(body, name)
+
+    # ---- URL inputs ----------------------------------------------------------
+
+    def _download(self, resp, url):
+        """Stream a response into a spooled temp file. Returns (file, sha256, type)."""
+        length = int(resp.headers.get("Content-Length") or 0)
+        if length > self.max_bytes:
+            raise InputTooLargeError(
+                f"{url}: {length} bytes exceeds INPUT_MAX_BYTES={self.max_bytes}"
+            )
+        h = hashlib.sha256()
+        size = 0
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        try:
+            for block in resp.iter_content(READ_SIZE):
+                size += len(block)
+                if size > self.max_bytes:
+                    raise InputTooLargeError(
+                        f"{url}: more than INPUT_MAX_BYTES={self.max_bytes} bytes"
+                    )
+                h.update(block)
+                spool.write(block)
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        content_type = sniff_image_type(spool.read(16))
+        spool.seek(0)
+        if content_type is None:
+            spool.close()
+            raise InvalidImageError(f"{url}: not a PNG, JPEG, WEBP, GIF or BMP image")
+        return spool, h.hexdigest(), content_type
+
+    def ingest_url(self, url):
+        """Make url's image available to ComfyUI. Returns (name, sha256)."""
+        with self._lock:
+            known = self._sources.get(url)
+        headers = {}
+        if known:
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=INPUT_FETCH_TIMEOUT_S) as resp:
+            if resp.status_code == 304 and known and self.comfy_has(known["name"]):
+                print(f"[ingest] {url} unchanged -> {known['name']}")
+                return known["name"], known["digest"]
+            if resp.status_code == 304:
+                # Validators matched but ComfyUI lost the file; fetch it again.
+                resp.close()
+                with self._lock:
+                    self._sources.pop(url, None)
+                return self.ingest_url(url)
+            resp.raise_for_status()
+            spool, digest, ct = self._download(resp, url)
+            validators = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+
+        with spool:
+            name = content_name(digest, CONTENT_TYPE_EXT.get(ct, ".png"))
+            if self.comfy_has(name):
+                print(f"[ingest] {url} already in ComfyUI as {name}")
+            else:
+                name = self.upload(spool, name, ct)
+                print(f"[ingest] {url} -> {name}")
+
+        if validators["etag"] or validators["last_modified"]:
+            with self._lock:
+                self._sources[url] = {**validators, "name": name, "digest": digest}
+        return name, digest
+
+    # ---- base64 inputs -------------------------------------------------------
+
+    def upload_base64(self, image):
+        """Stream a Base64Image to ComfyUI under its content name. Returns (name, sha256)."""
+        digest = image.digest()
+        name = content_name(digest, CONTENT_TYPE_EXT.get(image.content_type, ".png"))
+        if self.comfy_has(name):
+            print(f"[ingest] {image.name} already in ComfyUI as {name}")
+            return name, digest
+        body = MultipartFile("image", name, image.content_type, image, image.size,
+                             fields={"overwrite": "true"})
+        stored = self._post_image(body, name)
+        print(f"[ingest] {image.name} ({image.size/1024:.0f} KB) -> {stored}")
+        return stored, digest
+
+    def ingest_base64(self, images):
+        """
+        Upload payload images ({"name", "image"}) in parallel; results in
+        input order. Every header is validated before the first upload.
+        """
+        decoded = [Base64Image(img["name"], img["image"]) for img in images]
+        if len(decoded) <= 1:
+            return [self.upload_base64(img) for img in decoded]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(decoded)),
+                                thread_name_prefix="ingest-b64") as pool:
+            return list(pool.map(self.upload_base64, decoded))
+
+    def ingest_urls(self, urls):
+        """ingest_url for several URLs in parallel; results in input order."""
+        if len(urls) <= 1:
+            return [self.ingest_url(u) for u in urls]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls)),
+                                thread_name_prefix="ingest") as pool:
+            return list(pool.map(self.ingest_url, urls))
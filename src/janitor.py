@@ -0,0 +1,235 @@
+"""
+Retention for the files jobs leave in ComfyUI's output and input dirs.
+
+Every job writes batch chunks (plus the PNG VHS saves next to each one),
+last-frame handoff images and its final video, and uploads its source
+images. The handler tracks each of those paths under the job id while the
+job runs; when the job ends they are released:
+
+  - per-job files are deleted once the job succeeded, i.e. once everything
+    was uploaded,
+  - reusable files (content-addressed source images), per-job files of a
+    failed job (a resume can reuse its chunks) and, with
+    JANITOR_KEEP_OUTPUTS=true, uploaded outputs are kept in an LRU and the
+    least recently used are deleted past JANITOR_MAX_BYTES.
+
+A path still tracked by another running job is never deleted. At startup
+``sweep`` handles what an earlier process left behind: files older than
+JANITOR_SWEEP_AGE_S that carry a name this worker gives its files (batch
+chunks, finals, latents, last frames, content-addressed and warmup inputs)
+get the same treatment. Anything else in ComfyUI's dirs is left alone.
+Deleted and reclaimed bytes go to METRICS.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from timings import METRICS
+
+JANITOR_ENABLED      = os.environ.get("JANITOR_ENABLED", "true").lower() == "true"
+JANITOR_MAX_BYTES    = int(os.environ.get("JANITOR_MAX_BYTES", str(2 * 1024**3)))
+JANITOR_KEEP_OUTPUTS = os.environ.get("JANITOR_KEEP_OUTPUTS", "false").lower() == "true"
+JANITOR_SWEEP_AGE_S  = float(os.environ.get("JANITOR_SWEEP_AGE_S", "300"))
+
+# Input files this worker creates: content-addressed uploads (reusable),
+# per-job last frames and the boot warmup image.
+REUSABLE_INPUT = re.compile(r"^input_[0-9a-f]{24}\.\w+$")
+DISPOSABLE_INPUT = re.compile(r"^(.+_last_frame_b\d+\.png|warmup_input\.png)$")
+
+# Output files this worker creates: batch chunks (and the PNG VHS saves next
+# to each), restored chunks, finals and warmup outputs; latents go to latents/.
+WORKER_OUTPUT = re.compile(
+    r"^(.+_batch_\d{2}_\d+(-audio)?\.\w+|.+_batch\d{2}\.mp4|.+_final\.mp4"
+    r"|warmup_\d{2}_\d+(-audio)?\.\w+)$"
+)
+WORKER_LATENT = re.compile(r"^.+_batch_\d{2}_\d+_\.latent$")
+LATENT_DIR = "latents"
+
+
+def job_output_files(job_tag):
+    """Pattern for the batch outputs of the job whose files are named job_tag."""
+    return re.compile(rf"{re.escape(job_tag)}_batch_\d{{2}}_\d+(-audio)?\.\w+")
+
+
+def job_input_files(job_tag):
+    """Pattern for the last-frame handoff images of job_tag."""
+    return re.compile(rf"{re.escape(job_tag)}_last_frame_b\d+\.png")
+
+
+def ref_path(ref, input_dir, output_dir):
+    """Local path of a LoadImage reference like 'sub/x.png [output]'."""
+    name, kind = ref, "input"
+    if ref.endswith("]") and " [" in ref:
+        name, kind = ref[:-1].rsplit(" [", 1)
+    return os.path.join(output_dir if kind == "output" else input_dir, name)
+
+
+class Janitor:
+    def __init__(self, max_bytes=JANITOR_MAX_BYTES, keep_outputs=JANITOR_KEEP_OUTPUTS,
+                 enabled=JANITOR_ENABLED):
+        self.max_bytes = max_bytes
+        self.keep_outputs = keep_outputs
+        self.enabled = enabled
+        self.on_delete = []          # callbacks(path), e.g. to forget ComfyUI inputs
+        self._lock = threading.Lock()
+        self._jobs = {}              # job_id -> {path: reusable}
+        self._patterns = {}          # job_id -> [(dir, compiled name pattern)]
+        self._lru = OrderedDict()    # path -> size, least recently used first
+        self._lru_bytes = 0
+
+    # ---- tracking ------------------------------------------------------------
+
+    def track(self, job_id, path, reusable=False):
+        """Record that job_id created or uses path."""
+        if not self.enabled or not path:
+            return
+        with self._lock:
+            files = self._jobs.setdefault(job_id, {})
+            files[path] = files.get(path, False) or reusable
+            size = self._lru.pop(path, None)
+            if size is not None:
+                self._lru_bytes -= size
+
+    def track_matching(self, job_id, directory, pattern):
+        """Files in directory whose whole name matches pattern belong to job_id (found on release)."""
+        if self.enabled and os.path.isdir(directory):
+            with self._lock:
+                self._patterns.setdefault(job_id, []).append((directory, pattern))
+
+    def release(self, job_id, uploaded):
+        """
+        The job is over. Deletes its per-job files if uploaded, retains the
+        rest under the byte budget. Returns (files deleted, bytes reclaimed).
+        """
+        if not self.enabled:
+            return 0, 0
+        with self._lock:
+            files = self._jobs.pop(job_id, {})
+            patterns = self._patterns.pop(job_id, [])
+        for directory, pattern in patterns:
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if pattern.fullmatch(entry.name):
+                            files.setdefault(entry.path, False)
+            except OSError:
+                continue
+
+        deleted = reclaimed = 0
+        with self._lock:
+            in_use = {p for job in self._jobs.values() for p in job}
+            for path, reusable in files.items():
+                if path in in_use:
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                if uploaded and not reusable and not self.keep_outputs:
+                    if self._delete(path):
+                        deleted, reclaimed = deleted + 1, reclaimed + size
+                    continue
+                self._lru[path] = size
+                self._lru_bytes += size
+            n, freed = self._trim()
+        deleted, reclaimed = deleted + n, reclaimed + freed
+        self._report(f"job {job_id}", deleted, reclaimed)
+        return deleted, reclaimed
+
+    # ---- deletion ------------------------------------------------------------
+
+    def _delete(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[janitor] Could not delete {path}: {e}")
+            return False
+        for callback in self.on_delete:
+            callback(path)
+        return True
+
+    def _trim(self):
+        """Delete least recently used retained files until under budget. Needs _lock."""
+        deleted = freed = 0
+        while self._lru_bytes > self.max_bytes and self._lru:
+            path, size = self._lru.popitem(last=False)
+            self._lru_bytes -= size
+            if self._delete(path):
+                deleted, freed = deleted + 1, freed + size
+        return deleted, freed
+
+    def _report(self, what, deleted, reclaimed):
+        METRICS.count("janitor_files_deleted", deleted)
+        METRICS.count("janitor_bytes_reclaimed", reclaimed)
+        if deleted:
+            print(f"[janitor] {what}: deleted {deleted} file(s), "
+                  f"reclaimed {reclaimed/1024/1024:.1f} MB; retaining "
+                  f"{len(self._lru)} file(s), {self._lru_bytes/1024/1024:.1f} MB")
+
+    # ---- startup -------------------------------------------------------------
+
+    def sweep(self, output_dir, input_dir):
+        """
+        Clean up files an earlier process left behind. Returns a stats dict
+        for the boot report.
+        """
+        start = time.perf_counter()
+        stats = {"deleted": 0, "reclaimed_bytes": 0, "retained": 0, "retained_bytes": 0}
+        if not self.enabled:
+            return stats
+        cutoff = time.time() - JANITOR_SWEEP_AGE_S
+        found = []   # (mtime, path, size, disposable)
+
+        for directory, names in ((output_dir, WORKER_OUTPUT),
+                                 (os.path.join(output_dir, LATENT_DIR), WORKER_LATENT)):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file() and names.match(entry.name):
+                            found.append((entry.path, not self.keep_outputs))
+            except OSError:
+                pass
+        try:
+            with os.scandir(input_dir) as it:
+                for entry in it:
+                    if REUSABLE_INPUT.match(entry.name):
+                        found.append((entry.path, False))
+                    elif DISPOSABLE_INPUT.match(entry.name):
+                        found.append((entry.path, True))
+        except OSError:
+            pass
+
+        old = []
+        for path, disposable in found:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_mtime <= cutoff:
+                old.append((st.st_mtime, path, st.st_size, disposable))
+        old.sort()
+
+        with self._lock:
+            for _, path, size, disposable in old:
+                if disposable:
+                    if self._delete(path):
+                        stats["deleted"] += 1
+                        stats["reclaimed_bytes"] += size
+                elif path not in self._lru:
+                    self._lru[path] = size
+                    self._lru_bytes += size
+            n, freed = self._trim()
+            stats["deleted"] += n
+            stats["reclaimed_bytes"] += freed
+            stats["retained"], stats["retained_bytes"] = len(self._lru), self._lru_bytes
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        self._report("startup sweep", stats["deleted"], stats["reclaimed_bytes"])
+        return stats
+
+
+JANITOR = Janitor()
@@ -0,0 +1,163 @@
+"""
+Per-job progress journal so long multi-batch jobs survive worker loss.
+
+After every batch the handler records the chunk URL, the local chunk path,
+the next scene index and the last-frame name (or, with latent handoff, the
+saved latents) it handed to ComfyUI. The file
+lives on the network volume, so when RunPod re-delivers the job (same id) or
+a client submits a new job with ``"resume_from": "<old job id>"``, the
+handler skips every batch that already finished.
+
+A journal is only reused if its ``signature`` (the job's cache key chain)
+matches, i.e. the same workflow, prompts, image and settings. The chain
+depends on how scenes were split into batches, so the journal also keeps
+``scenes_per_batch`` and a resumed job reuses it instead of re-sizing for
+its new GPU.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+JOB_JOURNAL_DIR   = os.environ.get("JOB_JOURNAL_DIR", "/runpod-volume/cache/journal")
+JOB_JOURNAL_TTL_S = int(os.environ.get("JOB_JOURNAL_TTL_S", str(7 * 24 * 3600)))
+
+# resume_from comes from the client and names a file on the shared volume.
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def journal_enabled():
+    return os.path.isdir(os.path.dirname(JOB_JOURNAL_DIR.rstrip("/")))
+
+
+def check_resume_from(job_id):
+    """Return job_id if it can name a journal; raise ValueError otherwise."""
+    if not isinstance(job_id, str) or not JOB_ID_PATTERN.match(job_id):
+        raise ValueError(f"Invalid resume_from {job_id!r}: expected a job id "
+                         f"(letters, digits, '_' and '-')")
+    return job_id
+
+
+class JobJournal:
+    def __init__(self, job_id, signature, root=JOB_JOURNAL_DIR):
+        self.job_id = job_id
+        self.signature = signature
+        self.root = root
+        self.path = os.path.join(root, f"{job_id}.json")
+        self._lock = threading.Lock()
+        self.state = {
+            "job_id": job_id,
+            "signature": signature,
+            "batches": {},        # "batch_num" -> {scene_idx, next_scene_idx, chunk_url, chunk_path}
+            "scene_idx": 0,       # first scene not yet covered by a finished batch
+            "last_frame": None,   # {"batch": n, "name": ...} image or latents handed to batch n+1
+            "final_video_url": None,
+            "scenes_per_batch": None,
+        }
+
+    @classmethod
+    def load(cls, job_id, signature, resume_from=None, root=JOB_JOURNAL_DIR):
+        """
+        Journal for job_id, seeded from resume_from's journal (or job_id's own
+        on re-delivery) when its signature matches; otherwise a fresh one.
+        Progress is always written under job_id.
+        """
+        journal = cls(job_id, signature, root)
+        source = check_resume_from(resume_from) if resume_from else job_id
+        try:
+            with open(os.path.join(root, f"{source}.json")) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            if resume_from:
+                print(f"[journal] No journal for {resume_from}, starting from scratch")
+            return journal
+        if state.get("signature") != signature:
+            print(f"[journal] {source}: inputs changed since that run, starting over")
+            return journal
+        for key in ("batches", "scene_idx", "last_frame", "final_video_url", "scenes_per_batch"):
+            journal.state[key] = state.get(key, journal.state[key])
+        return journal
+
+    @staticmethod
+    def scenes_per_batch(job_id, root=JOB_JOURNAL_DIR):
+        """Batch size job_id's journal was recorded with, or None."""
+        if not JOB_ID_PATTERN.match(str(job_id)):
+            return None
+        try:
+            with open(os.path.join(root, f"{job_id}.json")) as f:
+                return json.load(f).get("scenes_per_batch")
+        except (OSError, ValueError):
+            return None
+
+    def completed(self):
+        """Finished batches as a contiguous prefix: [(batch_num, entry)]."""
+        done = []
+        batches = self.state["batches"]
+        n = 1
+        while str(n) in batches:
+            done.append((n, batches[str(n)]))
+            n += 1
+        return done
+
+    def recorded(self):
+        """Every finished batch, contiguous or not: {batch_num: entry}."""
+        return {int(n): entry for n, entry in self.state["batches"].items()}
+
+    def last_frame(self, batch_num):
+        """Uploaded last-frame name of batch_num, if one was recorded."""
+        entry = self.state.get("last_frame") or {}
+        return entry.get("name") if entry.get("batch") == batch_num else None
+
+    def record_batch(self, batch_num, scene_idx, next_scene_idx, chunk_url, chunk_path):
+        with self._lock:
+            self.state["batches"][str(batch_num)] = {
+                "scene_idx": scene_idx,
+                "next_scene_idx": next_scene_idx,
+                "chunk_url": chunk_url,
+                "chunk_path": chunk_path,
+            }
+            done = self.completed()
+            if done:
+                self.state["scene_idx"] = done[-1][1]["next_scene_idx"]
+            self._save()
+
+    def record_last_frame(self, batch_num, name):
+        with self._lock:
+            self.state["last_frame"] = {"batch": batch_num, "name": name}
+            self._save()
+
+    def record_final(self, final_url):
+        with self._lock:
+            self.state["final_video_url"] = final_url
+            self._save()
+
+    def _save(self):
+        self.state["updated"] = time.time()
+        tmp = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[journal] Could not write {self.path}: {e}")
+
+
+def prune_journals(root=JOB_JOURNAL_DIR, ttl=JOB_JOURNAL_TTL_S):
+    """Delete journals not updated within ttl seconds."""
+    cutoff = time.time() - ttl
+    removed = 0
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return removed
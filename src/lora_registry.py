@@ -0,0 +1,212 @@
+"""
+In-memory LoRA registry, so jobs can pick LoRAs by alias.
+
+registry.json (the file tools/check_lora_sidecars.py checks) lists the LoRAs
+on the volume:
+
+    {"loras": [{"alias": "paper-butterfly", "filename": "paper_butterfly_v2.safetensors",
+                "category": "style", "strength": 0.8}, ...]}
+
+Each model may have a ``<name>.json`` sidecar next to it with free-form
+metadata; its ``strength`` is used when the registry entry has none.
+
+The registry and every sidecar are loaded once into a dict keyed by
+lower-cased alias. The dict is rebuilt when registry.json or the loras
+directory changes, checked at most every LORA_REGISTRY_CHECK_S seconds.
+Sidecars are listed through the model manifest, refreshing only the loras
+folder, and only new or changed ones are re-read.
+
+A job swaps LoRAs by naming LoraLoaderModelOnly slots (node id or title)
+in ``"loras"``:
+
+    "loras": {
+      "2001": "paper-butterfly",                        alias, registry strength
+      "HIGH Lora 4": {"alias": "soft-light", "strength": 0.6},
+      "2008": null                                      bypass the slot
+    }
+
+Resolution is a dict lookup per slot and alias. An unknown slot or alias, or
+a registered file that is not on disk, raises UnknownLoraError before
+anything is queued on ComfyUI. A bypassed slot is taken out of the model
+chain: whatever consumed its output is rewired to its input.
+"""
+
+import difflib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_manifest import manifest_for
+
+LORA_REGISTRY_PATH    = os.environ.get("LORA_REGISTRY_PATH", "/runpod-volume/models/loras/registry.json")
+LORA_REGISTRY_CHECK_S = float(os.environ.get("LORA_REGISTRY_CHECK_S", "10"))
+
+LORA_CLASS = "LoraLoaderModelOnly"
+
+
+class UnknownLoraError(ValueError):
+    pass
+
+
+class LoraRegistry:
+    def __init__(self, path=LORA_REGISTRY_PATH):
+        self.path = path
+        self.lora_dir = os.path.dirname(path)
+        self.by_alias = {}
+        self._sidecars = {}      # sidecar name -> ((size, mtime), metadata)
+        self._stamp = None       # (registry mtime_ns, lora dir mtime_ns)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    # ---- loading -------------------------------------------------------------
+
+    def refresh(self, force=False):
+        """Reload if registry.json or the loras dir changed. Returns self."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked < LORA_REGISTRY_CHECK_S:
+                return self
+            self._checked = now
+            try:
+                stamp = (os.stat(self.path).st_mtime_ns, os.stat(self.lora_dir).st_mtime_ns)
+            except OSError:
+                if self.by_alias:
+                    print(f"[lora_registry] {self.path} is gone; registry cleared")
+                self.by_alias, self._stamp = {}, None
+                return self
+            if force or stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+        return self
+
+    def _load(self):
+        start = time.perf_counter()
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data["loras"] if isinstance(data, dict) else data
+
+        manifest, folder = manifest_for(self.lora_dir)
+        manifest.refresh(folder=folder)
+        on_disk = manifest.files(folder)
+
+        sidecars, to_read = {}, []
+        for e in entries:
+            name = os.path.splitext(e.get("filename") or e.get("alias", "") + ".safetensors")[0] + ".json"
+            info = on_disk.get(name)
+            if info is None:
+                continue
+            stamp = (info["size"], info["mtime"])
+            cached = self._sidecars.get(name)
+            if cached and cached[0] == stamp:
+                sidecars[name] = cached
+            else:
+                to_read.append((name, stamp))
+
+        def read(item):
+            name, stamp = item
+            try:
+                with open(os.path.join(self.lora_dir, name), encoding="utf-8") as f:
+                    return name, (stamp, json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"[lora_registry] Bad sidecar {name}: {e}")
+                return name, (stamp, None)
+
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix="lora-sidecar") as pool:
+            sidecars.update(pool.map(read, to_read))
+
+        by_alias = {}
+        for e in entries:
+            alias = e.get("alias")
+            if not alias:
+                continue
+            filename = e.get("filename") or alias + ".safetensors"
+            sidecar = sidecars.get(os.path.splitext(filename)[0] + ".json")
+            meta = sidecar[1] if sidecar else None
+            strength = e.get("strength")
+            if strength is None and isinstance(meta, dict):
+                strength = meta.get("strength")
+            by_alias[alias.lower()] = {
+                "alias":    alias,
+                "filename": filename,
+                "category": e.get("category", "uncategorized"),
+                "strength": strength,
+                "present":  filename in on_disk,
+                "meta":     meta,
+            }
+        self.by_alias = by_alias
+        self._sidecars = sidecars
+        print(f"[lora_registry] {len(by_alias)} alias(es) from {self.path}, "
+              f"{len(to_read)} sidecar(s) read, {time.perf_counter() - start:.2f}s")
+
+    # ---- lookups -------------------------------------------------------------
+
+    def resolve(self, alias):
+        entry = self.refresh().by_alias.get(str(alias).lower())
+        if entry is None:
+            close = difflib.get_close_matches(str(alias).lower(), self.by_alias, n=3)
+            hint = f" (did you mean {', '.join(close)}?)" if close else ""
+            raise UnknownLoraError(f"Unknown LoRA alias '{alias}'{hint}")
+        if not entry["present"]:
+            raise UnknownLoraError(
+                f"LoRA '{entry['alias']}' is registered but {entry['filename']} is not on disk")
+        return entry
+
+    def overrides(self, template, loras):
+        """
+        {node_id: {input: value}} that applies a job's "loras" swaps to a
+        WorkflowTemplate. Raises UnknownLoraError for unknown slots or aliases.
+        """
+        if not loras:
+            return {}
+        if not isinstance(loras, dict):
+            raise UnknownLoraError('"loras" must map slot (node id or title) to alias')
+        graph = template.graph
+        out, bypassed = {}, set()
+        for slot, value in loras.items():
+            node_ids = [str(slot)] if str(slot) in graph else template.by_title.get(str(slot).lower(), [])
+            node_ids = [n for n in node_ids if graph[n].get("class_type") == LORA_CLASS]
+            if not node_ids:
+                raise UnknownLoraError(f"No {LORA_CLASS} node with id or title '{slot}'")
+            if value is None:
+                bypassed.update(node_ids)
+                continue
+            spec = value if isinstance(value, dict) else {"alias": value}
+            entry = self.resolve(spec.get("alias"))
+            strength = spec.get("strength", entry["strength"])
+            for node_id in node_ids:
+                inputs = {"lora_name": entry["filename"]}
+                if strength is not None:
+                    inputs["strength_model"] = float(strength)
+                out[node_id] = inputs
+            print(f"[lora_registry] {slot} -> {entry['alias']} ({entry['filename']})"
+                  + (f" @ {strength}" if strength is not None else ""))
+
+        for node_id, inputs in bypass_overrides(graph, bypassed).items():
+            out.setdefault(node_id, {}).update(inputs)
+        for node_id in bypassed:
+            print(f"[lora_registry] {node_id} bypassed")
+        return out
+
+
+def bypass_overrides(graph, bypassed):
+    """Rewire every consumer of a bypassed LoRA node to that node's model input."""
+    def upstream(ref):
+        while ref[0] in bypassed:
+            ref = graph[ref[0]]["inputs"]["model"]
+        return list(ref)
+
+    out = {}
+    if not bypassed:
+        return out
+    for node_id, node in graph.items():
+        if not isinstance(node, dict) or node_id in bypassed:
+            continue
+        for name, value in node.get("inputs", {}).items():
+            if isinstance(value, list) and len(value) == 2 and value[0] in bypassed:
+                out.setdefault(node_id, {})[name] = upstream(value)
+    return out
+
+
+LORA_REGISTRY = LoraRegistry()
@@ -0,0 +1,319 @@
+"""
+Local disk cache for model files that live on the network volume.
+
+ComfyUI would otherwise read every diffusion model, text encoder, VAE and
+LoRA from /runpod-volume at network-FS speed on each cold start. At boot the
+default workflow is parsed for the model files it references (``lora_name``,
+``model_name``, ``clip_name``, ``vae_name``, ...), and those found on the
+volume are copied in parallel to MODEL_CACHE_DIR on the container's local
+disk:
+
+    MODEL_CACHE_DIR/<folder>/<name>   e.g. loras/foo.safetensors
+    MODEL_CACHE_DIR/index.json        {rel: {"size", "mtime", "sha256", "last_used"}}
+
+A cached copy is valid while its size and the source's size and mtime match
+the index. With MODEL_CACHE_VERIFY=sha256 it is also re-hashed once per
+process. Copies are written to a ``.part`` file and renamed, so ComfyUI
+never sees a half-copied model. Entries are evicted least recently used to
+stay within MODEL_CACHE_MAX_BYTES (and the disk's free space).
+
+``write_model_paths`` puts the cache first in extra_model_paths.yaml, ahead
+of the volume and the image's own models. A file that is not cached (too
+big for the budget, still copying, failed) is found on the volume instead.
+Jobs that reference uncached models have them copied in the background, so
+the next job on this worker reads them locally.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODEL_CACHE_ENABLED   = os.environ.get("MODEL_CACHE_ENABLED", "true").lower() == "true"
+MODEL_CACHE_DIR       = os.environ.get("MODEL_CACHE_DIR", "/model-cache")
+MODEL_CACHE_SOURCE    = os.environ.get("MODEL_CACHE_SOURCE", "/runpod-volume/models")
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", str(150 * 1024**3)))
+MODEL_CACHE_WORKERS   = int(os.environ.get("MODEL_CACHE_WORKERS", "4"))
+MODEL_CACHE_VERIFY    = os.environ.get("MODEL_CACHE_VERIFY", "size").lower()
+EXTRA_MODEL_PATHS_FILE = os.environ.get("EXTRA_MODEL_PATHS_FILE",
+                                        "/comfyui/ComfyUI/extra_model_paths.yaml")
+IMAGE_MODELS_DIR      = "/comfyui/models"
+
+# Left free on the cache disk for outputs and temp files.
+DISK_RESERVE_BYTES = 10 * 1024**3
+COPY_BLOCK = 16 * 1024 * 1024
+
+# Loader input name -> model folders it may be found in, in lookup order.
+MODEL_INPUTS = {
+    "lora_name":   ("loras",),
+    "model_name":  ("diffusion_models", "unet", "checkpoints", "upscale_models"),
+    "unet_name":   ("diffusion_models", "unet"),
+    "ckpt_name":   ("checkpoints",),
+    "clip_name":   ("text_encoders", "clip", "clip_vision"),
+    "clip_name1":  ("text_encoders", "clip"),
+    "clip_name2":  ("text_encoders", "clip"),
+    "clip_name3":  ("text_encoders", "clip"),
+    "vae_name":    ("vae",),
+    "control_net_name": ("controlnet",),
+}
+
+# Folders listed in the generated extra_model_paths.yaml.
+MODEL_FOLDERS = ("diffusion_models", "unet", "text_encoders", "clip", "vae",
+                 "clip_vision", "loras", "checkpoints", "controlnet", "upscale_models")
+
+
+def referenced_models(workflow):
+    """Sorted [(folders, filename)] of every model file a workflow loads."""
+    refs = set()
+    for node in workflow.values():
+        if not isinstance(node, dict):
+            continue
+        for key, value in (node.get("inputs") or {}).items():
+            if key in MODEL_INPUTS and isinstance(value, str) and value:
+                refs.add((MODEL_INPUTS[key], value))
+    return sorted(refs)
+
+
+class ModelCache:
+    def __init__(self, root=MODEL_CACHE_DIR, source=MODEL_CACHE_SOURCE,
+                 max_bytes=MODEL_CACHE_MAX_BYTES, workers=MODEL_CACHE_WORKERS):
+        self.root = root
+        self.source = source
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self._verified = set()
+        self._inflight = {}   # rel -> future of the running copy
+        self._reserved = {}   # rel -> bytes a running copy will add
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers),
+                                        thread_name_prefix="model-cache")
+        self.stats = {"hits": 0, "misses": 0, "fallbacks": 0, "evicted": 0,
+                      "bytes_prefetched": 0, "prefetch_seconds": 0.0}
+
+    @property
+    def enabled(self):
+        return MODEL_CACHE_ENABLED and os.path.isdir(self.source)
+
+    # ---- index ---------------------------------------------------------------
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._sweep_parts()
+        return self._index
+
+    def _sweep_parts(self):
+        """Drop partial copies left behind by a worker that died mid-copy."""
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if ".part-" in name:
+                    try:
+                        os.remove(os.path.join(dirpath, name))
+                    except OSError:
+                        pass
+
+    def _save_index(self):
+        tmp = f"{self.index_path}.tmp-{os.getpid()}"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"[model_cache] Could not write index: {e}")
+
+    # ---- lookup --------------------------------------------------------------
+
+    def locate(self, folders, name):
+        """Path of name relative to the volume's models dir, or None."""
+        for folder in folders:
+            rel = os.path.join(folder, name)
+            if os.path.isfile(os.path.join(self.source, rel)):
+                return rel
+        return None
+
+    def _valid(self, rel, src):
+        """Caller holds the lock. True if the cached copy matches src (a stat)."""
+        entry = self._load_index().get(rel)
+        path = os.path.join(self.root, rel)
+        if not entry or entry["size"] != src.st_size or entry["mtime"] != src.st_mtime:
+            return False
+        try:
+            if os.path.getsize(path) != src.st_size:
+                return False
+        except OSError:
+            return False
+        if MODEL_CACHE_VERIFY == "sha256" and rel not in self._verified:
+            if file_sha256(path) != entry.get("sha256"):
+                print(f"[model_cache] {rel}: hash mismatch, refetching")
+                return False
+            self._verified.add(rel)
+        return True
+
+    # ---- copying -------------------------------------------------------------
+
+    def _make_room(self, needed, keep):
+        """Caller holds the lock. Evict LRU entries not in keep; False if it can't fit."""
+        index = self._load_index()
+        os.makedirs(self.root, exist_ok=True)
+        free = shutil.disk_usage(self.root).free - DISK_RESERVE_BYTES
+        used = sum(e["size"] for e in index.values()) + sum(self._reserved.values())
+        for rel, entry in sorted(index.items(), key=lambda kv: kv[1]["last_used"]):
+            if used + needed <= self.max_bytes and needed <= free:
+                break
+            if rel in keep or rel in self._inflight:
+                continue
+            try:
+                os.remove(os.path.join(self.root, rel))
+            except OSError:
+                pass
+            del index[rel]
+            used -= entry["size"]
+            free += entry["size"]
+            self.stats["evicted"] += 1
+            print(f"[model_cache] Evicted {rel} ({entry['size'] / 1024**3:.1f} GB)")
+        return used + needed <= self.max_bytes and needed <= free
+
+    def _copy(self, rel):
+        src_path = os.path.join(self.source, rel)
+        dst_path = os.path.join(self.root, rel)
+        part = f"{dst_path}.part-{os.getpid()}"
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        start = time.perf_counter()
+        h = hashlib.sha256()
+        try:
+            with open(src_path, "rb") as src, open(part, "wb") as dst:
+                for block in iter(lambda: src.read(COPY_BLOCK), b""):
+                    h.update(block)
+                    dst.write(block)
+            shutil.copystat(src_path, part)
+            os.replace(part, dst_path)
+        except OSError:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            raise
+        seconds = time.perf_counter() - start
+        st = os.stat(src_path)
+        with self._lock:
+            self._load_index()[rel] = {"size": st.st_size, "mtime": st.st_mtime,
+                                       "sha256": h.hexdigest(), "last_used": time.time()}
+            self._verified.add(rel)
+            self._save_index()
+            self.stats["bytes_prefetched"] += st.st_size
+            self.stats["prefetch_seconds"] = round(self.stats["prefetch_seconds"] + seconds, 3)
+        print(f"[model_cache] Cached {rel}: {st.st_size / 1024**2:.0f} MB in {seconds:.1f}s "
+              f"({st.st_size / 1024**2 / max(seconds, 1e-6):.0f} MB/s)")
+        return rel
+
+    def _fetch(self, rel):
+        try:
+            return self._copy(rel)
+        except OSError as e:
+            print(f"[model_cache] Could not cache {rel}: {e}; ComfyUI reads it from the volume")
+            with self._lock:
+                self.stats["fallbacks"] += 1
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(rel, None)
+                self._reserved.pop(rel, None)
+
+    def _schedule(self, refs):
+        """
+        Count hits/misses for refs and start copies for the misses. Returns
+        the futures of copies started (or already running) for them.
+        """
+        located = []
+        for folders, name in refs:
+            rel = self.locate(folders, name)
+            if rel is not None:
+                located.append((rel, os.stat(os.path.join(self.source, rel))))
+        keep = {rel for rel, _ in located}
+        futures = []
+        with self._lock:
+            for rel, src in located:
+                if self._valid(rel, src):
+                    self.stats["hits"] += 1
+                    self._index[rel]["last_used"] = time.time()
+                    continue
+                self.stats["misses"] += 1
+                if rel not in self._inflight:
+                    if not self._make_room(src.st_size, keep):
+                        self.stats["fallbacks"] += 1
+                        print(f"[model_cache] {rel} does not fit the cache budget; "
+                              f"ComfyUI reads it from the volume")
+                        continue
+                    self._index.pop(rel, None)
+                    self._reserved[rel] = src.st_size
+                    self._inflight[rel] = self._pool.submit(self._fetch, rel)
+                futures.append(self._inflight[rel])
+            self._save_index()
+        return futures
+
+    def prefetch(self, workflow):
+        """Copy every model the workflow references; blocks until done. Returns stats."""
+        start = time.perf_counter()
+        before = self.snapshot()
+        refs = referenced_models(workflow)
+        for future in self._schedule(refs):
+            future.result()
+        stats = self.snapshot()
+        print(f"[model_cache] Prefetch of {len(refs)} model(s) done in "
+              f"{time.perf_counter() - start:.1f}s: {stats['hits'] - before['hits']} hit(s), "
+              f"{stats['misses'] - before['misses']} miss(es), "
+              f"{(stats['bytes_prefetched'] - before['bytes_prefetched']) / 1024**3:.1f} GB copied")
+        return stats
+
+    def record_use(self, workflow):
+        """
+        Per job: refresh LRU order for cached models and start background copies
+        for the rest. Returns (hits, misses) for this workflow.
+        """
+        before = self.snapshot()
+        self._schedule(referenced_models(workflow))
+        after = self.snapshot()
+        return after["hits"] - before["hits"], after["misses"] - before["misses"]
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return stats
+
+    # ---- ComfyUI configuration -----------------------------------------------
+
+    def write_model_paths(self, path=EXTRA_MODEL_PATHS_FILE):
+        """Write extra_model_paths.yaml: cache first, then the volume, then the image."""
+        sections = [("model_cache", self.root), ("runpod_volume", self.source),
+                    ("comfyui", IMAGE_MODELS_DIR)]
+        lines = ["# Written by model_cache.py at boot. ComfyUI uses the first match,",
+                 "# so cached copies win and the volume is the fallback."]
+        for name, base in sections:
+            lines.append(f"{name}:")
+            lines.append(f"  base_path: {base}")
+            lines += [f"  {folder}: {folder}" for folder in MODEL_FOLDERS]
+        os.makedirs(self.root, exist_ok=True)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"[model_cache] {path}: {self.root} -> {self.source} -> {IMAGE_MODELS_DIR}")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+MODEL_CACHE = ModelCache()
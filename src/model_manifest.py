@@ -0,0 +1,223 @@
+"""
+Persistent inventory of the model files on the network volume.
+
+Listing a models tree with thousands of LoRAs on a network filesystem costs
+one round trip per file, and the diagnostics, the boot preflight and
+tools/check_lora_sidecars.py each used to do it separately. Instead the tree
+is indexed once with ``os.scandir``, one directory level at a time and in
+parallel. The result is kept in a manifest:
+
+    {"root": "/runpod-volume/models", "dirs": {
+        "loras": {"mtime_ns": ..., "dirs": ["sub"],
+                  "files": {"a.safetensors": {"size": ..., "mtime": ..., "sha256": ...}}},
+        ...}}
+
+A refresh stats each known directory and only rescans the ones whose mtime
+changed. Adding, removing or renaming a file changes its directory's mtime,
+so an unchanged volume is revalidated with one stat per directory. A file
+rewritten in place under the same name does not change the mtime, so
+``refresh(full=True)`` rescans everything. ``refresh(folder="loras")``
+only revalidates that subtree. The sha256 of each file is only
+computed when ``hash_files`` is set (or MODEL_MANIFEST_HASH=true). It is kept
+while the file's size and mtime are unchanged.
+
+The manifest for MODEL_MANIFEST_ROOT is saved to MODEL_MANIFEST_PATH on the
+volume, so a new worker starts from the last worker's index. Other roots are
+indexed in memory only.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODEL_MANIFEST_ROOT    = os.environ.get("MODEL_MANIFEST_ROOT", "/runpod-volume/models")
+MODEL_MANIFEST_PATH    = os.environ.get("MODEL_MANIFEST_PATH", "/runpod-volume/cache/model_manifest.json")
+MODEL_MANIFEST_WORKERS = int(os.environ.get("MODEL_MANIFEST_WORKERS", "8"))
+MODEL_MANIFEST_HASH    = os.environ.get("MODEL_MANIFEST_HASH", "false").lower() == "true"
+
+HASH_BLOCK = 16 * 1024 * 1024
+
+
+class ModelManifest:
+    def __init__(self, root=MODEL_MANIFEST_ROOT, path=None, workers=MODEL_MANIFEST_WORKERS):
+        self.root = root.rstrip("/") or "/"
+        self.path = path
+        self.workers = max(1, workers)
+        self.dirs = {}
+        self.refreshed = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("root") == self.root:
+            self.dirs = data.get("dirs") or {}
+
+    def save(self):
+        # Like the other volume state, only written when the volume is mounted.
+        if not self.path or not os.path.isdir(os.path.dirname(os.path.dirname(self.path))):
+            return
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"root": self.root, "updated": time.time(), "dirs": self.dirs}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[manifest] Could not write {self.path}: {e}")
+
+    # ---- indexing ------------------------------------------------------------
+
+    def _scan(self, rel, full):
+        """(rel, entry or None, rescanned) for one directory."""
+        path = os.path.join(self.root, rel) if rel else self.root
+        old = self.dirs.get(rel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return rel, None, False
+        if old is not None and not full and old["mtime_ns"] == mtime_ns:
+            return rel, old, False
+
+        old_files = (old or {}).get("files", {})
+        files, dirs = {}, []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            dirs.append(entry.name)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    info = {"size": st.st_size, "mtime": st.st_mtime}
+                    prev = old_files.get(entry.name)
+                    if prev and prev.get("sha256") and prev["size"] == info["size"] \
+                            and prev["mtime"] == info["mtime"]:
+                        info["sha256"] = prev["sha256"]
+                    files[entry.name] = info
+        except OSError as e:
+            print(f"[manifest] Could not scan {path}: {e}")
+            return rel, None, True
+        return rel, {"mtime_ns": mtime_ns, "dirs": sorted(dirs), "files": files}, True
+
+    def refresh(self, full=False, hash_files=MODEL_MANIFEST_HASH, folder=""):
+        """
+        Bring the manifest up to date with the tree, or only with folder's
+        subtree; returns scan stats.
+        """
+        start = time.perf_counter()
+        folder = folder.strip("/")
+
+        def inside(rel):
+            return not folder or rel == folder or rel.startswith(folder + "/")
+
+        with self._lock:
+            kept = {rel: entry for rel, entry in self.dirs.items() if not inside(rel)}
+            new_dirs, rescanned = {}, 0
+            level = [folder]
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix="manifest") as pool:
+                while level:
+                    next_level = []
+                    for rel, entry, changed in pool.map(lambda r: self._scan(r, full), level):
+                        if entry is None:
+                            continue
+                        new_dirs[rel] = entry
+                        rescanned += changed
+                        next_level += [os.path.join(rel, d) if rel else d for d in entry["dirs"]]
+                    level = next_level
+                self.dirs = {**kept, **new_dirs}
+                hashed = self._hash_missing(pool) if hash_files else 0
+            if not folder:
+                self.refreshed = True
+            self.save()
+        stats = {"dirs": len(new_dirs), "dirs_rescanned": rescanned,
+                 "files": sum(len(d["files"]) for d in new_dirs.values()),
+                 "hashed": hashed, "seconds": round(time.perf_counter() - start, 3)}
+        where = os.path.join(self.root, folder) if folder else self.root
+        print(f"[manifest] {where}: {stats['files']} file(s) in {stats['dirs']} dir(s), "
+              f"{rescanned} rescanned, {hashed} hashed, {stats['seconds']:.2f}s")
+        return stats
+
+    def _hash_missing(self, pool):
+        todo = [(rel, name, info) for rel, entry in self.dirs.items()
+                for name, info in entry["files"].items() if "sha256" not in info]
+
+        def digest(item):
+            rel, name, info = item
+            h = hashlib.sha256()
+            try:
+                with open(os.path.join(self.root, rel, name), "rb") as f:
+                    for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                        h.update(block)
+            except OSError:
+                return 0
+            info["sha256"] = h.hexdigest()
+            return 1
+
+        return sum(pool.map(digest, todo))
+
+    def ensure(self):
+        """Refresh once per process; later calls reuse the in-memory index."""
+        if not self.refreshed:
+            self.refresh()
+        return self
+
+    # ---- queries -------------------------------------------------------------
+
+    def files(self, folder=""):
+        """{name relative to folder: info} for every file under folder."""
+        folder = folder.strip("/")
+        out = {}
+        for rel, entry in self.dirs.items():
+            if folder and rel != folder and not rel.startswith(folder + "/"):
+                continue
+            sub = rel[len(folder):].lstrip("/") if folder else rel
+            for name, info in entry["files"].items():
+                out[f"{sub}/{name}" if sub else name] = info
+        return out
+
+    def lookup(self, folder, name):
+        """Info for folder/name (name may contain subfolders), or None."""
+        rel, base = os.path.split(os.path.join(folder.strip("/"), name))
+        entry = self.dirs.get(rel)
+        return entry["files"].get(base) if entry else None
+
+    def has_folder(self, folder):
+        return folder.strip("/") in self.dirs
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def manifest_for(path):
+    """
+    (manifest, folder) for a directory: the persistent volume manifest when
+    path is inside MODEL_MANIFEST_ROOT, else an in-memory one rooted at path.
+    """
+    path = os.path.abspath(path)
+    root = os.path.abspath(MODEL_MANIFEST_ROOT)
+    if path == root or path.startswith(root + os.sep):
+        key, folder, store = root, os.path.relpath(path, root), MODEL_MANIFEST_PATH
+    else:
+        key, folder, store = path, "", None
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = ModelManifest(key, path=store)
+    return _manifests[key], "" if folder == "." else folder
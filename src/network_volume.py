@@ -3,10 +3,14 @@ Network Volume diagnostics for worker-comfyui.
 
 This module provides tools to debug network volume model path issues.
 Enable diagnostics by setting NETWORK_VOLUME_DEBUG=true environment variable.
+Model directories are listed from the model manifest (model_manifest.py), so
+an unchanged volume is not walked again.
 """
 
 import os
 
+from model_manifest import manifest_for
+
 # Expected model types and their file extensions
 MODEL_TYPES = {
     "checkpoints": [".safetensors", ".ckpt", ".pt", ".pth", ".bin"],
@@ -81,27 +85,21 @@ def run_network_volume_diagnostics():
     # List model directories and their contents
     print("\n[4] Scanning model directories...")
     found_any_models = False
+    manifest, base = manifest_for(models_dir)
+    manifest.ensure()
 
     for model_type, extensions in MODEL_TYPES.items():
-        model_path = os.path.join(models_dir, model_type)
-        if os.path.isdir(model_path):
+        folder = os.path.join(base, model_type) if base else model_type
+        if manifest.has_folder(folder):
             files = []
-            try:
-                for f in os.listdir(model_path):
-                    file_path = os.path.join(model_path, f)
-                    if os.path.isfile(file_path):
-                        # Check if file has valid extension
-                        ext = os.path.splitext(f)[1].lower()
-                        if ext in extensions:
-                            size = os.path.getsize(file_path)
-                            size_str = format_size(size)
-                            files.append(f"{f} ({size_str})")
-                            found_any_models = True
-                        else:
-                            files.append(f"{f} (⚠️ ignored - invalid extension)")
-            except Exception as e:
-                print(f"    {model_type}/: Error reading directory - {e}")
-                continue
+            for name, info in sorted(manifest.files(folder).items()):
+                # Check if file has valid extension
+                ext = os.path.splitext(name)[1].lower()
+                if ext in extensions:
+                    files.append(f"{name} ({format_size(info['size'])})")
+                    found_any_models = True
+                else:
+                    files.append(f"{name} (⚠️ ignored - invalid extension)")
 
             if files:
                 print(f"\n    {model_type}/:")
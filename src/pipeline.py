@@ -0,0 +1,121 @@
+"""
+Background work for a single job.
+
+The batch loop only has one thing on its critical path: handing the last
+frame of batch N to batch N+1. Chunk uploads and other post-processing are
+pushed onto a small thread pool so ComfyUI gets its next prompt as soon as
+possible.
+
+    with JobPipeline("job-123") as pipe:
+        fut = pipe.submit("upload batch 1", supabase_upload, path, name)
+        pipe.submit_after("cache batch 1", fut, remember, path)   # remember(path, url)
+        ...
+        pipe.raise_if_failed()   # fail fast before queueing more GPU work
+    # leaving the block joins everything and re-raises the first failure
+"""
+
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "3"))
+
+
+class PipelineError(RuntimeError):
+    """A background task failed; ``task`` names it, ``__cause__`` is the error."""
+
+    def __init__(self, task, error):
+        self.task = task
+        super().__init__(f"{task} failed: {error}")
+
+
+class JobPipeline:
+    def __init__(self, job_id, max_workers=PIPELINE_WORKERS):
+        self.job_id = job_id
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"pipe-{job_id}"
+        )
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, **kwargs):
+        fut = self._pool.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._tasks.append((name, fut))
+        return fut
+
+    def submit_after(self, name, dependency, fn, *args):
+        """
+        Run fn(*args, <dependency's result>) once dependency has succeeded.
+        Nothing holds a worker while it waits; the task is submitted from
+        dependency's done-callback. If dependency fails the task is
+        cancelled (the failure is reported by whoever ran dependency).
+        """
+        fut = Future()
+        with self._lock:
+            self._tasks.append((name, fut))
+
+        def finish(inner):
+            if inner.cancelled():
+                fut.set_exception(CancelledError(f"{name} was cancelled"))
+            elif inner.exception() is not None:
+                fut.set_exception(inner.exception())
+            else:
+                fut.set_result(inner.result())
+
+        def start(dep):
+            if dep.cancelled() or dep.exception() is not None:
+                fut.cancel()
+                return
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                inner = self._pool.submit(fn, *args, dep.result())
+            except RuntimeError as e:    # the pool has shut down
+                fut.set_exception(e)
+                return
+            inner.add_done_callback(finish)
+
+        dependency.add_done_callback(start)
+        return fut
+
+    def _first_failure(self):
+        with self._lock:
+            tasks = list(self._tasks)
+        for name, fut in tasks:
+            if fut.done() and not fut.cancelled() and fut.exception() is not None:
+                return name, fut.exception()
+        return None
+
+    def raise_if_failed(self):
+        """Raise PipelineError now if any finished task has failed."""
+        failure = self._first_failure()
+        if failure:
+            name, err = failure
+            raise PipelineError(name, err) from err
+
+    def join(self):
+        """Wait for every task; raise the first failure, cancelling the rest."""
+        with self._lock:
+            futures = [fut for _, fut in self._tasks]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        failure = self._first_failure()
+        if failure:
+            for fut in pending:
+                fut.cancel()
+            name, err = failure
+            raise PipelineError(name, err) from err
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.join()
+        finally:
+            self.shutdown()
+        return False
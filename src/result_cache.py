@@ -0,0 +1,168 @@
+"""
+Content-addressed cache of finished batches and jobs.
+
+Seeds are derived from the batch position, so a batch's output is fully
+determined by its patched graph and its input image. The cache key for a
+batch is therefore
+
+    sha256(canonical batch graph  +  key of whatever fed its LoadImage)
+
+where the first batch is fed by the digest of the job's input image and
+every later batch by the previous batch's key (its last frame is a pure
+function of that batch). All keys of a job can be computed before anything
+is queued, and the job key is derived from the chain.
+
+Entries live on the network volume so every worker shares them:
+
+    RESULT_CACHE_DIR/batches/<key>/chunk.mp4   local copy for handoff/stitch
+    RESULT_CACHE_DIR/batches/<key>/meta.json   {"url": ..., "size": ...}
+    RESULT_CACHE_DIR/jobs/<key>.json           {"final_video_url", "chunk_urls"}
+
+Batch entries are evicted least-recently-used once their total size exceeds
+RESULT_CACHE_MAX_BYTES. A hit refreshes the entry's meta.json mtime.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+RESULT_CACHE_DIR       = os.environ.get("RESULT_CACHE_DIR", "/runpod-volume/cache/results")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(50 * 1024**3)))
+RESULT_CACHE_ENABLED   = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+
+# Stands in for the LoadImage filename when hashing a graph: the real name
+# differs per upload, the image content is covered by the upstream key.
+IMAGE_PLACEHOLDER = "__cache_input__"
+# Likewise for the LoadLatent reference of a latent handoff.
+LATENT_PLACEHOLDER = "__cache_latent__"
+
+
+def canonical_hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, str)):
+            part = json.dumps(part, sort_keys=True, separators=(",", ":"))
+        if isinstance(part, str):
+            part = part.encode()
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.batch_dir = os.path.join(root, "batches")
+        self.job_dir = os.path.join(root, "jobs")
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        # Only cache when the volume (or whatever holds the root) is mounted;
+        # caching on the container disk would just be lost with the worker.
+        return RESULT_CACHE_ENABLED and os.path.isdir(os.path.dirname(self.root.rstrip("/")))
+
+    # ---- keys ----------------------------------------------------------------
+
+    @staticmethod
+    def batch_key(workflow, upstream_key):
+        return canonical_hash("batch", workflow, upstream_key)
+
+    @staticmethod
+    def job_key(batch_keys):
+        return canonical_hash("job", list(batch_keys))
+
+    # ---- batches -------------------------------------------------------------
+
+    def get_batch(self, key):
+        entry = os.path.join(self.batch_dir, key)
+        meta_path = os.path.join(entry, "meta.json")
+        chunk_path = os.path.join(entry, "chunk.mp4")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if os.path.getsize(chunk_path) != meta.get("size"):
+                return None
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return {"url": meta["url"], "path": chunk_path}
+
+    def put_batch(self, key, chunk_path, url):
+        entry = os.path.join(self.batch_dir, key)
+        if os.path.isdir(entry):
+            return
+        tmp = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            shutil.copyfile(chunk_path, os.path.join(tmp, "chunk.mp4"))
+            size = os.path.getsize(os.path.join(tmp, "chunk.mp4"))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"url": url, "size": size, "created": time.time()}, f)
+            os.rename(tmp, entry)
+        except OSError as e:
+            print(f"[cache] Could not store batch {key[:12]}: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    # ---- jobs ----------------------------------------------------------------
+
+    def get_job(self, key):
+        path = os.path.join(self.job_dir, f"{key}.json")
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put_job(self, key, final_url, chunk_urls):
+        os.makedirs(self.job_dir, exist_ok=True)
+        path = os.path.join(self.job_dir, f"{key}.json")
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"final_video_url": final_url, "chunk_urls": chunk_urls,
+                           "created": time.time()}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[cache] Could not store job {key[:12]}: {e}")
+
+    # ---- eviction ------------------------------------------------------------
+
+    def evict(self):
+        """Drop least-recently-used batch entries until under max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            try:
+                it = os.scandir(self.batch_dir)
+            except OSError:
+                return 0
+            with it:
+                for d in it:
+                    if not d.is_dir() or ".tmp-" in d.name:
+                        continue
+                    try:
+                        meta = os.stat(os.path.join(d.path, "meta.json"))
+                        size = os.stat(os.path.join(d.path, "chunk.mp4")).st_size
+                    except OSError:
+                        continue
+                    entries.append((meta.st_mtime, size, d.path))
+                    total += size
+            freed = 0
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                freed += size
+            if freed:
+                print(f"[cache] Evicted {freed/1024/1024:.1f} MB of cached batches")
+            return freed
@@ -0,0 +1,368 @@
+"""
+Resumable uploads to Supabase Storage (TUS protocol).
+
+Supabase exposes a TUS 1.0.0 endpoint at ``/storage/v1/upload/resumable``.
+Instead of one long ``POST`` that restarts from byte 0 on any failure, files
+are created with a TUS ``POST`` and then sent in ``PATCH`` chunks. After a
+failed chunk we ``HEAD`` the upload to learn the last acknowledged offset and
+continue from there.
+
+If the server advertises the TUS ``concatenation`` extension, the file is
+split into partial uploads that are sent concurrently and then stitched with
+a final concatenation request. Supabase does not currently advertise it, in
+which case chunks go out sequentially; concurrency then comes from several
+files uploading at once over the shared connection pool.
+
+Small files skip TUS entirely and use a single ``POST`` on the pooled session.
+
+Files that are still growing (the incremental fMP4 final) can be streamed
+with ``open_stream``: when the server supports ``creation-defer-length``
+every complete chunk is sent as soon as it exists on disk and only the tail
+is left for ``finish``.
+"""
+
+import base64
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TUS_VERSION = "1.0.0"
+
+# Supabase requires every PATCH except the last to be exactly 6 MiB.
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+
+# Below this size a single POST is faster than the TUS handshake.
+UPLOAD_SIMPLE_MAX_BYTES = int(os.environ.get("UPLOAD_SIMPLE_MAX_BYTES", str(TUS_CHUNK_SIZE)))
+UPLOAD_MAX_WORKERS      = int(os.environ.get("UPLOAD_MAX_WORKERS", "4"))
+UPLOAD_MAX_RETRIES      = int(os.environ.get("UPLOAD_MAX_RETRIES", "5"))
+UPLOAD_RETRY_DELAY_S    = float(os.environ.get("UPLOAD_RETRY_DELAY_S", "2"))
+
+# Seconds CDNs and browsers may cache an uploaded object (Cache-Control max-age).
+CACHE_CONTROL_S = "3600"
+
+# Partial-upload sizing for servers with the concatenation extension.
+MIN_PART_SIZE = TUS_CHUNK_SIZE
+MAX_PART_SIZE = 16 * TUS_CHUNK_SIZE
+
+
+class UploadResult:
+    """What an upload achieved; ``mbps`` is megabytes per second."""
+
+    def __init__(self, url, size, seconds, mode):
+        self.url = url
+        self.size = size
+        self.seconds = seconds
+        self.mode = mode
+
+    @property
+    def mbps(self):
+        return (self.size / 1024 / 1024) / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "url": self.url,
+            "bytes": self.size,
+            "seconds": round(self.seconds, 3),
+            "mb_per_s": round(self.mbps, 2),
+            "mode": self.mode,
+        }
+
+
+def choose_part_size(file_size, workers=UPLOAD_MAX_WORKERS):
+    """Split a file into roughly one part per worker, in whole TUS chunks."""
+    target = max(MIN_PART_SIZE, min(MAX_PART_SIZE, file_size // max(1, workers)))
+    return -(-target // TUS_CHUNK_SIZE) * TUS_CHUNK_SIZE
+
+
+def _encode_metadata(meta):
+    return ",".join(
+        f"{k} {base64.b64encode(str(v).encode()).decode()}" for k, v in meta.items()
+    )
+
+
+class ResumableUploader:
+    """
+    Upload engine bound to one Supabase project/bucket.
+
+    A single instance is shared by the whole worker so TCP/TLS connections
+    are reused across chunks, files and jobs.
+    """
+
+    def __init__(self, base_url, api_key, bucket, max_workers=UPLOAD_MAX_WORKERS):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.tus_endpoint = f"{self.base_url}/storage/v1/upload/resumable"
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(8, max_workers * 2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._extensions = None
+        # (remote_filename, size) -> TUS upload URL, so a retried call resumes.
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # ---- public API --------------------------------------------------------
+
+    def public_url(self, remote_filename):
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{remote_filename}"
+
+    def upload(self, local_path, remote_filename, content_type="video/mp4",
+               cache_control=CACHE_CONTROL_S):
+        size = os.path.getsize(local_path)
+        start = time.time()
+        if size <= UPLOAD_SIMPLE_MAX_BYTES:
+            self._simple_upload(local_path, remote_filename, content_type, cache_control)
+            mode = "simple"
+        elif "concatenation" in self.server_extensions():
+            self._concat_upload(local_path, remote_filename, content_type, size, cache_control)
+            mode = "tus-parallel"
+        else:
+            self._tus_upload(local_path, remote_filename, content_type, size, cache_control)
+            mode = "tus"
+        result = UploadResult(self.public_url(remote_filename), size,
+                              time.time() - start, mode)
+        print(f"[upload] {remote_filename}: {size/1024/1024:.1f} MB in "
+              f"{result.seconds:.1f}s ({result.mbps:.1f} MB/s, {mode})")
+        return result
+
+    def open_stream(self, remote_filename, content_type="video/mp4"):
+        return StreamingUpload(self, remote_filename, content_type)
+
+    def server_extensions(self):
+        if self._extensions is None:
+            try:
+                r = self.session.options(self.tus_endpoint, headers=self._headers(), timeout=10)
+                ext = r.headers.get("Tus-Extension", "")
+                self._extensions = {e.strip() for e in ext.split(",") if e.strip()}
+            except requests.RequestException:
+                self._extensions = set()
+        return self._extensions
+
+    # ---- request helpers ---------------------------------------------------
+
+    def _headers(self, extra=None):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Tus-Resumable": TUS_VERSION,
+            "x-upsert": "true",
+        }
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def _simple_upload(self, local_path, remote_filename, content_type,
+                       cache_control=CACHE_CONTROL_S):
+        url = f"{self.base_url}/storage/v1/object/{self.bucket}/{remote_filename}"
+        with open(local_path, "rb") as f:
+            resp = self.session.post(
+                url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": content_type,
+                    "Cache-Control": f"max-age={cache_control}",
+                    "x-upsert": "true",
+                },
+                data=f,
+                timeout=300,
+            )
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"Supabase upload failed {resp.status_code}: {resp.text}")
+
+    def _create(self, remote_filename, content_type, length, concat=None,
+                cache_control=CACHE_CONTROL_S):
+        headers = {
+            "Upload-Length": str(length),
+            "Upload-Metadata": _encode_metadata({
+                "bucketName": self.bucket,
+                "objectName": remote_filename,
+                "contentType": content_type,
+                "cacheControl": cache_control,
+            }),
+        }
+        if length is None:
+            headers.pop("Upload-Length")
+            headers["Upload-Defer-Length"] = "1"
+        if concat:
+            headers["Upload-Concat"] = concat
+            if concat != "partial":
+                headers.pop("Upload-Length")
+        resp = self.session.post(self.tus_endpoint, headers=self._headers(headers), timeout=30)
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"TUS create failed {resp.status_code}: {resp.text}")
+        location = resp.headers.get("Location")
+        if not location:
+            raise RuntimeError("TUS create returned no Location header")
+        return requests.compat.urljoin(self.tus_endpoint + "/", location)
+
+    def _terminate(self, upload_url):
+        resp = self.session.delete(upload_url, headers=self._headers(), timeout=30)
+        if resp.status_code not in (204, 404, 410):
+            raise RuntimeError(f"TUS terminate failed {resp.status_code}: {resp.text}")
+
+    def _offset(self, upload_url):
+        resp = self.session.head(upload_url, headers=self._headers(), timeout=30)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return int(resp.headers.get("Upload-Offset", "0"))
+
+    def _send_range(self, upload_url, local_path, start, end, offset=None,
+                    declare_length=None):
+        """
+        PATCH bytes [start, end) of local_path to upload_url, resuming from
+        the server's acknowledged offset after any failure. ``offset`` is
+        relative to ``start`` (partial uploads begin at 0). ``declare_length``
+        is sent with the first PATCH of a deferred-length upload; if every
+        byte is already on the server it goes out on an empty PATCH.
+        """
+        offset = 0 if offset is None else offset
+        length = end - start
+        attempts = 0
+        with open(local_path, "rb") as f:
+            while offset < length or declare_length is not None:
+                f.seek(start + offset)
+                chunk = f.read(min(TUS_CHUNK_SIZE, length - offset))
+                extra = {
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream",
+                }
+                if declare_length is not None:
+                    extra["Upload-Length"] = str(declare_length)
+                try:
+                    resp = self.session.patch(
+                        upload_url,
+                        headers=self._headers(extra),
+                        data=chunk,
+                        timeout=120,
+                    )
+                    if resp.status_code != 204:
+                        raise RuntimeError(f"TUS PATCH failed {resp.status_code}: {resp.text}")
+                    offset = int(resp.headers.get("Upload-Offset", offset + len(chunk)))
+                    attempts = 0
+                    declare_length = None
+                except (requests.RequestException, RuntimeError) as e:
+                    attempts += 1
+                    if attempts > UPLOAD_MAX_RETRIES:
+                        raise
+                    print(f"[upload] chunk at {offset} failed ({e}); "
+                          f"retry {attempts}/{UPLOAD_MAX_RETRIES}")
+                    time.sleep(UPLOAD_RETRY_DELAY_S)
+                    acked = self._offset(upload_url)
+                    if acked is None:
+                        raise RuntimeError(f"TUS upload {upload_url} expired on server")
+                    offset = acked
+
+    # ---- strategies --------------------------------------------------------
+
+    def _tus_upload(self, local_path, remote_filename, content_type, size,
+                    cache_control=CACHE_CONTROL_S):
+        key = (remote_filename, size)
+        with self._lock:
+            upload_url = self._pending.get(key)
+        offset = None
+        if upload_url:
+            offset = self._offset(upload_url)
+            if offset is not None:
+                print(f"[upload] Resuming {remote_filename} at {offset}/{size} bytes")
+        if offset is None:
+            upload_url = self._create(remote_filename, content_type, size,
+                                      cache_control=cache_control)
+            with self._lock:
+                self._pending[key] = upload_url
+        self._send_range(upload_url, local_path, 0, size, offset)
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _concat_upload(self, local_path, remote_filename, content_type, size,
+                       cache_control=CACHE_CONTROL_S):
+        part_size = choose_part_size(size, self.max_workers)
+        ranges = [(s, min(s + part_size, size)) for s in range(0, size, part_size)]
+
+        def send_part(rng):
+            start, end = rng
+            url = self._create(remote_filename, content_type, end - start, concat="partial",
+                               cache_control=cache_control)
+            self._send_range(url, local_path, start, end)
+            return url
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            part_urls = list(pool.map(send_part, ranges))
+        self._create(remote_filename, content_type, size,
+                     concat="final;" + " ".join(part_urls), cache_control=cache_control)
+
+
+class StreamingUpload:
+    """
+    Upload of a file that is still being appended to.
+
+    ``push`` sends every complete 6 MiB chunk currently on disk; ``finish``
+    sends the rest and declares the final length, ``abort`` drops what was
+    sent. Without server support for
+    deferred lengths ``push`` is a no-op and ``finish`` does a normal upload.
+    """
+
+    def __init__(self, uploader, remote_filename, content_type):
+        self.uploader = uploader
+        self.remote_filename = remote_filename
+        self.content_type = content_type
+        self.upload_url = None
+        self.sent = 0
+        self.started = time.time()
+        self.enabled = "creation-defer-length" in uploader.server_extensions()
+        self._lock = threading.Lock()
+
+    def push(self, local_path):
+        if not self.enabled:
+            return self.sent
+        with self._lock:
+            size = os.path.getsize(local_path)
+            ready = (size // TUS_CHUNK_SIZE) * TUS_CHUNK_SIZE
+            if ready <= self.sent:
+                return self.sent
+            if self.upload_url is None:
+                self.upload_url = self.uploader._create(
+                    self.remote_filename, self.content_type, None
+                )
+            self.uploader._send_range(self.upload_url, local_path, 0, ready, self.sent)
+            self.sent = ready
+            return self.sent
+
+    def abort(self):
+        """Delete the half-sent upload, e.g. when the file is rebuilt another way."""
+        with self._lock:
+            if self.upload_url is None:
+                return
+            try:
+                self.uploader._terminate(self.upload_url)
+            except (requests.RequestException, RuntimeError) as e:
+                print(f"[upload] WARNING: could not cancel {self.remote_filename}: {e}")
+            self.upload_url = None
+            self.sent = 0
+
+    def finish(self, local_path):
+        if not self.enabled:
+            return self.uploader.upload(local_path, self.remote_filename, self.content_type)
+        with self._lock:
+            size = os.path.getsize(local_path)
+            if self.upload_url is None:
+                self.upload_url = self.uploader._create(
+                    self.remote_filename, self.content_type, size
+                )
+                self.uploader._send_range(self.upload_url, local_path, 0, size, 0)
+            else:
+                self.uploader._send_range(self.upload_url, local_path, 0, size,
+                                          self.sent, declare_length=size)
+            self.sent = size
+        result = UploadResult(self.uploader.public_url(self.remote_filename), size,
+                              time.time() - self.started, "tus-stream")
+        print(f"[upload] {self.remote_filename}: streamed {size/1024/1024:.1f} MB "
+              f"(finished {result.seconds:.1f}s after first byte was ready)")
+        return result
@@ -0,0 +1,322 @@
+"""
+Per-job timing spans and a process-wide metrics surface.
+
+Each job gets a ``JobTimings``. The handler wraps the interesting stages:
+
+    with timings.span("handoff", batch=3):
+        ...
+    pipeline.submit("batch 3 upload", timings.timed("upload", supabase_upload_with_stats, batch=3), ...)
+
+Stage names are low-cardinality ("submit", "upload", "ffmpeg_concat", ...);
+anything identifying goes into the span's attributes. ComfyUI execution
+events are fed in through ``comfy_event`` (the ComfyEventStream ``on_event``
+hook) and turned into queue wait, execution time and per-node times for every
+prompt registered with ``watch_prompt``.
+
+When the job ends ``finish`` returns the ``timings`` dict for the job result,
+appends every span as one JSON line to TIMINGS_JSONL_PATH, and folds the spans
+into ``METRICS``. If METRICS_PROM_PATH is set, the registry is rewritten there
+in Prometheus text format after each job (node-exporter textfile style).
+
+The cold-start report from boot.py is handed over with ``record_boot``: its
+phases go into ``METRICS`` as ``boot_*`` stages and the first job to finish
+carries the whole report as ``cold_start``.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TIMINGS_JSONL_PATH = os.environ.get("TIMINGS_JSONL_PATH", "/runpod-volume/logs/timings.jsonl")
+METRICS_PROM_PATH  = os.environ.get("METRICS_PROM_PATH", "")
+
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class MetricsRegistry:
+    """Latency histograms per stage and byte/second counters per transfer kind."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._hist = {}       # stage -> [bucket counts..., +Inf count, sum]
+        self._bytes = {}      # kind -> bytes
+        self._seconds = {}    # kind -> seconds spent moving those bytes
+        self._jobs = {}       # status -> count
+        self._counters = {}   # name -> count
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self._hist.setdefault(stage, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[len(self.buckets)] += 1
+            hist[-1] += seconds
+
+    def transfer(self, kind, nbytes, seconds):
+        with self._lock:
+            self._bytes[kind] = self._bytes.get(kind, 0) + nbytes
+            self._seconds[kind] = self._seconds.get(kind, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def job_done(self, status):
+        with self._lock:
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP worker_stage_seconds Time spent in each handler stage.",
+                "# TYPE worker_stage_seconds histogram",
+            ]
+            for stage in sorted(self._hist):
+                hist = self._hist[stage]
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f'worker_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {hist[i]}')
+                count = hist[len(self.buckets)]
+                lines.append(f'worker_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'worker_stage_seconds_sum{{stage="{stage}"}} {hist[-1]:.6f}')
+                lines.append(f'worker_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines += [
+                "# HELP worker_transfer_bytes_total Bytes moved, by transfer kind.",
+                "# TYPE worker_transfer_bytes_total counter",
+            ]
+            lines += [f'worker_transfer_bytes_total{{kind="{k}"}} {v}'
+                      for k, v in sorted(self._bytes.items())]
+            lines += [
+                "# HELP worker_transfer_seconds_total Seconds spent moving those bytes.",
+                "# TYPE worker_transfer_seconds_total counter",
+            ]
+            lines += [f'worker_transfer_seconds_total{{kind="{k}"}} {v:.6f}'
+                      for k, v in sorted(self._seconds.items())]
+            lines += [
+                "# HELP worker_jobs_total Finished jobs, by status.",
+                "# TYPE worker_jobs_total counter",
+            ]
+            lines += [f'worker_jobs_total{{status="{k}"}} {v}' for k, v in sorted(self._jobs.items())]
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE worker_{name}_total counter", f"worker_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        path = path or METRICS_PROM_PATH
+        if not path:
+            return
+        tmp = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[timings] Could not write metrics to {path}: {e}")
+
+
+METRICS = MetricsRegistry()
+
+_jsonl_lock = threading.Lock()
+
+_boot_lock = threading.Lock()
+_boot_report = None
+
+
+def record_boot(report):
+    """Fold boot.py's phase timings into METRICS and keep them for the first job."""
+    global _boot_report
+    for phase, seconds in report["phases"].items():
+        METRICS.observe(f"boot_{phase}", seconds)
+    METRICS.observe("boot_total", report["total_seconds"])
+    with _boot_lock:
+        _boot_report = report
+    METRICS.dump()
+
+
+def take_boot_report():
+    """The cold-start report, once; None afterwards."""
+    global _boot_report
+    with _boot_lock:
+        report, _boot_report = _boot_report, None
+    return report
+
+
+class JobTimings:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.transfers = []
+        self.prompts = {}     # prompt_id -> per-prompt execution record
+
+    # ---- spans ---------------------------------------------------------------
+
+    def add(self, stage, seconds, start=None, error=None, **attrs):
+        """Record an already measured span; start is a perf_counter value."""
+        span = {
+            "stage": stage,
+            "start_s": round((start if start is not None else time.perf_counter() - seconds)
+                             - self._t0, 3),
+            "seconds": round(seconds, 3),
+        }
+        if attrs:
+            span["attrs"] = attrs
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            self.add(stage, time.perf_counter() - start, start, error=e, **attrs)
+            raise
+        self.add(stage, time.perf_counter() - start, start, **attrs)
+
+    def timed(self, stage, fn, **attrs):
+        """Wrap fn so each call is recorded as a span (for pipeline tasks)."""
+        def run(*args, **kwargs):
+            with self.span(stage, **attrs):
+                return fn(*args, **kwargs)
+        return run
+
+    def transfer(self, kind, nbytes, seconds, **attrs):
+        """Record bytes moved (uploads, downloads) for throughput reporting."""
+        entry = {"kind": kind, "bytes": nbytes, "seconds": round(seconds, 3),
+                 "mb_per_s": round(nbytes / 1024 / 1024 / seconds, 2) if seconds > 0 else 0.0}
+        if attrs:
+            entry["attrs"] = attrs
+        with self._lock:
+            self.transfers.append(entry)
+
+    # ---- ComfyUI execution events --------------------------------------------
+
+    def watch_prompt(self, prompt_id, label, graph=None):
+        """Start tracking prompt_id (call right after it is queued)."""
+        with self._lock:
+            self.prompts[prompt_id] = {
+                "label": label,
+                "queued": time.perf_counter(),
+                "classes": {k: v.get("class_type") for k, v in (graph or {}).items()
+                            if isinstance(v, dict)},
+                "started": None, "finished": None,
+                "current": None, "nodes": [], "cached": 0,
+            }
+
+    def comfy_event(self, msg_type, data):
+        """ComfyEventStream on_event hook."""
+        now = time.perf_counter()
+        with self._lock:
+            rec = self.prompts.get(data.get("prompt_id"))
+            if rec is None:
+                return
+            if msg_type == "execution_start":
+                rec["started"] = now
+            elif msg_type == "execution_cached":
+                rec["cached"] += len(data.get("nodes") or [])
+            elif msg_type == "executing":
+                self._close_node(rec, now)
+                if rec["started"] is None:
+                    rec["started"] = now
+                node = data.get("node")
+                if node is None:
+                    rec["finished"] = now
+                else:
+                    rec["current"] = (str(node), now)
+            elif msg_type in ("execution_success", "execution_error", "execution_interrupted"):
+                self._close_node(rec, now)
+                rec["finished"] = rec["finished"] or now
+
+    @staticmethod
+    def _close_node(rec, now):
+        if rec["current"] is not None:
+            node, since = rec["current"]
+            rec["nodes"].append((node, now - since))
+            rec["current"] = None
+
+    def _prompt_summary(self, rec):
+        out = {"label": rec["label"], "cached_nodes": rec["cached"]}
+        if rec["started"] is not None:
+            out["queue_wait_s"] = round(rec["started"] - rec["queued"], 3)
+        if rec["started"] is not None and rec["finished"] is not None:
+            out["execution_s"] = round(rec["finished"] - rec["started"], 3)
+        nodes = {}
+        for node, seconds in rec["nodes"]:
+            nodes[node] = nodes.get(node, 0.0) + seconds
+        out["nodes"] = [
+            {"id": node, "class_type": rec["classes"].get(node), "seconds": round(seconds, 3)}
+            for node, seconds in sorted(nodes.items(), key=lambda kv: -kv[1])
+        ]
+        return out
+
+    # ---- results -------------------------------------------------------------
+
+    def summary(self):
+        with self._lock:
+            spans = list(self.spans)
+            transfers = list(self.transfers)
+            prompts = {pid: self._prompt_summary(rec) for pid, rec in self.prompts.items()}
+        stages = {}
+        for span in spans:
+            agg = stages.setdefault(span["stage"], {"count": 0, "seconds": 0.0})
+            agg["count"] += 1
+            agg["seconds"] = round(agg["seconds"] + span["seconds"], 3)
+        return {
+            "total_seconds": round(time.perf_counter() - self._t0, 3),
+            "stages": stages,
+            "spans": spans,
+            "transfers": transfers,
+            "prompts": prompts,
+        }
+
+    def finish(self, status="success"):
+        """Summary for the job result; also logs JSONL and updates METRICS."""
+        summary = self.summary()
+        for span in summary["spans"]:
+            METRICS.observe(span["stage"], span["seconds"])
+        for prompt in summary["prompts"].values():
+            if "queue_wait_s" in prompt:
+                METRICS.observe("comfy_queue_wait", prompt["queue_wait_s"])
+            if "execution_s" in prompt:
+                METRICS.observe("comfy_execution", prompt["execution_s"])
+        for t in summary["transfers"]:
+            METRICS.transfer(t["kind"], t["bytes"], t["seconds"])
+        METRICS.job_done(status)
+        cold_start = take_boot_report()
+        if cold_start:
+            summary["cold_start"] = cold_start
+        self._write_jsonl(summary, status)
+        METRICS.dump()
+        return summary
+
+    def _write_jsonl(self, summary, status):
+        path = TIMINGS_JSONL_PATH
+        if not path or not os.path.isdir(os.path.dirname(os.path.dirname(path.rstrip("/")))):
+            return
+        base = {"job_id": self.job_id, "ts": self.started}
+        lines = [dict(base, type="span", **span) for span in summary["spans"]]
+        lines += [dict(base, type="transfer", **t) for t in summary["transfers"]]
+        lines += [dict(base, type="prompt", prompt_id=pid, **p)
+                  for pid, p in summary["prompts"].items()]
+        if "cold_start" in summary:
+            lines.append(dict(base, type="boot", **summary["cold_start"]))
+        lines.append(dict(base, type="job", status=status,
+                          total_seconds=summary["total_seconds"], stages=summary["stages"]))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with _jsonl_lock, open(path, "a") as f:
+                for line in lines:
+                    f.write(json.dumps(line, separators=(",", ":")) + "\n")
+        except OSError as e:
+            print(f"[timings] Could not append to {path}: {e}")
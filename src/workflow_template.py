@@ -0,0 +1,428 @@
+"""
+Compiled workflow templates.
+
+A ComfyUI API-format workflow is parsed and indexed once (by node id,
+class_type and title) and cached by a hash of its content. Each batch graph
+is then produced from a precomputed patch plan: the new graph shares every
+untouched node with the template and only the nodes that actually change are
+copied.
+
+Which node inputs a batch changes is described by a declarative mapping
+rather than hard-coded ids. A mapping is a plain dict (so it can also arrive
+as JSON in the job payload):
+
+    {
+      "image":  [<target>, ...],        LoadImage-style inputs
+      "steps":  [<target>, ...],        sampler step counts
+      "seeds":  [<target> + {"base": 43}, ...],
+      "output": <selector> + {"images": .., "frame_rate": .., "prefix": ..},
+      "scenes": [<scene>, ...]          in chaining order
+    }
+
+A selector picks nodes by ``{"id": "204"}``, ``{"class_type": "LoadImage"}``
+or ``{"title": "HIGH Lora 5"}``; a target is a selector plus the ``"input"``
+to write. A scene names its ``prompt``, ``negative`` and ``length`` targets,
+and optionally the pieces needed to chain it onto the previous scene:
+``motion`` (motion_latent_count), ``prev_samples``, ``latent_out``,
+``images_out`` and an ``extend`` node that merges the previous scene's
+frames with its own. Scenes that a batch doesn't use are dropped by their
+``group`` id prefix.
+
+A batch may chain more scenes than the mapping lists. The last scene's
+group is then cloned once per extra scene (``203:218`` -> ``203.3:218``).
+Its references inside the group are rewired to the clone, and the
+per-scene RandomNoise it draws from is cloned as well, with the seed base
+continuing the mapping's sequence. The clones chain onto each other through
+the same ``prev_samples`` / ``extend`` wiring as the listed scenes. So
+scene k gets the same seed whichever batch it lands in, and one prompt can
+render any number of scenes.
+
+With latent handoff, consecutive batches chain the same way across prompts.
+A batch that has a successor saves its last scene's ``latent_out`` with
+SaveLatent. The next batch loads that file with LoadLatent into its first
+scene's ``prev_samples`` (``motion`` 1), while the anchor image stays the
+job's source image. The first frames of that scene re-render the previous
+batch's tail, so they are cut with ImageFromBatch: as many as the mapping's
+first ``extend`` node overlaps. This needs a first scene with
+``prev_samples`` and a ``latent_out`` on every scene.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# The default /workflow.json: Wan 2.2 SVI Pro, three chained scenes.
+WAN_SVI_MAPPING = {
+    "image": [{"class_type": "LoadImage", "input": "image"}],
+    "steps": [{"class_type": "BasicScheduler", "input": "steps"}],
+    "seeds": [
+        {"id": "189", "input": "noise_seed", "base": 43},
+        {"id": "182", "input": "noise_seed", "base": 44},
+        {"id": "199", "input": "noise_seed", "base": 45},
+    ],
+    "output": {"id": "204", "images": "images", "frame_rate": "frame_rate",
+               "prefix": "filename_prefix"},
+    "scenes": [
+        {
+            "group": "193:",
+            "prompt": {"id": "193:211", "input": "text"},
+            "negative": {"id": "193:209", "input": "text"},
+            "length": {"id": "193:215", "input": "length"},
+            "motion": {"id": "193:215", "input": "motion_latent_count"},
+            "prev_samples": {"id": "193:215", "input": "prev_samples"},
+            "latent_out": ["193:216", 0],
+            "images_out": ["193:217", 0],
+        },
+        {
+            "group": "181:",
+            "prompt": {"id": "181:152", "input": "text"},
+            "negative": {"id": "181:206", "input": "text"},
+            "length": {"id": "181:160", "input": "length"},
+            "motion": {"id": "181:160", "input": "motion_latent_count"},
+            "prev_samples": {"id": "181:160", "input": "prev_samples"},
+            "latent_out": ["181:208", 0],
+            "images_out": ["181:162", 0],
+            "extend": {"id": "181:168", "source": "source_images", "new": "new_images"},
+        },
+        {
+            "group": "203:",
+            "prompt": {"id": "203:222", "input": "text"},
+            "negative": {"id": "203:220", "input": "text"},
+            "length": {"id": "203:219", "input": "length"},
+            "motion": {"id": "203:219", "input": "motion_latent_count"},
+            "prev_samples": {"id": "203:219", "input": "prev_samples"},
+            "latent_out": ["203:226", 0],
+            "images_out": ["203:218", 0],
+            "extend": {"id": "203:227", "source": "source_images", "new": "new_images"},
+        },
+    ],
+}
+
+# workflows/wan_i2v_LOCKED.json (WanVideoWrapper, single scene). The file in
+# the repo is in UI format; export it with "Save (API Format)" to use it.
+WAN_I2V_LOCKED_MAPPING = {
+    "image": [{"class_type": "LoadImage", "input": "image"}],
+    "steps": [{"class_type": "WanVideoSampler", "input": "steps"}],
+    "seeds": [{"class_type": "WanVideoSampler", "input": "seed", "base": 47}],
+    "output": {"class_type": "VHS_VideoCombine", "frame_rate": "frame_rate",
+               "prefix": "filename_prefix"},
+    "scenes": [
+        {
+            "prompt": {"class_type": "WanVideoTextEncode", "input": "positive_prompt"},
+            "negative": {"class_type": "WanVideoTextEncode", "input": "negative_prompt"},
+            "length": {"class_type": "WanVideoEmptyEmbeds", "input": "num_frames"},
+        },
+    ],
+}
+
+DEFAULT_MAPPING = WAN_SVI_MAPPING
+
+# Nodes added to a batch graph for latent handoff.
+LATENT_SAVE_ID = "handoff_save"
+LATENT_LOAD_ID = "handoff_load"
+LATENT_TRIM_ID = "handoff_trim"
+
+# Params whose ops (and added nodes) are skipped when they are None.
+OPTIONAL_PARAMS = ("image", "steps", "prev_latent", "latent_prefix")
+
+
+def workflow_hash(workflow):
+    canonical = json.dumps(workflow, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class WorkflowTemplate:
+    """An indexed, read-only API-format workflow. Never mutate ``graph``."""
+
+    def __init__(self, workflow, content_hash=None):
+        if "nodes" in workflow and "links" in workflow:
+            raise ValueError(
+                "Workflow is in ComfyUI UI format; export it with 'Save (API Format)'."
+            )
+        self.graph = workflow
+        self.hash = content_hash or workflow_hash(workflow)
+        self.by_class = {}
+        self.by_title = {}
+        for node_id, node in workflow.items():
+            if not isinstance(node, dict):
+                continue
+            self.by_class.setdefault(node.get("class_type"), []).append(node_id)
+            title = node.get("_meta", {}).get("title", "")
+            self.by_title.setdefault(title.lower(), []).append(node_id)
+        self.clones = {}     # node id -> ids of its copies (expanded templates only)
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def select(self, selector):
+        """Node ids matched by a selector dict, in workflow order."""
+        if "id" in selector:
+            node_id = str(selector["id"])
+            return [node_id] if node_id in self.graph else []
+        if "class_type" in selector:
+            return list(self.by_class.get(selector["class_type"], []))
+        if "title" in selector:
+            return list(self.by_title.get(selector["title"].lower(), []))
+        raise ValueError(f"Selector needs id, class_type or title: {selector}")
+
+    def plan(self, num_scenes, mapping=None):
+        """Compiled PatchPlan for this many chained scenes (cached)."""
+        mapping = mapping or DEFAULT_MAPPING
+        key = (num_scenes, json.dumps(mapping, sort_keys=True))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                if num_scenes > len(mapping.get("scenes") or []):
+                    graph, mapping, clones = expand_scenes(self.graph, mapping, num_scenes)
+                    expanded = WorkflowTemplate(graph)
+                    expanded.clones = clones
+                    plan = PatchPlan(expanded, num_scenes, mapping)
+                else:
+                    plan = PatchPlan(self, num_scenes, mapping)
+                self._plans[key] = plan
+        return plan
+
+
+def _is_ref(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+
+def scene_capacity(mapping):
+    """Most scenes one batch of this mapping can chain, or None if unlimited."""
+    scenes = (mapping or DEFAULT_MAPPING).get("scenes") or []
+    last = scenes[-1] if scenes else {}
+    if len(scenes) >= 2 and last.get("group") and (last.get("prev_samples") or last.get("extend")):
+        return None
+    return len(scenes)
+
+
+def supports_latent_handoff(mapping):
+    """True if batches of this mapping can continue from saved latents."""
+    scenes = (mapping or DEFAULT_MAPPING).get("scenes") or []
+    return bool(scenes and scenes[0].get("prev_samples")
+                and all(scene.get("latent_out") for scene in scenes))
+
+
+def expand_scenes(graph, mapping, num_scenes):
+    """
+    (graph, mapping, clones) with the mapping's last scene group cloned until
+    there are num_scenes scenes. clones maps each original node id to its
+    copies. Raises ValueError if the last scene can't be chained onto itself.
+    """
+    scenes = list(mapping.get("scenes") or [])
+    last = scenes[-1] if scenes else {}
+    group = last.get("group")
+    if scene_capacity(mapping) is not None:
+        raise ValueError(
+            f"Workflow mapping supports 1-{len(scenes)} scenes per batch, got {num_scenes}"
+        )
+    members = [k for k in graph if k.startswith(group)]
+    seed_specs = {str(spec["id"]): spec for spec in mapping.get("seeds") or [] if "id" in spec}
+    noise = {value[0] for k in members for value in graph[k].get("inputs", {}).values()
+             if _is_ref(value) and value[0] in seed_specs}
+
+    graph = dict(graph)
+    seeds = list(mapping.get("seeds") or [])
+    clones = {}
+    for i in range(len(scenes), num_scenes):
+        prefix = f"{group.rstrip(':')}.{i}:"
+        ids = {k: prefix + k[len(group):] for k in members}
+        ids.update({k: prefix + k for k in noise})
+
+        def remap(value, ids=ids):
+            if _is_ref(value) and value[0] in ids:
+                return [ids[value[0]], value[1]]
+            if isinstance(value, dict):
+                out = {k: remap(v) for k, v in value.items()}
+                if str(value.get("id")) in ids:
+                    out["id"] = ids[str(value["id"])]
+                return out
+            return value
+
+        for old, new in ids.items():
+            node = graph[old]
+            graph[new] = {**node, "inputs": {n: remap(v) for n, v in node.get("inputs", {}).items()}}
+            clones.setdefault(old, []).append(new)
+        for k in noise:
+            spec = seed_specs[k]
+            seeds.append(dict(spec, id=ids[k],
+                              base=int(spec.get("base", 0)) + i - (len(mapping["scenes"]) - 1)))
+        scenes.append(dict(remap(last), group=prefix))
+    return graph, dict(mapping, scenes=scenes, seeds=seeds), clones
+
+
+class PatchPlan:
+    """
+    The list of (node_id, input, value) writes needed to turn a template
+    into an N-scene batch graph. Values are either constants or callables
+    taking the batch parameters.
+    """
+
+    def __init__(self, template, num_scenes, mapping):
+        scenes = mapping.get("scenes") or []
+        if not 1 <= num_scenes <= len(scenes):
+            raise ValueError(
+                f"Workflow mapping supports 1-{len(scenes)} scenes per batch, got {num_scenes}"
+            )
+        self.template = template
+        self.ops = []
+        self.removed = set()
+
+        def targets(spec, required=False, what=""):
+            node_ids = template.select(spec)
+            if required and not node_ids:
+                raise ValueError(f"Workflow mapping '{what}' matches no node: {spec}")
+            return [(node_id, spec["input"]) for node_id in node_ids]
+
+        for node_id, name in self._each(mapping.get("image"), targets):
+            self.ops.append((node_id, name, lambda p: p["image"], "image"))
+        for node_id, name in self._each(mapping.get("steps"), targets):
+            self.ops.append((node_id, name, lambda p: p["steps"], "steps"))
+        for spec in mapping.get("seeds") or []:
+            base = int(spec.get("base", 0))
+            for node_id, name in targets(spec):
+                self.ops.append((node_id, name, lambda p, b=base: b + p["seed_offset"], None))
+
+        merged = None
+        for i, scene in enumerate(scenes[:num_scenes]):
+            idx = i
+            for node_id, name in targets(scene["prompt"], True, f"scenes[{i}].prompt"):
+                self.ops.append((node_id, name, lambda p, k=idx: p["prompts"][k], None))
+            for node_id, name in targets(scene["negative"], True, f"scenes[{i}].negative"):
+                self.ops.append((node_id, name, lambda p: p["negative"], None))
+            for node_id, name in targets(scene["length"], True, f"scenes[{i}].length"):
+                self.ops.append((node_id, name, lambda p: p["frames"], None))
+            if scene.get("motion"):
+                for node_id, name in targets(scene["motion"]):
+                    self.ops.append((node_id, name, 0 if i == 0 else 1, None))
+            if i > 0:
+                prev = scenes[i - 1]
+                if scene.get("prev_samples") and prev.get("latent_out"):
+                    for node_id, name in targets(scene["prev_samples"]):
+                        self.ops.append((node_id, name, list(prev["latent_out"]), None))
+                if scene.get("extend"):
+                    ext = scene["extend"]
+                    for node_id in template.select(ext):
+                        self.ops.append((node_id, ext["source"], list(merged), None))
+                        self.ops.append((node_id, ext["new"], list(scene["images_out"]), None))
+                        merged = [node_id, 2]
+                    continue
+            if scene.get("images_out"):
+                merged = list(scene["images_out"])
+
+        for scene in scenes[num_scenes:]:
+            prefix = scene.get("group")
+            if prefix:
+                self.removed.update(k for k in template.graph if k.startswith(prefix))
+
+        output = mapping.get("output") or {}
+        for node_id in template.select(output) if output else []:
+            if output.get("images") and merged:
+                self.ops.append((node_id, output["images"], list(merged), None))
+            if output.get("frame_rate"):
+                self.ops.append((node_id, output["frame_rate"], lambda p: p["fps"], "fps"))
+            if output.get("prefix"):
+                self.ops.append((node_id, output["prefix"], lambda p: p["prefix"], "prefix"))
+
+        self.added = {}      # node id -> (class_type, param it needs)
+        if supports_latent_handoff(mapping):
+            self._latent_ops(template, scenes, num_scenes, targets, merged, output)
+
+        self.touched = {op[0] for op in self.ops} - self.removed
+
+    def _latent_ops(self, template, scenes, num_scenes, targets, merged, output):
+        """Save this batch's final latents; continue from the previous batch's."""
+        last = scenes[num_scenes - 1]
+        self.added[LATENT_SAVE_ID] = ("SaveLatent", "latent_prefix")
+        self.ops.append((LATENT_SAVE_ID, "samples", list(last["latent_out"]), "latent_prefix"))
+        self.ops.append((LATENT_SAVE_ID, "filename_prefix", lambda p: p["latent_prefix"],
+                         "latent_prefix"))
+
+        first = scenes[0]
+        self.added[LATENT_LOAD_ID] = ("LoadLatent", "prev_latent")
+        self.ops.append((LATENT_LOAD_ID, "latent", lambda p: p["prev_latent"], "prev_latent"))
+        for node_id, name in targets(first["prev_samples"]):
+            self.ops.append((node_id, name, [LATENT_LOAD_ID, 0], "prev_latent"))
+        for node_id, name in targets(first["motion"]) if first.get("motion") else []:
+            self.ops.append((node_id, name, 1, "prev_latent"))
+
+        # The frames the previous batch already ended on.
+        ext = next((scene["extend"] for scene in scenes if scene.get("extend")), None)
+        ext_ids = template.select(ext) if ext else []
+        overlap = template.graph[ext_ids[0]].get("inputs", {}).get("overlap") if ext_ids else 0
+        if not (isinstance(overlap, int) and overlap > 0 and merged and output.get("images")):
+            return
+        self.added[LATENT_TRIM_ID] = ("ImageFromBatch", "prev_latent")
+        self.ops.append((LATENT_TRIM_ID, "image", list(merged), "prev_latent"))
+        self.ops.append((LATENT_TRIM_ID, "batch_index", overlap, "prev_latent"))
+        self.ops.append((LATENT_TRIM_ID, "length", 4096, "prev_latent"))
+        for node_id in template.select(output):
+            self.ops.append((node_id, output["images"], [LATENT_TRIM_ID, 0], "prev_latent"))
+
+    @staticmethod
+    def _each(specs, targets):
+        for spec in specs or []:
+            yield from targets(spec)
+
+    def build(self, params, overrides=None):
+        """
+        Return a new API-format graph. Untouched nodes are shared with the
+        template; touched ones are shallow-copied with a fresh inputs dict.
+
+        params: image, steps, seed_offset, prompts, negative, frames, fps,
+        prefix, and for latent handoff prev_latent (a LoadLatent reference)
+        and latent_prefix (where to save this batch's latents). An op whose
+        optional param is None is skipped. overrides: {node_id: {input:
+        value}} applied last.
+        """
+        graph = self.template.graph
+        wf = {k: v for k, v in graph.items() if k not in self.removed}
+        for node_id, (class_type, param) in self.added.items():
+            if params.get(param) is not None:
+                wf[node_id] = {"class_type": class_type, "inputs": {},
+                               "_meta": {"title": f"Handoff {class_type}"}}
+        touched = {k for k in self.touched if k in wf}
+        if overrides and self.template.clones:
+            # Overrides name the original nodes; their copies get the same.
+            overrides = dict(overrides)
+            for node_id in [k for k in overrides if k in self.template.clones]:
+                for clone in self.template.clones[node_id]:
+                    overrides.setdefault(clone, overrides[node_id])
+        if overrides:
+            touched.update(k for k in overrides if k in wf)
+        for node_id in touched:
+            node = wf[node_id]
+            wf[node_id] = {**node, "inputs": dict(node.get("inputs", {}))}
+
+        for node_id, name, value, optional in self.ops:
+            if node_id in self.removed:
+                continue
+            if optional in OPTIONAL_PARAMS and params.get(optional) is None:
+                continue
+            wf[node_id]["inputs"][name] = value(params) if callable(value) else value
+        for node_id, inputs in (overrides or {}).items():
+            if node_id in wf:
+                wf[node_id]["inputs"].update(inputs)
+        return wf
+
+
+# Payload-supplied workflows are compiled too, so keep the cache bounded.
+TEMPLATE_CACHE_SIZE = 16
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def compile_template(workflow):
+    """Return the cached WorkflowTemplate for this workflow's content."""
+    content_hash = workflow_hash(workflow)
+    with _templates_lock:
+        template = _templates.get(content_hash)
+        if template is None:
+            template = WorkflowTemplate(workflow, content_hash)
+            _templates[content_hash] = template
+            while len(_templates) > TEMPLATE_CACHE_SIZE:
+                _templates.popitem(last=False)
+        else:
+            _templates.move_to_end(content_hash)
+    return template
@@ -0,0 +1,137 @@
+"""ComfyEventStream against the fake ComfyUI in tools/fake_services.py."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from unittest import mock
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import comfy_events  # noqa: E402
+from comfy_events import ComfyEventStream, ComfyExecutionError  # noqa: E402
+from fake_services import FakeServices  # noqa: E402
+
+GRAPH = {"1": {"class_type": "VHS_VideoCombine", "inputs": {"filename_prefix": "test"}}}
+
+
+class TestComfyEventStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        clip = os.path.join(self.tmp, "clip.mp4")
+        with open(clip, "wb") as f:
+            f.write(b"\0" * 1024)
+        self.services = FakeServices(self.tmp, clip, exec_seconds=0.3, jitter=0.0).start()
+        self.client_id = uuid.uuid4().hex
+        for name, value in (("WEBSOCKET_RECV_TIMEOUT_S", 0.2),
+                            ("WEBSOCKET_RECONNECT_DELAY_S", 0.05),
+                            ("FALLBACK_POLL_INTERVAL_S", 0.05)):
+            patcher = mock.patch.object(comfy_events, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.services.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def stream(self, **kwargs):
+        return ComfyEventStream("127.0.0.1", self.services.comfy_port, self.client_id, **kwargs)
+
+    def queue(self):
+        r = requests.post(f"http://127.0.0.1:{self.services.comfy_port}/prompt",
+                          json={"prompt": GRAPH, "client_id": self.client_id}, timeout=10)
+        r.raise_for_status()
+        return r.json()["prompt_id"]
+
+    def assert_finished(self, results, prompt_ids):
+        self.assertEqual([pid for pid, _ in results], prompt_ids)
+        for _, entry in results:
+            self.assertEqual(entry["status"]["status_str"], "success")
+            self.assertIn("1", entry["outputs"])
+
+    def test_wait_each_yields_prompts_in_finish_order(self):
+        events = []
+        with self.stream(on_event=lambda t, d: events.append(t)) as stream:
+            self.assertIsNotNone(stream.ws)
+            prompt_ids = [self.queue(), self.queue()]
+            results = list(stream.wait_each(prompt_ids, timeout=10))
+        self.assert_finished(results, prompt_ids)
+        self.assertIn("execution_start", events)
+
+    def test_poll_each_yields_prompts_in_finish_order(self):
+        stream = self.stream()
+        prompt_ids = [self.queue(), self.queue()]
+        self.assert_finished(list(stream.poll_each(prompt_ids, timeout=10)), prompt_ids)
+
+    def test_execution_error_raises(self):
+        self.services.comfy.fail_rate = 1.0
+        with self.stream() as stream:
+            prompt_id = self.queue()
+            with self.assertRaises(ComfyExecutionError) as ctx:
+                list(stream.wait_each([prompt_id], timeout=10))
+        self.assertEqual(ctx.exception.prompt_id, prompt_id)
+        self.assertIn("injected failure", str(ctx.exception))
+
+    def test_execution_error_raises_when_polling(self):
+        self.services.comfy.fail_rate = 1.0
+        prompt_id = self.queue()
+        with self.assertRaises(ComfyExecutionError) as ctx:
+            list(self.stream().poll_each([prompt_id], timeout=10))
+        self.assertIn("injected failure", str(ctx.exception))
+
+    def test_reconnects_after_socket_drop(self):
+        self.services.comfy.exec_seconds = 1.0
+        dropped = []
+
+        def on_event(msg_type, data):
+            if msg_type == "execution_start" and not dropped:
+                dropped.append(data["prompt_id"])
+                self.services.drop_sockets()
+
+        with self.stream(on_event=on_event) as stream:
+            with mock.patch.object(stream, "reconnect", wraps=stream.reconnect) as reconnect:
+                prompt_id = self.queue()
+                results = list(stream.wait_each([prompt_id], timeout=10))
+            self.assertEqual(dropped, [prompt_id])
+            reconnect.assert_called()
+            self.assertIsNotNone(stream.ws)
+        self.assert_finished(results, [prompt_id])
+
+    def test_late_connect_finds_prompts_that_already_finished(self):
+        self.services.comfy.exec_seconds = 0.05
+        stream = self.stream()
+        prompt_id = self.queue()
+        while stream.fetch_history(prompt_id) is None:
+            time.sleep(0.02)
+        # The completion event went out before this socket existed; waiting
+        # must not sit on recv() until the next /history check.
+        with mock.patch.object(comfy_events, "WEBSOCKET_RECV_TIMEOUT_S", 5.0):
+            started = time.monotonic()
+            results = list(stream.wait_each([prompt_id], timeout=10))
+            elapsed = time.monotonic() - started
+        stream.close()
+        self.assert_finished(results, [prompt_id])
+        self.assertLess(elapsed, 1.0)
+
+    def test_wait_each_times_out(self):
+        self.services.comfy.exec_seconds = 5.0
+        with self.stream() as stream:
+            prompt_id = self.queue()
+            with self.assertRaisesRegex(RuntimeError, "did not finish within"):
+                list(stream.wait_each([prompt_id], timeout=0.5))
+
+    def test_poll_each_times_out(self):
+        self.services.comfy.exec_seconds = 5.0
+        prompt_id = self.queue()
+        with self.assertRaisesRegex(RuntimeError, "did not finish within"):
+            list(self.stream().poll_each([prompt_id], timeout=0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""FragmentedAssembler timeline rewriting, on hand-built fragmented MP4 chunks."""
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import fmp4  # noqa: E402
+from fmp4 import FragmentedAssembler, IncompatibleChunkError, find_box, iter_boxes  # noqa: E402
+
+TIMESCALE = 12800
+
+
+def box(btype, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), btype.encode()) + payload
+
+
+def full_box(btype, version, flags, payload=b""):
+    return box(btype, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def init_segment(codec="avc1"):
+    mdhd = full_box("mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, TIMESCALE, 0, 0, 0))
+    stsd = full_box("stsd", 0, 0, struct.pack(">I", 1) + box(codec, b"\0" * 8))
+    stbl = box("stbl", stsd)
+    trak = box("trak", box("mdia", mdhd + box("minf", stbl)))
+    return box("ftyp", b"isom\0\0\2\0isomiso6") + box("moov", trak)
+
+
+def fragment(sequence, decode_time, tfdt_version, durations=None, default_duration=0, count=0):
+    """moof+mdat with either per-sample durations or a tfhd default duration."""
+    tfhd = full_box("tfhd", 0, 0x020000 | 0x08, struct.pack(">II", 1, default_duration))
+    tfdt = full_box("tfdt", tfdt_version, 0,
+                    struct.pack(">Q" if tfdt_version else ">I", decode_time))
+    if durations is not None:
+        trun = full_box("trun", 0, 0x001 | 0x100,
+                        struct.pack(">Ii", len(durations), 0)
+                        + b"".join(struct.pack(">I", d) for d in durations))
+    else:
+        trun = full_box("trun", 0, 0x001, struct.pack(">Ii", count, 0))
+    mfhd = full_box("mfhd", 0, 0, struct.pack(">I", sequence))
+    return box("moof", mfhd + box("traf", tfhd + tfdt + trun)) + box("mdat", b"frame" * 4)
+
+
+# One chunk as ffmpeg would fragment it: 3 x 512 ticks, then 500 + 700 ticks.
+CHUNK_DURATION = 3 * 512 + 500 + 700
+
+
+def chunk(codec="avc1"):
+    return (init_segment(codec)
+            + fragment(1, 0, 1, default_duration=512, count=3)
+            + fragment(2, 3 * 512, 0, durations=[500, 700]))
+
+
+def timeline(data):
+    """(mfhd sequence, tfdt decode time) of every moof in data."""
+    result = []
+    for btype, start, end in iter_boxes(data):
+        if btype != "moof":
+            continue
+        mfhd = find_box(data, "mfhd", start + 8, end)
+        tfdt = find_box(data, "traf/tfdt", start + 8, end)
+        sequence = struct.unpack(">I", data[mfhd[0] + 12:mfhd[0] + 16])[0]
+        if data[tfdt[0] + 8] == 1:
+            decode_time = struct.unpack(">Q", data[tfdt[0] + 12:tfdt[0] + 20])[0]
+        else:
+            decode_time = struct.unpack(">I", data[tfdt[0] + 12:tfdt[0] + 16])[0]
+        result.append((sequence, decode_time))
+    return result
+
+
+class TestFragmentedAssembler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp, "final.mp4")
+        self.chunks = {}
+        patcher = mock.patch.object(fmp4, "fragment_chunk", side_effect=self.chunks.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_second_chunk_continues_the_timeline(self):
+        self.chunks.update({"chunk_1.mp4": chunk(), "chunk_2.mp4": chunk()})
+        assembler = FragmentedAssembler(self.output)
+        first = assembler.append(0, "chunk_1.mp4")
+        assembler.append(1, "chunk_2.mp4")
+
+        with open(self.output, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(data), assembler.bytes_written)
+        self.assertEqual(timeline(data[:first]), [(1, 0), (2, 1536)])
+        self.assertEqual(timeline(data), [
+            (1, 0), (2, 1536),
+            (3, CHUNK_DURATION), (4, CHUNK_DURATION + 1536),
+        ])
+        # The init segment is written once, ahead of all fragments.
+        self.assertEqual([b for b, _, _ in iter_boxes(data)],
+                         ["ftyp", "moov"] + ["moof", "mdat"] * 4)
+        self.assertAlmostEqual(assembler.duration, 2 * CHUNK_DURATION / TIMESCALE)
+
+    def test_chunks_appended_out_of_order_are_written_in_index_order(self):
+        self.chunks.update({"chunk_1.mp4": chunk(), "chunk_2.mp4": chunk()})
+        assembler = FragmentedAssembler(self.output)
+        late = threading.Thread(target=assembler.append, args=(1, "chunk_2.mp4"))
+        late.start()
+        assembler.append(0, "chunk_1.mp4")
+        late.join(5)
+
+        with open(self.output, "rb") as f:
+            self.assertEqual([seq for seq, _ in timeline(f.read())], [1, 2, 3, 4])
+
+    def test_mismatched_codec_is_rejected(self):
+        self.chunks.update({"chunk_1.mp4": chunk(), "chunk_2.mp4": chunk(codec="hvc1")})
+        assembler = FragmentedAssembler(self.output)
+        written = assembler.append(0, "chunk_1.mp4")
+        with self.assertRaises(IncompatibleChunkError):
+            assembler.append(1, "chunk_2.mp4")
+        self.assertEqual(os.path.getsize(self.output), written)
+
+
+if __name__ == "__main__":
+    unittest.main()
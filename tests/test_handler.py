@@ -0,0 +1,177 @@
+"""Handler helpers that don't need a running ComfyUI."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import fmp4  # noqa: E402
+import handler  # noqa: E402
+from fake_services import FakeServices  # noqa: E402
+from fmp4 import FragmentedAssembler, IncompatibleChunkError  # noqa: E402
+from resumable_upload import TUS_CHUNK_SIZE, ResumableUploader  # noqa: E402
+from timings import JobTimings  # noqa: E402
+
+
+class TestFinalAssemblyFallback(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        clip = os.path.join(self.tmp, "clip.mp4")
+        with open(clip, "wb") as f:
+            f.write(b"\0" * 1024)
+        self.services = FakeServices(self.tmp, clip).start()
+        self.uploader = ResumableUploader(f"http://127.0.0.1:{self.services.supabase_port}",
+                                          "test-key", "videos")
+        self.final = os.path.join(self.tmp, "final.mp4")
+
+    def tearDown(self):
+        self.uploader.session.close()
+        self.services.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_failed_append_reports_fallback_without_pushing(self):
+        stream = mock.Mock()
+        assembler = FragmentedAssembler(self.final)
+        with mock.patch.object(fmp4, "fragment_chunk",
+                               side_effect=IncompatibleChunkError("different codec")):
+            self.assertFalse(handler.append_to_final(assembler, stream, 0, "chunk_1.mp4"))
+        stream.push.assert_not_called()
+
+    def test_concat_fallback_cancels_the_streamed_upload(self):
+        with open(self.final, "wb") as f:
+            f.write(os.urandom(TUS_CHUNK_SIZE + 100))
+        stream = self.uploader.open_stream("job_final.mp4")
+        stream.push(self.final)
+        self.assertEqual(len(self.services.supabase.uploads), 1)
+
+        chunks = [os.path.join(self.tmp, f"chunk_{i}.mp4") for i in (1, 2)]
+        with mock.patch.object(handler, "ffmpeg_concat") as concat:
+            handler.concat_final(JobTimings("job"), stream, chunks, self.final, self.tmp)
+        concat.assert_called_once_with(chunks, self.final, tmp_dir=self.tmp)
+        self.assertEqual(self.services.supabase.uploads, {})
+        self.assertIsNone(stream.upload_url)
+        self.assertEqual(self.services.supabase.objects, 0)
+
+
+class TestRunPrompt(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        clip = os.path.join(self.tmp, "clip.mp4")
+        with open(clip, "wb") as f:
+            f.write(b"\0" * 1024)
+        self.services = FakeServices(self.tmp, clip, exec_seconds=0.05, jitter=0.0).start()
+        port = self.services.comfy_port
+        for name, value in (("COMFY_HOST", "127.0.0.1"), ("COMFY_PORT", port),
+                            ("COMFY_BASE", f"http://127.0.0.1:{port}")):
+            patcher = mock.patch.object(handler, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.services.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_socket_is_open_before_the_prompt_is_queued(self):
+        order = []
+        connect = handler.ComfyEventStream.connect
+        submit = handler.submit_prompt
+
+        def connecting(stream):
+            order.append("connect")
+            return connect(stream)
+
+        def submitting(*args, **kwargs):
+            order.append("submit")
+            return submit(*args, **kwargs)
+
+        graph = {"1": {"class_type": "VHS_VideoCombine", "inputs": {"filename_prefix": "t"}}}
+        with mock.patch.object(handler.ComfyEventStream, "connect", connecting), \
+                mock.patch.object(handler, "submit_prompt", submitting):
+            entry = handler.run_prompt(graph, client_id="test", timeout=10)
+        self.assertEqual(order, ["connect", "submit"])
+        self.assertEqual(entry["status"]["status_str"], "success")
+
+    def test_wait_without_events_polls(self):
+        prompt_id = handler.submit_prompt(
+            {"1": {"class_type": "VHS_VideoCombine", "inputs": {"filename_prefix": "t"}}}
+        )["prompt_id"]
+        with mock.patch.object(handler.ComfyEventStream, "connect") as connect:
+            entry = handler.wait_for_history(prompt_id, timeout=10)
+        connect.assert_not_called()
+        self.assertEqual(entry["status"]["status_str"], "success")
+
+
+class TestRenameInputs(unittest.TestCase):
+    def test_only_load_image_inputs_are_renamed(self):
+        graph = {
+            "1": {"class_type": "LoadImage", "inputs": {"image": "cat.png", "upload": "image"}},
+            "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "cat.png"}},
+            "3": {"class_type": "SaveImage", "inputs": {"filename_prefix": "cat.png"}},
+            "4": {"class_type": "LoadImage", "inputs": {"image": "dog.png"}},
+        }
+        renamed = handler.rename_inputs(graph, {"cat.png": "in_0123abcd.png"})
+        self.assertEqual(renamed["1"]["inputs"], {"image": "in_0123abcd.png", "upload": "image"})
+        for node_id in ("2", "3", "4"):
+            self.assertIs(renamed[node_id], graph[node_id])
+        self.assertEqual(graph["1"]["inputs"]["image"], "cat.png")
+
+    def test_unchanged_graph_is_returned_as_is(self):
+        graph = {"1": {"class_type": "CLIPTextEncode", "inputs": {"text": "cat.png"}}}
+        self.assertIs(handler.rename_inputs(graph, {"cat.png": "in_0123abcd.png"}), graph)
+
+
+class TestFileTag(unittest.TestCase):
+    def test_short_safe_ids_are_used_as_is(self):
+        self.assertEqual(handler.file_tag("sync-1234_abc"), "sync-1234_abc")
+
+    def test_long_ids_with_a_shared_prefix_get_distinct_tags(self):
+        a, b = "x" * 60 + "-a", "x" * 60 + "-b"
+        self.assertNotEqual(handler.file_tag(a), handler.file_tag(b))
+        self.assertLessEqual(len(handler.file_tag(a)), 48)
+
+    def test_ids_that_sanitize_alike_get_distinct_tags(self):
+        self.assertNotEqual(handler.file_tag("job.1"), handler.file_tag("job_1"))
+        self.assertRegex(handler.file_tag("job.1"), r"^[A-Za-z0-9_-]+$")
+
+
+@unittest.skipUnless(shutil.which("ffmpeg") and shutil.which("ffprobe"), "needs ffmpeg")
+class TestLastFrame(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def encode(self, offset):
+        path = os.path.join(self.tmp, f"clip_{offset}.mp4")
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+                        "-i", "testsrc=size=64x64:rate=10", "-t", "3",
+                        "-output_ts_offset", str(offset), "-c:v", "libx264", "-bf", "2",
+                        "-pix_fmt", "yuv420p", path], check=True)
+        return path
+
+    def reference(self, path):
+        out = os.path.join(self.tmp, "ref.png")
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-sseof", "-1", "-i", path,
+                        "-update", "1", out], check=True)
+        with open(out, "rb") as f:
+            return f.read()
+
+    def test_seek_is_relative_to_stream_start(self):
+        for offset in (0, 5):
+            path = self.encode(offset)
+            self.assertAlmostEqual(handler.last_frame_timestamp(path), 2.9, places=3)
+            with mock.patch("builtins.print") as printed:
+                png = handler.last_frame_png_bytes(path, self.tmp)
+            self.assertEqual(png, self.reference(path))
+            printed.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""HlsPackager publishing order, with segment_chunk stubbed out (no ffmpeg)."""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import hls  # noqa: E402
+from hls import PLAYLIST_NAME, HlsPackager  # noqa: E402
+
+
+class RecordingUploader:
+    """Keeps every upload's object name, and each playlist as it was uploaded."""
+
+    def __init__(self):
+        self.names = []
+        self.playlists = []
+        self._lock = threading.Lock()
+
+    def public_url(self, name):
+        return f"https://storage.test/{name}"
+
+    def upload(self, path, name, content_type, cache_control=None):
+        with self._lock:
+            self.names.append(name)
+            if name.endswith(PLAYLIST_NAME):
+                with open(path) as f:
+                    self.playlists.append(f.read())
+
+
+class TestHlsPackager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.uploader = RecordingUploader()
+        self.release = {}     # chunk path -> Event gating its segmenting
+        self.fail = set()
+        pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="hls-test")
+        self.addCleanup(pool.shutdown)
+        for name, value in (("_pool", pool), ("segment_chunk", self.segment)):
+            patcher = mock.patch.object(hls, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def segment(self, chunk_path, out_dir, stem):
+        gate = self.release.get(chunk_path)
+        if gate is not None:
+            gate.wait(5)
+        if chunk_path in self.fail:
+            raise RuntimeError("segmenting failed")
+        os.makedirs(out_dir, exist_ok=True)
+        names = [f"{stem}_init.mp4", f"{stem}_00000.m4s", f"{stem}_00001.m4s"]
+        for name in names:
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(b"\0")
+        return names[0], [(names[1], 4.0), (names[2], 2.5)]
+
+    def packager(self, num_chunks):
+        return HlsPackager(self.uploader, "job", num_chunks, self.tmp, max_chunk_seconds=6)
+
+    def test_chunks_are_published_in_batch_order(self):
+        self.release["c1"] = threading.Event()
+        packager = self.packager(3)
+        packager.add(0, "c1")
+        packager.add(1, "c2")
+        packager.add(2, "c3")
+        # c2 and c3 are segmented and uploaded, but held back behind c1.
+        packager._futures[1].result()
+        packager._futures[2].result()
+        self.assertIn("job/hls/b03_00001.m4s", self.uploader.names)
+        self.assertEqual(self.uploader.playlists, [])
+
+        self.release["c1"].set()
+        self.assertEqual(packager.finish(), "https://storage.test/job/hls/index.m3u8")
+        self.assertEqual(len(self.uploader.playlists), 1)
+        playlist = self.uploader.playlists[-1].splitlines()
+        maps = [line for line in playlist if line.startswith("#EXT-X-MAP")]
+        self.assertEqual(maps, [f'#EXT-X-MAP:URI="b0{i}_init.mp4"' for i in (1, 2, 3)])
+        self.assertEqual(playlist.count("#EXT-X-DISCONTINUITY"), 2)
+        self.assertEqual(playlist[-1], "#EXT-X-ENDLIST")
+        self.assertIn("#EXT-X-TARGETDURATION:6", playlist)
+
+    def test_playlist_grows_as_chunks_arrive(self):
+        packager = self.packager(2)
+        packager.add(0, "c1")
+        packager._futures[0].result()
+        self.assertNotIn("#EXT-X-ENDLIST", self.uploader.playlists[-1])
+        self.assertIn("b01_00001.m4s", self.uploader.playlists[-1])
+        packager.add(1, "c2")
+        self.assertIsNotNone(packager.finish())
+        self.assertEqual(len(self.uploader.playlists), 2)
+        self.assertTrue(self.uploader.playlists[-1].endswith("#EXT-X-ENDLIST\n"))
+
+    def test_failed_chunk_stops_the_playlist(self):
+        self.fail.add("c1")
+        packager = self.packager(2)
+        with mock.patch("builtins.print"):
+            packager.add(0, "c1")
+            packager.add(1, "c2")
+            self.assertIsNone(packager.finish())
+        self.assertIsInstance(packager.failed, RuntimeError)
+        self.assertEqual(self.uploader.playlists, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Janitor retention and the startup sweep, on a temp dir."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import janitor  # noqa: E402
+from janitor import Janitor, job_input_files, job_output_files  # noqa: E402
+
+
+class JanitorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp, "output")
+        self.input_dir = os.path.join(self.tmp, "input")
+        os.makedirs(os.path.join(self.output_dir, "latents"))
+        os.makedirs(self.input_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, directory, name, size=100, age=0):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        if age:
+            then = time.time() - age
+            os.utime(path, (then, then))
+        return path
+
+
+class TestRelease(JanitorTestCase):
+    def test_uploaded_job_deletes_its_own_files_only(self):
+        jan = Janitor(max_bytes=10_000)
+        chunk = self.write(self.output_dir, "job_batch_00_00001.mp4")
+        other = self.write(self.output_dir, "job_batch_00_x_batch_00_00001.mp4")
+        source = self.write(self.input_dir, "input_" + "a" * 24 + ".png")
+        jan.track_matching("job", self.output_dir, job_output_files("job"))
+        jan.track("job", source, reusable=True)
+
+        self.assertEqual(jan.release("job", uploaded=True), (1, 100))
+        self.assertFalse(os.path.exists(chunk))
+        # A job whose tag only starts with "job_batch_00" is not this job.
+        self.assertTrue(os.path.exists(other))
+        self.assertTrue(os.path.exists(source))
+        self.assertIn(source, jan._lru)
+
+    def test_file_in_use_by_another_job_is_kept(self):
+        jan = Janitor(max_bytes=10_000)
+        shared = self.write(self.input_dir, "job_last_frame_b1.png")
+        jan.track("job", shared)
+        jan.track("other", shared)
+        jan.track_matching("job", self.input_dir, job_input_files("job"))
+        self.assertEqual(jan.release("job", uploaded=True), (0, 0))
+        self.assertTrue(os.path.exists(shared))
+
+    def test_lru_budget_deletes_least_recently_used_first(self):
+        jan = Janitor(max_bytes=250)
+        paths = [self.write(self.output_dir, f"job{i}_batch_00_00001.mp4") for i in range(3)]
+        for i, path in enumerate(paths[:2]):
+            jan.track(f"job{i}", path)
+            jan.release(f"job{i}", uploaded=False)
+        self.assertEqual(list(jan._lru), paths[:2])
+
+        # Reusing the oldest file takes it out of the LRU; released again it
+        # becomes the most recent.
+        jan.track("job2", paths[0])
+        jan.track("job2", paths[2])
+        self.assertEqual(jan.release("job2", uploaded=False), (1, 100))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertEqual(list(jan._lru), [paths[0], paths[2]])
+        self.assertEqual(jan._lru_bytes, 200)
+
+    def test_keep_outputs_retains_uploaded_files(self):
+        jan = Janitor(max_bytes=10_000, keep_outputs=True)
+        chunk = self.write(self.output_dir, "job_batch_00_00001.mp4")
+        jan.track("job", chunk)
+        self.assertEqual(jan.release("job", uploaded=True), (0, 0))
+        self.assertIn(chunk, jan._lru)
+
+    def test_disabled_janitor_tracks_nothing(self):
+        jan = Janitor(enabled=False)
+        chunk = self.write(self.output_dir, "job_batch_00_00001.mp4")
+        jan.track("job", chunk)
+        self.assertEqual(jan.release("job", uploaded=True), (0, 0))
+        self.assertTrue(os.path.exists(chunk))
+
+
+class TestSweep(JanitorTestCase):
+    OLD = 3600
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(janitor, "JANITOR_SWEEP_AGE_S", 300)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sweep_deletes_old_worker_files_only(self):
+        out, inp = self.output_dir, self.input_dir
+        gone = [
+            self.write(out, "job_batch_00_00001.mp4", age=self.OLD),
+            self.write(out, "job_batch_00_00001.png", age=self.OLD),
+            self.write(out, "job_batch01.mp4", age=self.OLD),
+            self.write(out, "job_final.mp4", age=self.OLD),
+            self.write(out, "warmup_00_00001.mp4", age=self.OLD),
+            self.write(os.path.join(out, "latents"), "job_batch_00_00002_.latent", age=self.OLD),
+            self.write(inp, "job_last_frame_b1.png", age=self.OLD),
+            self.write(inp, "warmup_input.png", age=self.OLD),
+        ]
+        kept = [
+            # Not ours: other tools' outputs and the user's own files.
+            self.write(out, "ComfyUI_00001_.png", age=self.OLD),
+            self.write(out, "notes.txt", age=self.OLD),
+            self.write(inp, "example.png", age=self.OLD),
+            self.write(os.path.join(out, "latents"), "ComfyUI_00001_.latent", age=self.OLD),
+            # Ours, but too recent: another worker may be using it.
+            self.write(out, "job2_batch_00_00001.mp4"),
+        ]
+        os.makedirs(os.path.join(out, "sub"))
+        kept.append(self.write(os.path.join(out, "sub"), "job_batch_00_00001.mp4", age=self.OLD))
+
+        stats = Janitor(max_bytes=10_000).sweep(out, inp)
+        self.assertEqual(stats["deleted"], len(gone))
+        self.assertEqual(stats["reclaimed_bytes"], 100 * len(gone))
+        self.assertEqual([p for p in gone if os.path.exists(p)], [])
+        self.assertEqual([p for p in kept if not os.path.exists(p)], [])
+
+    def test_sweep_retains_reusable_inputs_under_budget(self):
+        names = [f"input_{c * 24}.png" for c in "abc"]
+        paths = [self.write(self.input_dir, name, age=self.OLD - i) for i, name in enumerate(names)]
+        jan = Janitor(max_bytes=250)
+        stats = jan.sweep(self.output_dir, self.input_dir)
+        # Oldest first into the LRU, so the oldest goes over budget first.
+        self.assertEqual(stats["deleted"], 1)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertEqual((stats["retained"], stats["retained_bytes"]), (2, 200))
+        self.assertEqual(list(jan._lru), paths[1:])
+
+    def test_keep_outputs_retains_old_outputs(self):
+        chunk = self.write(self.output_dir, "job_batch_00_00001.mp4", age=self.OLD)
+        stats = Janitor(max_bytes=10_000, keep_outputs=True).sweep(self.output_dir,
+                                                                   self.input_dir)
+        self.assertEqual((stats["deleted"], stats["retained"]), (0, 1))
+        self.assertTrue(os.path.exists(chunk))
+
+
+if __name__ == "__main__":
+    unittest.main()
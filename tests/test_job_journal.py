@@ -0,0 +1,151 @@
+"""JobJournal load/record/resume on a temp dir."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+from job_journal import JobJournal, check_resume_from, prune_journals  # noqa: E402
+
+
+class TestJobJournal(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def load(self, job_id, signature="sig", resume_from=None):
+        return JobJournal.load(job_id, signature, resume_from=resume_from, root=self.root)
+
+    def record(self, journal, batch_num, scene_idx, next_scene_idx):
+        journal.record_batch(batch_num, scene_idx, next_scene_idx,
+                             f"https://cdn/{batch_num}.mp4", f"/out/{batch_num}.mp4")
+
+    def test_missing_journal_starts_fresh(self):
+        journal = self.load("job")
+        self.assertEqual(journal.completed(), [])
+        self.assertEqual(journal.state["scene_idx"], 0)
+        self.assertFalse(os.path.exists(journal.path))
+
+    def test_redelivered_job_picks_up_its_own_progress(self):
+        journal = self.load("job")
+        journal.state["scenes_per_batch"] = 2
+        self.record(journal, 1, 0, 2)
+        journal.record_last_frame(1, "job_last_frame_b1.png")
+
+        again = self.load("job")
+        self.assertEqual([n for n, _ in again.completed()], [1])
+        self.assertEqual(again.completed()[0][1]["chunk_url"], "https://cdn/1.mp4")
+        self.assertEqual(again.state["scene_idx"], 2)
+        self.assertEqual(again.state["scenes_per_batch"], 2)
+        self.assertEqual(again.last_frame(1), "job_last_frame_b1.png")
+        self.assertIsNone(again.last_frame(2))
+
+    def test_signature_mismatch_starts_over(self):
+        self.record(self.load("job", "sig"), 1, 0, 2)
+        journal = self.load("job", "other-sig")
+        self.assertEqual(journal.completed(), [])
+        self.assertEqual(journal.state["signature"], "other-sig")
+
+    def test_corrupt_journal_starts_over(self):
+        with open(os.path.join(self.root, "job.json"), "w") as f:
+            f.write("{not json")
+        self.assertEqual(self.load("job").completed(), [])
+
+    def test_completed_is_the_contiguous_prefix(self):
+        journal = self.load("job")
+        self.record(journal, 1, 0, 2)
+        self.record(journal, 3, 4, 6)
+        self.assertEqual([n for n, _ in journal.completed()], [1])
+        self.assertEqual(sorted(journal.recorded()), [1, 3])
+        # A gap stops resume at the last contiguous batch.
+        self.assertEqual(journal.state["scene_idx"], 2)
+
+        self.record(journal, 2, 2, 4)
+        self.assertEqual([n for n, _ in journal.completed()], [1, 2, 3])
+        self.assertEqual(journal.state["scene_idx"], 6)
+
+    def test_resume_from_seeds_a_new_job(self):
+        old = self.load("old-job")
+        old.state["scenes_per_batch"] = 3
+        self.record(old, 1, 0, 3)
+        before = os.path.getmtime(old.path)
+
+        journal = self.load("new-job", resume_from="old-job")
+        self.assertEqual([n for n, _ in journal.completed()], [1])
+        self.assertEqual(journal.state["job_id"], "new-job")
+        self.record(journal, 2, 3, 6)
+        # Progress goes under the new id; the old journal is untouched.
+        self.assertTrue(os.path.isfile(os.path.join(self.root, "new-job.json")))
+        self.assertEqual(os.path.getmtime(old.path), before)
+        self.assertEqual(len(self.load("old-job").completed()), 1)
+
+    def test_resume_from_unknown_job_starts_fresh(self):
+        self.assertEqual(self.load("new-job", resume_from="never-ran").completed(), [])
+
+    def test_resume_from_must_be_a_plain_job_id(self):
+        outside = os.path.join(os.path.dirname(self.root), "victim.json")
+        for bad in ("../victim", "a/b", "..", "job.json", "", " job", 42):
+            with self.subTest(resume_from=bad):
+                with self.assertRaises(ValueError):
+                    check_resume_from(bad)
+        with self.assertRaises(ValueError):
+            self.load("job", resume_from="../victim")
+        self.assertFalse(os.path.exists(outside))
+        self.assertEqual(check_resume_from("sync-abc_123"), "sync-abc_123")
+
+    def test_scenes_per_batch_is_reused_from_the_journal(self):
+        journal = self.load("job")
+        journal.state["scenes_per_batch"] = 2
+        self.record(journal, 1, 0, 2)
+        self.assertEqual(JobJournal.scenes_per_batch("job", root=self.root), 2)
+        self.assertIsNone(JobJournal.scenes_per_batch("never-ran", root=self.root))
+        self.assertIsNone(JobJournal.scenes_per_batch("../job", root=self.root))
+
+    def test_record_final(self):
+        journal = self.load("job")
+        journal.record_final("https://cdn/final.mp4")
+        with open(journal.path) as f:
+            self.assertEqual(json.load(f)["final_video_url"], "https://cdn/final.mp4")
+        self.assertEqual(self.load("job").state["final_video_url"], "https://cdn/final.mp4")
+
+    def test_prune_journals_removes_only_stale_files(self):
+        stale = self.load("stale")
+        self.record(stale, 1, 0, 1)
+        then = time.time() - 3600
+        os.utime(stale.path, (then, then))
+        fresh = self.load("fresh")
+        self.record(fresh, 1, 0, 1)
+
+        self.assertEqual(prune_journals(root=self.root, ttl=600), 1)
+        self.assertFalse(os.path.exists(stale.path))
+        self.assertTrue(os.path.exists(fresh.path))
+        self.assertEqual(prune_journals(root=os.path.join(self.root, "missing"), ttl=0), 0)
+
+
+class TestHandlerResumeFrom(unittest.TestCase):
+    def test_invalid_resume_from_is_rejected_before_any_work(self):
+        import handler
+        from timings import JobTimings
+
+        payload = {"workflow": {"1": {"class_type": "VHS_VideoCombine", "inputs": {}}},
+                   "prompts": ["a"], "resume_from": "../../etc/passwd"}
+        with mock.patch.object(handler, "wait_for_comfy"), \
+                mock.patch.object(handler, "compile_template") as compile_template, \
+                mock.patch.object(handler, "resolve_input_image") as resolve_input_image:
+            with self.assertRaisesRegex(ValueError, "Invalid resume_from"):
+                handler.run_job(payload, JobTimings("job"))
+        compile_template.assert_not_called()
+        resolve_input_image.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
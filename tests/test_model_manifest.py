@@ -0,0 +1,126 @@
+"""ModelManifest incremental and per-folder refreshes."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+from model_manifest import ModelManifest  # noqa: E402
+
+
+class TestModelManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "models")
+        self.write("loras/a.safetensors", b"a")
+        self.write("loras/sub/b.safetensors", b"bb")
+        self.write("vae/v.safetensors", b"vvv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, rel, data):
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def touch_dir(self, rel):
+        # Directory mtimes can share a timestamp tick with the previous scan.
+        path = os.path.join(self.root, rel)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    def manifest(self, **kwargs):
+        return ModelManifest(self.root, workers=2, **kwargs)
+
+    def test_full_index(self):
+        manifest = self.manifest()
+        stats = manifest.refresh()
+        self.assertEqual(stats["dirs"], 4)
+        self.assertEqual(stats["files"], 3)
+        self.assertEqual(sorted(manifest.files("loras")), ["a.safetensors", "sub/b.safetensors"])
+        self.assertEqual(manifest.lookup("loras", "sub/b.safetensors")["size"], 2)
+        self.assertTrue(manifest.has_folder("vae"))
+        self.assertTrue(manifest.refreshed)
+
+    def test_unchanged_tree_rescans_nothing(self):
+        manifest = self.manifest()
+        manifest.refresh()
+        self.assertEqual(manifest.refresh()["dirs_rescanned"], 0)
+
+    def test_only_changed_directories_are_rescanned(self):
+        manifest = self.manifest()
+        manifest.refresh()
+        self.write("loras/sub/c.safetensors", b"c")
+        self.touch_dir("loras/sub")
+        stats = manifest.refresh()
+        self.assertEqual(stats["dirs_rescanned"], 1)
+        self.assertIsNotNone(manifest.lookup("loras", "sub/c.safetensors"))
+
+    def test_rewrite_in_place_needs_a_full_refresh(self):
+        manifest = self.manifest()
+        manifest.refresh()
+        path = self.write("vae/v.safetensors", b"longer now")
+        os.utime(path, (1, 1))
+        manifest.refresh()
+        self.assertEqual(manifest.lookup("vae", "v.safetensors")["size"], 3)
+        stats = manifest.refresh(full=True)
+        self.assertEqual(stats["dirs_rescanned"], 4)
+        self.assertEqual(manifest.lookup("vae", "v.safetensors")["size"], 10)
+
+    def test_hash_is_kept_while_size_and_mtime_match(self):
+        manifest = self.manifest()
+        self.assertEqual(manifest.refresh(hash_files=True)["hashed"], 3)
+        digest = manifest.lookup("loras", "a.safetensors")["sha256"]
+        self.assertEqual(manifest.refresh(full=True, hash_files=True)["hashed"], 0)
+        self.assertEqual(manifest.lookup("loras", "a.safetensors")["sha256"], digest)
+
+        path = self.write("loras/a.safetensors", b"changed")
+        os.utime(path, (2, 2))
+        manifest.refresh(full=True)
+        self.assertNotIn("sha256", manifest.lookup("loras", "a.safetensors"))
+
+    def test_folder_refresh_leaves_other_folders_alone(self):
+        manifest = ModelManifest(self.root, workers=2)
+        stats = manifest.refresh(folder="loras")
+        self.assertEqual(stats["dirs"], 2)
+        self.assertFalse(manifest.refreshed)
+        self.assertFalse(manifest.has_folder("vae"))
+
+        manifest.refresh()
+        self.write("vae/w.safetensors", b"w")
+        self.touch_dir("vae")
+        shutil.rmtree(os.path.join(self.root, "loras", "sub"))
+        self.touch_dir("loras")
+        stats = manifest.refresh(folder="/loras/")
+        self.assertEqual(stats["dirs_rescanned"], 1)
+        self.assertEqual(sorted(manifest.files("loras")), ["a.safetensors"])
+        self.assertFalse(manifest.has_folder("loras/sub"))
+        # vae is stale until a refresh covers it.
+        self.assertIsNone(manifest.lookup("vae", "w.safetensors"))
+        self.assertIsNotNone(manifest.lookup("vae", "v.safetensors"))
+
+    def test_index_is_saved_and_reused(self):
+        path = os.path.join(self.tmp, "cache", "model_manifest.json")
+        first = self.manifest(path=path)
+        first.refresh()
+        self.assertTrue(os.path.isfile(path))
+        again = self.manifest(path=path)
+        self.assertEqual(again.files(), first.files())
+        self.assertEqual(again.refresh()["dirs_rescanned"], 0)
+
+    def test_index_for_another_root_is_ignored(self):
+        path = os.path.join(self.tmp, "cache", "model_manifest.json")
+        self.manifest(path=path).refresh()
+        other = ModelManifest(os.path.join(self.tmp, "elsewhere"), path=path)
+        self.assertEqual(other.dirs, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
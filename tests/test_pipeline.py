@@ -0,0 +1,83 @@
+"""JobPipeline failure reporting and joining."""
+
+import os
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+from pipeline import JobPipeline, PipelineError  # noqa: E402
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+class TestJobPipeline(unittest.TestCase):
+    def test_raise_if_failed_ignores_running_and_successful_tasks(self):
+        gate = threading.Event()
+        with JobPipeline("job", max_workers=2) as pipe:
+            pipe.submit("ok", lambda: 1).result()
+            pipe.submit("slow", gate.wait)
+            pipe.raise_if_failed()
+            gate.set()
+
+    def test_raise_if_failed_names_the_failed_task(self):
+        pipe = JobPipeline("job")
+        try:
+            fut = pipe.submit("upload batch 2", fail, "disk full")
+            with self.assertRaises(ValueError):
+                fut.result()
+            with self.assertRaises(PipelineError) as ctx:
+                pipe.raise_if_failed()
+        finally:
+            pipe.shutdown()
+        self.assertEqual(ctx.exception.task, "upload batch 2")
+        self.assertIsInstance(ctx.exception.__cause__, ValueError)
+        self.assertIn("disk full", str(ctx.exception))
+
+    def test_join_waits_for_every_task(self):
+        results = []
+        with JobPipeline("job", max_workers=2) as pipe:
+            first = pipe.submit("first", lambda: results.append(1) or 1)
+            pipe.submit_after("second", first, lambda value: results.append(value + 1))
+            pipe.join()
+            self.assertEqual(sorted(results), [1, 2])
+
+    def test_join_raises_the_failure_and_cancels_pending_tasks(self):
+        gate = threading.Event()
+        pipe = JobPipeline("job", max_workers=1)
+        try:
+            pipe.submit("upload batch 1", fail, "boom")
+            pipe.submit("upload batch 2", gate.wait, 5)
+            queued = pipe.submit("upload batch 3", lambda: None)
+            with self.assertRaises(PipelineError) as ctx:
+                pipe.join()
+            self.assertTrue(queued.cancelled())
+        finally:
+            gate.set()
+            pipe.shutdown()
+        self.assertEqual(ctx.exception.task, "upload batch 1")
+
+    def test_leaving_the_block_joins_and_reraises(self):
+        with self.assertRaises(PipelineError):
+            with JobPipeline("job") as pipe:
+                pipe.submit("upload", fail, "boom")
+
+    def test_dependent_task_is_cancelled_when_its_dependency_fails(self):
+        pipe = JobPipeline("job")
+        try:
+            dep = pipe.submit("upload", fail, "boom")
+            after = pipe.submit_after("cache", dep, lambda url: url)
+            with self.assertRaises(PipelineError) as ctx:
+                pipe.join()
+        finally:
+            pipe.shutdown()
+        self.assertEqual(ctx.exception.task, "upload")
+        self.assertTrue(after.cancelled())
+
+
+if __name__ == "__main__":
+    unittest.main()
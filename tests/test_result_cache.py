@@ -0,0 +1,158 @@
+"""ResultCache keys, batch entries and eviction, on a temp dir."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import handler  # noqa: E402
+from result_cache import IMAGE_PLACEHOLDER, ResultCache  # noqa: E402
+from workflow_template import compile_template  # noqa: E402
+
+with open(os.path.join(ROOT, "src", "workflow.json")) as f:
+    BASE_WORKFLOW = json.load(f)
+
+
+def batch_workflow_for(negative="blurry"):
+    """A run_job-style batch_workflow closure over the default workflow."""
+    template = compile_template(BASE_WORKFLOW)
+
+    def batch_workflow(scene_idx, batch_prompts, image, prefix="batch", latent=None,
+                       save_latent=False):
+        return handler.build_batch_workflow(template, batch_prompts, negative, 81, None,
+                                            image, 16, scene_idx, output_prefix=prefix,
+                                            prev_latent=latent, save_latent=save_latent)
+    return batch_workflow
+
+
+BATCHES = handler.plan_batches(6, [f"scene {i}" for i in range(6)], 2)
+
+
+class TestCacheKeys(unittest.TestCase):
+    def keys(self, batches=BATCHES, digest="digest-a", **kwargs):
+        return handler.batch_cache_keys(batch_workflow_for(kwargs.pop("negative", "blurry")),
+                                        batches, digest, has_image=True, **kwargs)
+
+    def test_keys_are_stable(self):
+        self.assertEqual(self.keys(), self.keys())
+        self.assertEqual(ResultCache.job_key(self.keys()), ResultCache.job_key(self.keys()))
+        self.assertEqual(len(set(self.keys())), len(BATCHES))
+
+    def test_keys_chain_through_earlier_batches(self):
+        base = self.keys()
+        # A different source image changes every key down the chain.
+        self.assertTrue(all(a != b for a, b in zip(base, self.keys(digest="digest-b"))))
+        # Changing batch 2 changes batches 2 and 3, not batch 1.
+        changed = list(BATCHES)
+        changed[1] = (changed[1][0], ["other", changed[1][1][1]])
+        keys = self.keys(batches=changed)
+        self.assertEqual(keys[0], base[0])
+        self.assertNotEqual(keys[1], base[1])
+        self.assertNotEqual(keys[2], base[2])
+        self.assertNotEqual(ResultCache.job_key(keys), ResultCache.job_key(base))
+
+    def test_independent_batches_only_depend_on_the_source(self):
+        base = self.keys(independent=True)
+        changed = list(BATCHES)
+        changed[1] = (changed[1][0], ["other", changed[1][1][1]])
+        keys = self.keys(batches=changed, independent=True)
+        self.assertEqual((keys[0], keys[2]), (base[0], base[2]))
+        self.assertNotEqual(keys[1], base[1])
+
+    def test_keys_hash_placeholders_not_upload_names(self):
+        seen = []
+        build = batch_workflow_for()
+
+        def spy(scene_idx, batch_prompts, image, **kwargs):
+            seen.append(image)
+            return build(scene_idx, batch_prompts, image, **kwargs)
+
+        handler.batch_cache_keys(spy, BATCHES, "digest-a", has_image=True)
+        self.assertEqual(seen, [IMAGE_PLACEHOLDER] * len(BATCHES))
+        # Without a source image the first batch has no LoadImage input, but
+        # later ones still load the previous batch's last frame.
+        seen.clear()
+        handler.batch_cache_keys(spy, BATCHES, None, has_image=False)
+        self.assertEqual(seen, [None, IMAGE_PLACEHOLDER, IMAGE_PLACEHOLDER])
+
+
+class TestResultCacheStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmp, "results"), max_bytes=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def chunk(self, name, size=100):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def age(self, key, seconds):
+        meta = os.path.join(self.cache.batch_dir, key, "meta.json")
+        then = time.time() - seconds
+        os.utime(meta, (then, then))
+
+    def test_put_and_get_batch(self):
+        self.cache.put_batch("k1", self.chunk("a.mp4"), "https://cdn/a.mp4")
+        hit = self.cache.get_batch("k1")
+        self.assertEqual(hit["url"], "https://cdn/a.mp4")
+        with open(hit["path"], "rb") as f, open(os.path.join(self.tmp, "a.mp4"), "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertIsNone(self.cache.get_batch("missing"))
+
+    def test_put_batch_keeps_the_first_entry(self):
+        self.cache.put_batch("k1", self.chunk("a.mp4"), "https://cdn/a.mp4")
+        self.cache.put_batch("k1", self.chunk("b.mp4"), "https://cdn/b.mp4")
+        self.assertEqual(self.cache.get_batch("k1")["url"], "https://cdn/a.mp4")
+
+    def test_truncated_chunk_is_a_miss(self):
+        self.cache.put_batch("k1", self.chunk("a.mp4"), "https://cdn/a.mp4")
+        with open(os.path.join(self.cache.batch_dir, "k1", "chunk.mp4"), "r+b") as f:
+            f.truncate(50)
+        self.assertIsNone(self.cache.get_batch("k1"))
+
+    def test_corrupt_meta_is_a_miss(self):
+        self.cache.put_batch("k1", self.chunk("a.mp4"), "https://cdn/a.mp4")
+        with open(os.path.join(self.cache.batch_dir, "k1", "meta.json"), "w") as f:
+            f.write("{")
+        self.assertIsNone(self.cache.get_batch("k1"))
+
+    def test_evict_drops_least_recently_used_first(self):
+        self.cache.max_bytes = 10_000
+        for i, key in enumerate(("k1", "k2", "k3")):
+            self.cache.put_batch(key, self.chunk(f"{key}.mp4"), f"https://cdn/{key}.mp4")
+            self.age(key, 300 - i * 100)
+        # A hit makes the oldest entry the most recently used.
+        self.assertIsNotNone(self.cache.get_batch("k1"))
+
+        self.cache.max_bytes = 250
+        self.assertEqual(self.cache.evict(), 100)
+        self.assertIsNone(self.cache.get_batch("k2"))
+        self.assertIsNotNone(self.cache.get_batch("k1"))
+        self.assertIsNotNone(self.cache.get_batch("k3"))
+
+    def test_put_batch_evicts_over_budget(self):
+        for i, key in enumerate(("k1", "k2", "k3")):
+            self.cache.put_batch(key, self.chunk(f"{key}.mp4"), f"https://cdn/{key}.mp4")
+            self.age(key, 300 - i * 100)
+        self.assertEqual(sorted(os.listdir(self.cache.batch_dir)), ["k2", "k3"])
+
+    def test_put_and_get_job(self):
+        self.assertIsNone(self.cache.get_job("job"))
+        self.cache.put_job("job", "https://cdn/final.mp4", ["https://cdn/1.mp4"])
+        entry = self.cache.get_job("job")
+        self.assertEqual(entry["final_video_url"], "https://cdn/final.mp4")
+        self.assertEqual(entry["chunk_urls"], ["https://cdn/1.mp4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
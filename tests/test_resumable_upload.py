@@ -0,0 +1,126 @@
+"""ResumableUploader / StreamingUpload against the fake TUS server in tools/fake_services.py."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import resumable_upload  # noqa: E402
+from fake_services import FakeServices  # noqa: E402
+from resumable_upload import TUS_CHUNK_SIZE, ResumableUploader  # noqa: E402
+
+
+class TestResumableUpload(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        clip = os.path.join(self.tmp, "clip.mp4")
+        with open(clip, "wb") as f:
+            f.write(b"\0" * 1024)
+        self.services = FakeServices(self.tmp, clip).start()
+        self.supabase = self.services.supabase
+        self.uploader = ResumableUploader(f"http://127.0.0.1:{self.services.supabase_port}",
+                                          "test-key", "videos")
+        patcher = mock.patch.object(resumable_upload, "UPLOAD_RETRY_DELAY_S", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.uploader.session.close()
+        self.services.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, size, mode="wb"):
+        path = os.path.join(self.tmp, name)
+        with open(path, mode) as f:
+            f.write(os.urandom(size))
+        return path
+
+    def only_upload(self):
+        self.assertEqual(len(self.supabase.uploads), 1)
+        return next(iter(self.supabase.uploads.values()))
+
+    def test_small_file_uses_simple_post(self):
+        path = self.write("small.mp4", 1000)
+        result = self.uploader.upload(path, "small.mp4")
+        self.assertEqual(result.mode, "simple")
+        self.assertEqual(self.supabase.patches, [])
+        self.assertEqual(self.supabase.objects, 1)
+
+    def test_tus_upload_patches_in_6mib_chunks(self):
+        size = 2 * TUS_CHUNK_SIZE + 1000
+        path = self.write("big.mp4", size)
+        result = self.uploader.upload(path, "big.mp4")
+        self.assertEqual(result.mode, "tus")
+        self.assertEqual(result.size, size)
+        self.assertEqual([(offset, sent) for _, offset, sent, _ in self.supabase.patches],
+                         [(0, TUS_CHUNK_SIZE), (TUS_CHUNK_SIZE, TUS_CHUNK_SIZE),
+                          (2 * TUS_CHUNK_SIZE, 1000)])
+        self.assertEqual(self.only_upload(), {"offset": size, "length": size})
+        self.assertEqual(self.supabase.objects, 1)
+
+    def test_interrupted_patch_resumes_from_head_offset(self):
+        size = TUS_CHUNK_SIZE + 1000
+        path = self.write("big.mp4", size)
+        self.supabase.interrupt_patches = 1
+        with mock.patch.object(self.uploader, "_offset", wraps=self.uploader._offset) as head:
+            self.uploader.upload(path, "big.mp4")
+        head.assert_called_once()
+        kept = TUS_CHUNK_SIZE // 2
+        self.assertEqual([(offset, sent) for _, offset, sent, _ in self.supabase.patches],
+                         [(0, kept), (kept, size - kept)])
+        self.assertEqual(self.only_upload(), {"offset": size, "length": size})
+        self.assertEqual(self.supabase.bytes_received, size)
+
+    def test_streaming_upload_defers_length_until_finish(self):
+        path = self.write("final.mp4", TUS_CHUNK_SIZE + 100)
+        stream = self.uploader.open_stream("final.mp4")
+        self.assertTrue(stream.enabled)
+
+        self.assertEqual(stream.push(path), TUS_CHUNK_SIZE)
+        self.assertEqual(self.only_upload(), {"offset": TUS_CHUNK_SIZE, "length": None})
+        self.assertEqual(self.supabase.objects, 0)
+
+        self.write("final.mp4", TUS_CHUNK_SIZE, mode="ab")
+        size = 2 * TUS_CHUNK_SIZE + 100
+        self.assertEqual(stream.push(path), 2 * TUS_CHUNK_SIZE)
+        self.assertIsNone(self.only_upload()["length"])
+
+        result = stream.finish(path)
+        self.assertEqual(result.mode, "tus-stream")
+        self.assertEqual(result.size, size)
+        self.assertEqual(self.only_upload(), {"offset": size, "length": size})
+        self.assertEqual(self.supabase.objects, 1)
+        # Only the final PATCH declares the length.
+        self.assertEqual([length for _, _, _, length in self.supabase.patches],
+                         [None, None, str(size)])
+        self.assertEqual(self.supabase.patches[-1][1:3], (2 * TUS_CHUNK_SIZE, 100))
+
+    def test_streaming_upload_of_exact_chunk_multiple_declares_length(self):
+        size = 2 * TUS_CHUNK_SIZE
+        path = self.write("final.mp4", size)
+        stream = self.uploader.open_stream("final.mp4")
+        self.assertEqual(stream.push(path), size)
+        self.assertIsNone(self.only_upload()["length"])
+
+        result = stream.finish(path)
+        self.assertEqual(result.size, size)
+        self.assertEqual(self.only_upload(), {"offset": size, "length": size})
+        self.assertEqual(self.supabase.objects, 1)
+        # Nothing was left to send, so the length went out on an empty PATCH.
+        self.assertEqual(self.supabase.patches[-1][1:], (size, 0, str(size)))
+
+    def test_streaming_upload_without_pushes_declares_length_up_front(self):
+        path = self.write("final.mp4", 1000)
+        result = self.uploader.open_stream("final.mp4").finish(path)
+        self.assertEqual(result.mode, "tus-stream")
+        self.assertEqual(self.only_upload(), {"offset": 1000, "length": 1000})
+        self.assertEqual(self.supabase.objects, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,260 @@
+"""Compiled workflow templates against the per-job patching they replaced."""
+
+import copy
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "tools")]
+
+import handler  # noqa: E402
+from result_cache import IMAGE_PLACEHOLDER, LATENT_PLACEHOLDER  # noqa: E402
+from workflow_template import (LATENT_LOAD_ID, LATENT_SAVE_ID, LATENT_TRIM_ID,  # noqa: E402
+                               WAN_I2V_LOCKED_MAPPING, WAN_SVI_MAPPING, compile_template,
+                               expand_scenes, supports_latent_handoff)
+
+with open(os.path.join(ROOT, "src", "workflow.json")) as f:
+    BASE_WORKFLOW = json.load(f)
+
+PROMPTS = ["a cat walks in", "the cat sits down", "the cat falls asleep"]
+
+
+def legacy_build(base_workflow, scene_prompts, negative_text, frames_per_scene,
+                 sampling_steps, uploaded_filename, fps, batch_start_idx,
+                 lora_strength=None, lora_strengths=None):
+    """build_batch_workflow as it was before templates: deepcopy and patch by id."""
+    wf = copy.deepcopy(base_workflow)
+    n = len(scene_prompts)
+
+    if lora_strength is not None or lora_strengths:
+        handler.apply_lora_strengths(wf, global_strength=lora_strength, per_lora=lora_strengths)
+
+    if uploaded_filename:
+        for node in wf.values():
+            if isinstance(node, dict) and node.get("class_type") == "LoadImage":
+                node["inputs"]["image"] = uploaded_filename
+
+    if sampling_steps:
+        for node in wf.values():
+            if isinstance(node, dict) and node.get("class_type") == "BasicScheduler":
+                node["inputs"]["steps"] = int(sampling_steps)
+
+    if "189" in wf: wf["189"]["inputs"]["noise_seed"] = 43 + batch_start_idx  # noqa: E701
+    if "182" in wf: wf["182"]["inputs"]["noise_seed"] = 44 + batch_start_idx  # noqa: E701
+    if "199" in wf: wf["199"]["inputs"]["noise_seed"] = 45 + batch_start_idx  # noqa: E701
+
+    wf["193:211"]["inputs"]["text"] = scene_prompts[0]
+    wf["193:209"]["inputs"]["text"] = negative_text
+    wf["193:215"]["inputs"]["length"] = frames_per_scene
+    wf["193:215"]["inputs"]["motion_latent_count"] = 0
+
+    if n == 1:
+        wf["204"]["inputs"]["images"] = ["193:217", 0]
+        wf["204"]["inputs"]["frame_rate"] = fps
+        for k in [k for k in wf if k.startswith("181:") or k.startswith("203:")]:
+            del wf[k]
+    else:
+        wf["181:152"]["inputs"]["text"] = scene_prompts[1]
+        wf["181:206"]["inputs"]["text"] = negative_text
+        wf["181:160"]["inputs"]["length"] = frames_per_scene
+        wf["181:160"]["inputs"]["motion_latent_count"] = 1
+        wf["181:160"]["inputs"]["prev_samples"] = ["193:216", 0]
+        wf["181:168"]["inputs"]["source_images"] = ["193:217", 0]
+        wf["181:168"]["inputs"]["new_images"] = ["181:162", 0]
+        if n == 2:
+            wf["204"]["inputs"]["images"] = ["181:168", 2]
+            wf["204"]["inputs"]["frame_rate"] = fps
+            for k in [k for k in wf if k.startswith("203:")]:
+                del wf[k]
+        else:
+            wf["203:222"]["inputs"]["text"] = scene_prompts[2]
+            wf["203:220"]["inputs"]["text"] = negative_text
+            wf["203:219"]["inputs"]["length"] = frames_per_scene
+            wf["203:219"]["inputs"]["motion_latent_count"] = 1
+            wf["203:219"]["inputs"]["prev_samples"] = ["181:208", 0]
+            wf["203:227"]["inputs"]["source_images"] = ["181:168", 2]
+            wf["203:227"]["inputs"]["new_images"] = ["203:218", 0]
+            wf["204"]["inputs"]["images"] = ["203:227", 2]
+            wf["204"]["inputs"]["frame_rate"] = fps
+
+    wf["204"]["inputs"]["filename_prefix"] = f"batch_{batch_start_idx:02d}"
+    return wf
+
+
+class TestTemplateMatchesLegacyPatching(unittest.TestCase):
+    CASES = [
+        # (sampling_steps, uploaded_filename, batch_start_idx, lora kwargs)
+        (None, None, 0, {}),
+        (6, "input_abc.png", 3, {}),
+        (4, "input_abc.png", 7, {"lora_strength": 0.6}),
+    ]
+
+    def test_one_to_three_scenes_match(self):
+        original = copy.deepcopy(BASE_WORKFLOW)
+        template = compile_template(BASE_WORKFLOW)
+        for n in (1, 2, 3):
+            for steps, image, start, lora in self.CASES:
+                args = (PROMPTS[:n], "blurry", 81, steps, image, 16, start)
+                with self.subTest(scenes=n, steps=steps, image=image, start=start, **lora):
+                    self.assertEqual(handler.build_batch_workflow(template, *args, **lora),
+                                     legacy_build(BASE_WORKFLOW, *args, **lora))
+        # Building batches never writes through to the shared template.
+        self.assertEqual(BASE_WORKFLOW, original)
+
+    def test_untouched_nodes_are_shared_with_the_template(self):
+        template = compile_template(BASE_WORKFLOW)
+        wf = handler.build_batch_workflow(template, PROMPTS, "blurry", 81, 6,
+                                          "input_abc.png", 16, 0)
+        plan = template.plan(3)
+        for node_id, node in wf.items():
+            if node_id in plan.touched:
+                self.assertIsNot(node, template.graph[node_id], node_id)
+            else:
+                self.assertIs(node, template.graph[node_id], node_id)
+
+
+def refs(graph):
+    """Every (node_id, input, referenced node) link in an API-format graph."""
+    for node_id, node in graph.items():
+        for name, value in node.get("inputs", {}).items():
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+                yield node_id, name, value[0]
+
+
+def scene_seed(wf, group):
+    """noise_seed of the RandomNoise feeding the sampler of a scene group."""
+    noise = {value[0] for k, v in wf.items() if k.startswith(group)
+             for value in v["inputs"].values()
+             if isinstance(value, list) and value and wf.get(value[0], {}).get("class_type")
+             == "RandomNoise"}
+    assert len(noise) == 1, (group, noise)
+    return wf[noise.pop()]["inputs"]["noise_seed"]
+
+
+class TestExpandScenes(unittest.TestCase):
+    GROUPS = ["193:", "181:", "203:", "203.3:", "203.4:"]
+
+    def build(self, n, start=0):
+        prompts = [f"scene {start + i}" for i in range(n)]
+        return handler.build_batch_workflow(compile_template(BASE_WORKFLOW), prompts,
+                                            "blurry", 81, None, None, 16, start)
+
+    def test_clones_rewire_refs_to_their_own_group(self):
+        graph, mapping, clones = expand_scenes(BASE_WORKFLOW, WAN_SVI_MAPPING, 5)
+        self.assertEqual(clones["203:219"], ["203.3:219", "203.4:219"])
+        self.assertEqual(clones["199"], ["203.3:199", "203.4:199"])
+        self.assertEqual([scene["group"] for scene in mapping["scenes"]], self.GROUPS)
+        for clone in ("203.3:", "203.4:"):
+            members = [k for k in graph if k.startswith(clone)]
+            # The group's nodes plus its own copy of RandomNoise 199.
+            self.assertEqual(len(members),
+                             len([k for k in BASE_WORKFLOW if k.startswith("203:")]) + 1)
+            for node_id, name, target in refs({k: graph[k] for k in members}):
+                with self.subTest(node=node_id, input=name):
+                    self.assertFalse(target.startswith("203:"), target)
+                    self.assertIn(target, graph)
+        self.assertEqual(graph["203.3:225"]["inputs"]["noise"], ["203.3:199", 0])
+
+    def test_n_scene_batch_chains_clones_in_order(self):
+        wf = self.build(5)
+        for node_id, name, target in refs(wf):
+            self.assertIn(target, wf, f"{node_id}.{name} -> {target}")
+        self.assertEqual(wf["203.3:219"]["inputs"]["prev_samples"], ["203:226", 0])
+        self.assertEqual(wf["203.4:219"]["inputs"]["prev_samples"], ["203.3:226", 0])
+        self.assertEqual(wf["203.3:227"]["inputs"]["source_images"], ["203:227", 2])
+        self.assertEqual(wf["203.4:227"]["inputs"]["source_images"], ["203.3:227", 2])
+        self.assertEqual(wf["203.4:227"]["inputs"]["new_images"], ["203.4:218", 0])
+        self.assertEqual(wf["204"]["inputs"]["images"], ["203.4:227", 2])
+        self.assertEqual(wf["203.4:222"]["inputs"]["text"], "scene 4")
+        self.assertEqual(wf["203.4:219"]["inputs"]["motion_latent_count"], 1)
+        self.assertNotIn("203.5:219", wf)
+
+    def test_scene_seed_does_not_depend_on_batch_size(self):
+        # Scene k gets base seed 43 + k whichever batch renders it.
+        for n, start in ((5, 0), (3, 0), (2, 3), (4, 1)):
+            wf = self.build(n, start)
+            for i, group in enumerate(self.GROUPS[:n]):
+                with self.subTest(scenes=n, start=start, scene=i):
+                    self.assertEqual(scene_seed(wf, group), 43 + start + i)
+
+
+class TestLatentHandoff(unittest.TestCase):
+    def build(self, n, prev_latent=None, save_latent=False, image="input_abc.png", start=3):
+        return handler.build_batch_workflow(compile_template(BASE_WORKFLOW), PROMPTS[:n],
+                                            "blurry", 81, None, image, 16, start,
+                                            output_prefix="job_batch",
+                                            prev_latent=prev_latent, save_latent=save_latent)
+
+    def test_only_chainable_mappings_support_it(self):
+        self.assertTrue(supports_latent_handoff(WAN_SVI_MAPPING))
+        self.assertFalse(supports_latent_handoff(WAN_I2V_LOCKED_MAPPING))
+
+    def test_without_handoff_no_nodes_are_added(self):
+        wf = self.build(3)
+        for node_id in (LATENT_SAVE_ID, LATENT_LOAD_ID, LATENT_TRIM_ID):
+            self.assertNotIn(node_id, wf)
+        self.assertEqual(wf["193:215"]["inputs"]["motion_latent_count"], 0)
+        self.assertEqual(wf["204"]["inputs"]["images"], ["203:227", 2])
+
+    def test_save_latent_writes_the_last_scene(self):
+        for n, latent_out in ((1, "193:216"), (2, "181:208"), (3, "203:226")):
+            with self.subTest(scenes=n):
+                wf = self.build(n, save_latent=True)
+                self.assertEqual(wf[LATENT_SAVE_ID]["class_type"], "SaveLatent")
+                self.assertEqual(wf[LATENT_SAVE_ID]["inputs"], {
+                    "samples": [latent_out, 0],
+                    "filename_prefix": "latents/job_batch_03",
+                })
+                self.assertNotIn(LATENT_LOAD_ID, wf)
+
+    def test_prev_latent_continues_the_first_scene(self):
+        wf = self.build(3, prev_latent="latents/job_batch_00_00001_.latent [output]")
+        self.assertEqual(wf[LATENT_LOAD_ID]["class_type"], "LoadLatent")
+        self.assertEqual(wf[LATENT_LOAD_ID]["inputs"],
+                         {"latent": "latents/job_batch_00_00001_.latent [output]"})
+        self.assertEqual(wf["193:215"]["inputs"]["prev_samples"], [LATENT_LOAD_ID, 0])
+        self.assertEqual(wf["193:215"]["inputs"]["motion_latent_count"], 1)
+        # The job's source image stays the anchor.
+        self.assertEqual(wf["97"]["inputs"]["image"], "input_abc.png")
+        # The re-rendered overlap is cut before the output node.
+        self.assertEqual(wf[LATENT_TRIM_ID]["class_type"], "ImageFromBatch")
+        self.assertEqual(wf[LATENT_TRIM_ID]["inputs"],
+                         {"image": ["203:227", 2], "batch_index": 5, "length": 4096})
+        self.assertEqual(wf["204"]["inputs"]["images"], [LATENT_TRIM_ID, 0])
+        for node_id, name, target in refs(wf):
+            self.assertIn(target, wf, f"{node_id}.{name} -> {target}")
+
+    def test_cache_keys_do_not_depend_on_latent_or_upload_names(self):
+        template = compile_template(BASE_WORKFLOW)
+        batches = handler.plan_batches(6, [f"scene {i}" for i in range(6)], 3)
+        graphs = []
+
+        def batch_workflow(scene_idx, batch_prompts, image, prefix="batch", latent=None,
+                           save_latent=False):
+            wf = handler.build_batch_workflow(template, batch_prompts, "blurry", 81, None,
+                                              image, 16, scene_idx, output_prefix=prefix,
+                                              prev_latent=latent, save_latent=save_latent)
+            graphs.append(wf)
+            return wf
+
+        keys = handler.batch_cache_keys(batch_workflow, batches, "digest", has_image=True,
+                                        latent_handoff=True)
+        self.assertEqual(graphs[0][LATENT_SAVE_ID]["inputs"]["filename_prefix"],
+                         "latents/batch_00")
+        self.assertNotIn(LATENT_LOAD_ID, graphs[0])
+        self.assertEqual(graphs[1][LATENT_LOAD_ID]["inputs"]["latent"], LATENT_PLACEHOLDER)
+        self.assertEqual(graphs[1]["97"]["inputs"]["image"], IMAGE_PLACEHOLDER)
+        self.assertNotIn(LATENT_SAVE_ID, graphs[1])
+
+        # Same keys on a rerun, and different from image handoff's.
+        self.assertEqual(keys, handler.batch_cache_keys(batch_workflow, batches, "digest",
+                                                        has_image=True, latent_handoff=True))
+        image_keys = handler.batch_cache_keys(batch_workflow, batches, "digest",
+                                              has_image=True)
+        self.assertNotEqual(keys[1], image_keys[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,264 @@
+"""
+tools/bench_handler.py
+
+Micro-benchmarks for the CPU-side work the handler does between GPU stages.
+Runs offline: every fixture (output dir, base64 payload, video clips) is
+generated in a temp dir, nothing talks to ComfyUI or Supabase.
+
+Usage:
+    python tools/bench_handler.py                       # run and print
+    python tools/bench_handler.py -k workflow           # only matching cases
+    python tools/bench_handler.py --save tools/bench_baseline.json
+    python tools/bench_handler.py --compare tools/bench_baseline.json
+
+Every case is measured in --runs separate rounds (5 for --save, 3
+otherwise) and reported as the median over the rounds. The baseline also
+keeps each case's noise, i.e. how far apart its rounds were. --compare exits
+non-zero when a case's median is slower than the baseline by more than
+--tolerance (default 50%) or twice its recorded noise, whichever is larger.
+tools/bench_baseline.json is the committed reference, recorded on an x86_64
+container with a static ffmpeg 6.0. Baselines are machine specific;
+re-record one with --save on the machine you compare on.
+
+The ffmpeg cases (last frame, concat, fMP4 append) are skipped when ffmpeg
+is not on PATH.
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+sys.path.insert(0, SRC)
+
+import handler  # noqa: E402  (src/handler.py; importing does not start the worker)
+from image_ingest import Base64Image, MultipartFile  # noqa: E402
+from fmp4 import FragmentedAssembler  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+from workflow_template import WorkflowTemplate  # noqa: E402
+
+WORKFLOW_PATH = os.path.join(SRC, "workflow.json")
+
+# Each repeat runs enough loops to take roughly this long.
+TARGET_REPEAT_S = 0.2
+REPEATS = 5
+
+
+def quiet(fn):
+    """Drop the [output]/[handler] prints so they don't dominate timings."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def measure(fn):
+    """Median and min seconds per call over REPEATS calibrated repeats."""
+    fn()  # warm up caches and imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= TARGET_REPEAT_S or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed < TARGET_REPEAT_S / 10 else max(2, int(TARGET_REPEAT_S / elapsed))
+    samples = [elapsed / loops]
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "loops": loops}
+
+
+# ---- fixtures ----------------------------------------------------------------
+
+def populated_output_dir(tmp, n_files=300):
+    """An output dir of sparse files plus a history entry naming all of them."""
+    out = os.path.join(tmp, "output")
+    os.makedirs(os.path.join(out, "sub"), exist_ok=True)
+    items = []
+    for i in range(n_files):
+        sub = "sub" if i % 3 == 0 else ""
+        name = f"batch_{i:04d}.mp4"
+        with open(os.path.join(out, sub, name), "wb") as f:
+            f.truncate(1024 * (i + 1))
+        items.append({"filename": name, "subfolder": sub, "type": "output"})
+    history = {"outputs": {"204": {"gifs": items[: n_files // 2]},
+                           "205": {"images": items[n_files // 2:]}}}
+    return out, history
+
+
+def synthetic_png_b64(size_mb=8):
+    raw = b"\x89PNG\r\n\x1a\n" + os.urandom(size_mb * 1024 * 1024)
+    return "data:image/png;base64," + base64.b64encode(raw).decode()
+
+
+def synthetic_clips(tmp, count=3, seconds=2):
+    clips = []
+    for i in range(count):
+        path = os.path.join(tmp, f"clip{i}.mp4")
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+               "-i", f"testsrc2=size=832x480:rate=16:duration={seconds}",
+               "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", "16", path]
+        subprocess.run(cmd, check=True, capture_output=True)
+        clips.append(path)
+    return clips
+
+
+# ---- cases -------------------------------------------------------------------
+
+def build_cases(tmp):
+    with open(WORKFLOW_PATH) as f:
+        workflow = json.load(f)
+    template = handler.compile_template(workflow)
+    prompts = ["a slow pan across a misty harbour at dawn"] * 3
+    build_kwargs = dict(negative_text="blurry", frames_per_scene=81, sampling_steps=6,
+                        uploaded_filename="input.png", fps=16, batch_start_idx=3)
+
+    def copy_graph():
+        return {k: dict(v, inputs=dict(v.get("inputs", {}))) for k, v in workflow.items()}
+
+    cases = {
+        "workflow_compile_cold": lambda: WorkflowTemplate(workflow).plan(3),
+        "build_batch_workflow_3_scenes": lambda: handler.build_batch_workflow(
+            template, prompts, **build_kwargs),
+        "build_batch_workflow_1_scene": lambda: handler.build_batch_workflow(
+            template, prompts[:1], **build_kwargs),
+        "build_batch_workflow_lora_overrides": quiet(lambda: handler.build_batch_workflow(
+            template, prompts, lora_strength=0.6,
+            lora_strengths={"HIGH Lora 5": 0.4}, **build_kwargs)),
+        "apply_lora_strengths": quiet(lambda: handler.apply_lora_strengths(
+            copy_graph(), global_strength=0.6, per_lora={"HIGH Lora 5": 0.4})),
+        "workflow_has_output_node": lambda: handler.workflow_has_output_node(workflow),
+        "cache_batch_key": lambda: ResultCache.batch_key(
+            handler.build_batch_workflow(template, prompts, **build_kwargs), "upstream"),
+    }
+
+    out_dir, history = populated_output_dir(tmp)
+    cases["resolve_output_300"] = quiet(lambda: handler._outputs.fetch(
+        handler._outputs.target(history, ["204"])[1], out_dir, tmp))
+
+    b64 = synthetic_png_b64()
+
+    def decode_b64():
+        img = Base64Image("bench.png", b64)
+        body = MultipartFile("image", img.name, img.content_type, img, img.size,
+                             fields={"overwrite": "true"})
+        for _ in body:
+            pass
+    cases["base64_stream_decode_8mb"] = decode_b64
+
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        clips = synthetic_clips(tmp)
+        concat_out = os.path.join(tmp, "concat.mp4")
+        frag_out = os.path.join(tmp, "frag.mp4")
+
+        def assemble():
+            asm = FragmentedAssembler(frag_out)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i, clip in enumerate(clips):
+                    asm.append(i, clip)
+
+        cases["last_frame_png_bytes"] = lambda: handler.last_frame_png_bytes(clips[0])
+        cases["ffmpeg_concat_3_clips"] = lambda: handler.ffmpeg_concat(clips, concat_out)
+        cases["fmp4_assemble_3_clips"] = assemble
+    else:
+        print("ffmpeg/ffprobe not on PATH; skipping ffmpeg cases")
+    return cases
+
+
+def run_cases(cases, runs, match=None):
+    """measure() every case in `runs` rounds; rounds interleave the cases."""
+    names = [name for name in cases if not match or match in name]
+    rounds = {name: [] for name in names}
+    for _ in range(runs):
+        for name in names:
+            rounds[name].append(measure(cases[name]))
+    results = {}
+    for name, samples in rounds.items():
+        medians = [r["median_s"] for r in samples]
+        results[name] = {
+            "median_s": statistics.median(medians),
+            "min_s": min(r["min_s"] for r in samples),
+            "loops": samples[-1]["loops"],
+            "runs": runs,
+            "noise": max(medians) / min(medians) - 1 if min(medians) else 0.0,
+        }
+    return results
+
+
+# ---- baselines ---------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            print(f"  {name:<40} (no baseline)")
+            continue
+        ratio = res["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        limit = max(tolerance, 2 * base.get("noise", 0.0))
+        flag = "REGRESSION" if ratio > 1 + limit else ""
+        print(f"  {name:<40} {ratio:6.2f}x baseline (limit {1 + limit:.2f}x) {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def fmt(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:8.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds:8.3f} s "
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("-k", dest="match", help="only run cases containing this text")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--runs", type=int, help="rounds per case (default 5 with --save, else 3)")
+    args = parser.parse_args()
+    runs = args.runs or (5 if args.save else 3)
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        cases = build_cases(tmp)
+        results = run_cases(cases, runs, args.match)
+    for name, res in results.items():
+        print(f"{name:<40} median {fmt(res['median_s'])}  min {fmt(res['min_s'])}  "
+              f"noise {res['noise']:5.1%}  ({res['loops']} loops x {runs} runs)")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "created": time.time(), "cases": results}, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed past their limit")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ FIXED vs original:
   - LORA_DIR defaults now match handler.py  (models/loras, not models/lora-video)
   - Registry filename is registry.json      (not registry.generated.json)
   - Path is configurable via LORA_DIR env var for Pod vs Serverless
+  - Files are looked up in the model manifest (src/model_manifest.py) instead
+    of one stat per registry entry; under /runpod-volume/models the manifest
+    is shared with the workers and only changed directories are rescanned
 """
 
 import json
@@ -22,11 +25,14 @@ import os
 import sys
 from collections import defaultdict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from model_manifest import manifest_for  # noqa: E402
+
 # ── Path config — must match src/handler.py LORA_DIR_REL ──────────────────
 DEFAULT_LORA_DIR = os.environ.get(
     "LORA_DIR",
-    "/workspace/criminal_jade_guineafowl/models/loras",
-    "/runpod-volume/criminal_jade_guineafowl/models/loras",# Pod default
+    "/workspace/criminal_jade_guineafowl/models/loras",  # Pod default
 )
 # On serverless the volume mounts at /runpod-volume, so:
 #   LORA_DIR=/runpod-volume/models/loras python tools/check_lora_sidecars.py
@@ -51,6 +57,8 @@ def main():
     print()
 
     entries = load_registry()
+    manifest, folder = manifest_for(LORA_DIR)
+    on_disk = manifest.ensure().files(folder)
     by_cat  = defaultdict(list)
     for e in entries:
         cat = e.get("category", "uncategorized")
@@ -65,12 +73,9 @@ def main():
             fn    = e.get("filename", alias + ".safetensors")
             base  = os.path.splitext(fn)[0]
 
-            safe_path = os.path.join(LORA_DIR, fn)
-            json_path = os.path.join(LORA_DIR, base + ".json")
-
-            if not os.path.isfile(safe_path):
+            if fn not in on_disk:
                 missing_safe.append((cat, alias, fn))
-            if not os.path.isfile(json_path):
+            if base + ".json" not in on_disk:
                 missing_json.append((cat, alias, base + ".json"))
 
     print("=== LoRA SIDE-CAR REPORT ===")
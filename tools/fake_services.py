@@ -0,0 +1,401 @@
+"""
+tools/fake_services.py
+
+Local stand-ins for ComfyUI and Supabase Storage, for load-testing the
+handler offline (see tools/load_harness.py).
+
+FakeComfy implements the parts of the ComfyUI API the handler uses:
+
+    POST /prompt            queue a graph; prompts run one at a time, like a GPU
+    GET  /history/{id}      history entry once the prompt has finished
+    GET  /ws?clientId=...   execution_start / executing / execution_success events
+    POST /upload/image      multipart upload into the fake input dir
+    GET|HEAD /view          serve an input or output file
+    GET  /system_stats      static stats
+    POST /queue             {"delete": [...]} drops queued prompts
+
+Each prompt takes ``exec_seconds`` (± ``jitter``), spread over its nodes so
+per-node events look real, then copies ``clip`` into the output dir under
+the graph's VHS_VideoCombine ``filename_prefix``. Every history entry also
+reports a SaveImage-style output for node LAST_FRAME_NODE, so jobs sent with
+``"last_frame_node": LAST_FRAME_NODE`` hand off without ffmpeg. SaveLatent
+nodes write a placeholder ``.latent`` under ``latents/``, so latent handoff
+works too.
+
+FakeSupabase accepts simple object POSTs and the TUS resumable endpoint
+(creation, creation-defer-length, termination, optionally concatenation),
+throttled to ``mbps`` megabytes per second per connection. Uploaded bytes
+are counted, not stored. Setting ``interrupt_patches`` makes that many
+PATCHes drop the connection halfway through, to exercise resuming.
+
+    services = FakeServices(tmp_dir, clip_path, exec_seconds=2.0)
+    services.start()        # runs both servers on a background event loop
+    ...
+    services.stop()
+"""
+
+import asyncio
+import base64
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+LAST_FRAME_NODE = "9000"
+
+# 1x1 transparent PNG, used as the "last frame" image.
+TINY_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+OUTPUT_CLASSES = ("VHS_VideoCombine", "SaveVideo")
+
+
+class FakeComfy:
+    def __init__(self, root, clip_path, exec_seconds=2.0, jitter=0.2, fail_rate=0.0):
+        self.input_dir = os.path.join(root, "input")
+        self.output_dir = os.path.join(root, "output")
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.clip_path = clip_path
+        self.exec_seconds = exec_seconds
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.history = {}
+        self.sockets = {}        # client_id -> set of websockets
+        self.cancelled = set()
+        self.counter = 0
+        self.executed = 0
+        self.busy_seconds = 0.0
+        self.queue = None
+
+    def app(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/prompt", self.post_prompt)
+        app.router.add_get("/history/{prompt_id}", self.get_history)
+        app.router.add_get("/ws", self.websocket)
+        app.router.add_post("/upload/image", self.upload_image)
+        app.router.add_get("/view", self.view)
+        app.router.add_get("/system_stats", self.system_stats)
+        app.router.add_post("/queue", self.post_queue)
+        app.on_startup.append(self._start_worker)
+        app.on_cleanup.append(self._stop_worker)
+        return app
+
+    async def _start_worker(self, app):
+        self.queue = asyncio.Queue()
+        app["worker"] = asyncio.create_task(self._worker())
+
+    async def _stop_worker(self, app):
+        app["worker"].cancel()
+
+    # ---- HTTP ---------------------------------------------------------------
+
+    async def post_prompt(self, request):
+        body = await request.json()
+        prompt_id = str(uuid.uuid4())
+        await self.queue.put((prompt_id, body.get("prompt") or {}, body.get("client_id")))
+        return web.json_response({"prompt_id": prompt_id, "number": self.queue.qsize(),
+                                  "node_errors": {}})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info["prompt_id"]
+        entry = self.history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry else {})
+
+    async def upload_image(self, request):
+        reader = await request.multipart()
+        name = None
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.name != "image":
+                await part.read()
+                continue
+            name = os.path.basename(part.filename or f"upload_{uuid.uuid4().hex}.png")
+            with open(os.path.join(self.input_dir, name), "wb") as f:
+                while True:
+                    chunk = await part.read_chunk(256 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        if name is None:
+            return web.Response(status=400, text="no image field")
+        return web.json_response({"name": name, "subfolder": "", "type": "input"})
+
+    async def view(self, request):
+        kind = request.query.get("type", "output")
+        base = self.input_dir if kind == "input" else self.output_dir
+        path = os.path.join(base, request.query.get("subfolder", ""),
+                            os.path.basename(request.query.get("filename", "")))
+        if not os.path.isfile(path):
+            return web.Response(status=404)
+        return web.FileResponse(path)
+
+    async def system_stats(self, request):
+        return web.json_response({
+            "system": {"os": "fake", "comfyui_version": "fake", "python_version": "fake"},
+            "devices": [{"name": "fake-gpu", "type": "cuda", "vram_total": 80 * 1024 ** 3,
+                         "vram_free": 80 * 1024 ** 3}],
+        })
+
+    async def post_queue(self, request):
+        body = await request.json()
+        self.cancelled.update(body.get("delete") or [])
+        return web.json_response({})
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get("clientId", "")
+        self.sockets.setdefault(client_id, set()).add(ws)
+        await ws.send_str(json.dumps({"type": "status", "data": {
+            "status": {"exec_info": {"queue_remaining": self.queue.qsize()}}, "sid": client_id}}))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.sockets.get(client_id, set()).discard(ws)
+        return ws
+
+    # ---- execution ----------------------------------------------------------
+
+    async def _emit(self, client_id, msg_type, data):
+        message = json.dumps({"type": msg_type, "data": data})
+        for ws in list(self.sockets.get(client_id, ())):
+            try:
+                await ws.send_str(message)
+            except ConnectionError:
+                pass
+
+    async def _worker(self):
+        while True:
+            prompt_id, graph, client_id = await self.queue.get()
+            if prompt_id in self.cancelled:
+                continue
+            started = time.perf_counter()
+            try:
+                await self._execute(prompt_id, graph, client_id)
+            except Exception as e:
+                print(f"[fake_comfy] {prompt_id} crashed: {e}")
+            self.busy_seconds += time.perf_counter() - started
+            self.executed += 1
+
+    async def _execute(self, prompt_id, graph, client_id):
+        data = {"prompt_id": prompt_id}
+        await self._emit(client_id, "execution_start", dict(data, timestamp=int(time.time() * 1000)))
+        nodes = [k for k, v in graph.items() if isinstance(v, dict)] or ["1"]
+        total = max(0.0, random.gauss(self.exec_seconds, self.exec_seconds * self.jitter))
+        for node in nodes:
+            await self._emit(client_id, "executing", dict(data, node=node))
+            await asyncio.sleep(total / len(nodes))
+
+        if random.random() < self.fail_rate:
+            error = dict(data, node_id=nodes[-1], node_type=graph.get(nodes[-1], {}).get("class_type"),
+                         exception_message="injected failure")
+            self.history[prompt_id] = {"outputs": {}, "status": {
+                "status_str": "error", "completed": False,
+                "messages": [["execution_error", error]]}}
+            await self._emit(client_id, "execution_error", error)
+            return
+
+        outputs = {}
+        for node_id, node in graph.items():
+            if isinstance(node, dict) and node.get("class_type") in OUTPUT_CLASSES:
+                self.counter += 1
+                prefix = str(node.get("inputs", {}).get("filename_prefix", "fake"))
+                name = f"{os.path.basename(prefix)}_{self.counter:05d}.mp4"
+                await asyncio.to_thread(shutil.copyfile, self.clip_path,
+                                        os.path.join(self.output_dir, name))
+                outputs[node_id] = {"gifs": [{"filename": name, "subfolder": "",
+                                              "type": "output", "format": "video/h264-mp4"}]}
+            elif isinstance(node, dict) and node.get("class_type") == "SaveLatent":
+                self.counter += 1
+                prefix = str(node.get("inputs", {}).get("filename_prefix", "latents/fake"))
+                subfolder, name = os.path.split(f"{prefix}_{self.counter:05d}_.latent")
+                os.makedirs(os.path.join(self.output_dir, subfolder), exist_ok=True)
+                with open(os.path.join(self.output_dir, subfolder, name), "wb") as f:
+                    f.write(b"\0" * 1024)
+                outputs[node_id] = {"latents": [{"filename": name, "subfolder": subfolder,
+                                                 "type": "output"}]}
+        frame = f"last_frame_{self.counter:05d}.png"
+        with open(os.path.join(self.output_dir, frame), "wb") as f:
+            f.write(TINY_PNG)
+        outputs[LAST_FRAME_NODE] = {"images": [{"filename": frame, "subfolder": "",
+                                                "type": "output"}]}
+
+        self.history[prompt_id] = {"prompt": [0, prompt_id, graph, {}, []], "outputs": outputs,
+                                   "status": {"status_str": "success", "completed": True,
+                                              "messages": []}}
+        await self._emit(client_id, "executing", dict(data, node=None))
+        await self._emit(client_id, "execution_success", dict(data, timestamp=int(time.time() * 1000)))
+
+
+class FakeSupabase:
+    def __init__(self, mbps=0.0, concatenation=False):
+        self.mbps = mbps
+        self.extensions = ["creation", "creation-defer-length", "termination"]
+        if concatenation:
+            self.extensions.append("concatenation")
+        self.uploads = {}    # id -> {"offset", "length", "name"}
+        self.patches = []    # (id, offset, bytes stored, Upload-Length header or None)
+        self.bytes_received = 0
+        self.objects = 0
+        # The next N PATCHes store half their body, then drop the connection.
+        self.interrupt_patches = 0
+
+    def app(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/storage/v1/object/{bucket}/{path:.+}", self.simple_upload)
+        app.router.add_route("OPTIONS", "/storage/v1/upload/resumable", self.tus_options)
+        app.router.add_post("/storage/v1/upload/resumable", self.tus_create)
+        app.router.add_route("HEAD", "/storage/v1/upload/resumable/{id}", self.tus_head)
+        app.router.add_patch("/storage/v1/upload/resumable/{id}", self.tus_patch)
+        app.router.add_delete("/storage/v1/upload/resumable/{id}", self.tus_delete)
+        return app
+
+    def _tus_headers(self, extra=None):
+        headers = {"Tus-Resumable": "1.0.0"}
+        headers.update(extra or {})
+        return headers
+
+    async def _consume(self, request):
+        """Read the request body at the configured bandwidth; returns its length."""
+        received = 0
+        started = time.perf_counter()
+        async for chunk in request.content.iter_chunked(256 * 1024):
+            received += len(chunk)
+            if self.mbps > 0:
+                due = received / (self.mbps * 1024 * 1024)
+                lag = due - (time.perf_counter() - started)
+                if lag > 0:
+                    await asyncio.sleep(lag)
+        self.bytes_received += received
+        return received
+
+    async def simple_upload(self, request):
+        await self._consume(request)
+        self.objects += 1
+        return web.json_response({"Key": f"{request.match_info['bucket']}/{request.match_info['path']}"})
+
+    async def tus_options(self, request):
+        return web.Response(status=204, headers=self._tus_headers({
+            "Tus-Version": "1.0.0", "Tus-Extension": ",".join(self.extensions)}))
+
+    async def tus_create(self, request):
+        upload_id = uuid.uuid4().hex
+        concat = request.headers.get("Upload-Concat", "")
+        length = request.headers.get("Upload-Length")
+        entry = {"offset": 0, "length": int(length) if length else None}
+        if concat.startswith("final;"):
+            parts = [url.rstrip("/").rsplit("/", 1)[-1] for url in concat[6:].split()]
+            entry["offset"] = sum(self.uploads[p]["offset"] for p in parts if p in self.uploads)
+            entry["length"] = entry["offset"]
+            self.objects += 1
+        self.uploads[upload_id] = entry
+        return web.Response(status=201, headers=self._tus_headers({
+            "Location": f"/storage/v1/upload/resumable/{upload_id}"}))
+
+    async def tus_head(self, request):
+        entry = self.uploads.get(request.match_info["id"])
+        if entry is None:
+            return web.Response(status=404, headers=self._tus_headers())
+        headers = {"Upload-Offset": str(entry["offset"]), "Cache-Control": "no-store"}
+        if entry["length"] is not None:
+            headers["Upload-Length"] = str(entry["length"])
+        return web.Response(status=200, headers=self._tus_headers(headers))
+
+    async def tus_patch(self, request):
+        entry = self.uploads.get(request.match_info["id"])
+        if entry is None:
+            return web.Response(status=404, headers=self._tus_headers())
+        offset = int(request.headers.get("Upload-Offset", "-1"))
+        if offset != entry["offset"]:
+            return web.Response(status=409, headers=self._tus_headers(
+                {"Upload-Offset": str(entry["offset"])}))
+        if request.headers.get("Upload-Length"):
+            entry["length"] = int(request.headers["Upload-Length"])
+        if self.interrupt_patches > 0:
+            self.interrupt_patches -= 1
+            kept = len(await request.content.readexactly(request.content_length // 2))
+            entry["offset"] += kept
+            self.bytes_received += kept
+            self.patches.append((request.match_info["id"], offset, kept,
+                                 request.headers.get("Upload-Length")))
+            request.transport.close()
+            return web.Response(status=500)
+        received = await self._consume(request)
+        entry["offset"] += received
+        self.patches.append((request.match_info["id"], offset, received,
+                             request.headers.get("Upload-Length")))
+        if entry["length"] is not None and entry["offset"] >= entry["length"]:
+            self.objects += 1
+        return web.Response(status=204, headers=self._tus_headers(
+            {"Upload-Offset": str(entry["offset"])}))
+
+
+    async def tus_delete(self, request):
+        if self.uploads.pop(request.match_info["id"], None) is None:
+            return web.Response(status=404, headers=self._tus_headers())
+        return web.Response(status=204, headers=self._tus_headers())
+
+
+class FakeServices:
+    """Runs FakeComfy and FakeSupabase on 127.0.0.1 in a background thread."""
+
+    def __init__(self, root, clip_path, exec_seconds=2.0, jitter=0.2, fail_rate=0.0,
+                 supabase_mbps=0.0, tus_concatenation=False):
+        self.comfy = FakeComfy(root, clip_path, exec_seconds, jitter, fail_rate)
+        self.supabase = FakeSupabase(supabase_mbps, tus_concatenation)
+        self.comfy_port = None
+        self.supabase_port = None
+        self._loop = None
+        self._runners = []
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fake-services", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(30)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cleanup(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+            self._loop.close()
+
+    def drop_sockets(self):
+        """Close every open ComfyUI websocket from the server side."""
+        async def close_all():
+            for sockets in list(self.comfy.sockets.values()):
+                for ws in list(sockets):
+                    await ws.close()
+        asyncio.run_coroutine_threadsafe(close_all(), self._loop).result(10)
+
+    async def _serve(self, app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self._runners.append(runner)
+        return site._server.sockets[0].getsockname()[1]
+
+    async def _cleanup(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self.comfy_port = self._loop.run_until_complete(self._serve(self.comfy.app()))
+        self.supabase_port = self._loop.run_until_complete(self._serve(self.supabase.app()))
+        self._ready.set()
+        self._loop.run_forever()
@@ -0,0 +1,292 @@
+"""
+tools/load_harness.py
+
+Replays job payloads through the handler against a local fake ComfyUI and a
+fake Supabase (tools/fake_services.py) and reports throughput, tail latency,
+handler overhead per batch and upload bandwidth.
+
+Usage:
+    # 20 synthesised 3-scene jobs, 2 at a time, 1.5 s per prompt on the "GPU"
+    python tools/load_harness.py --synth 20 --concurrency 2 --exec-seconds 1.5
+
+    # Replay payloads: one JSON object per line, either {"id":..,"input":{..}}
+    # (RunPod job format) or a bare input dict
+    python tools/load_harness.py --jobs payloads.jsonl --concurrency 4
+
+    # Serve the handler like SERVE_API_LOCALLY (runpod --rp_serve_api) and
+    # drive it over HTTP /runsync instead of calling it in-process
+    python tools/load_harness.py --synth 10 --mode api --concurrency 2
+
+Prompts produce a copy of --clip (default: a synthetic clip made with ffmpeg,
+or random bytes if ffmpeg is missing, in which case only single-batch jobs can
+finish). Synthesised jobs set "last_frame_node" so handoffs come from the fake
+history; pass --ffmpeg-handoff to exercise the ffmpeg extraction path instead.
+The result cache is disabled and journals go to the temp dir, so repeated
+payloads are really rendered.
+"""
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS)
+sys.path.insert(0, TOOLS)
+
+from fake_services import FakeServices, LAST_FRAME_NODE, TINY_PNG  # noqa: E402
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def make_clip(tmp, seconds):
+    path = os.path.join(tmp, "clip.mp4")
+    if shutil.which("ffmpeg"):
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+               "-i", f"testsrc2=size=832x480:rate=16:duration={seconds}",
+               "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", "16", path]
+        subprocess.run(cmd, check=True, capture_output=True)
+    else:
+        print("[harness] ffmpeg not found: prompts output random bytes, "
+              "multi-batch jobs will fail at stitching")
+        with open(path, "wb") as f:
+            f.write(os.urandom(2 * 1024 * 1024))
+    return path
+
+
+def load_jobs(args):
+    jobs = []
+    if args.jobs:
+        with open(args.jobs) as f:
+            for i, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                payload = entry.get("input", entry)
+                jobs.append({"id": entry.get("id") or f"replay-{i:04d}", "input": payload})
+    for i in range(args.synth):
+        payload = {
+            "images": [{"name": "harness_input.png",
+                        "image": base64.b64encode(TINY_PNG).decode()}],
+            "prompts": [f"synthetic scene {n}" for n in range(args.scenes)],
+            "num_scenes": args.scenes,
+            "frames_per_scene": args.frames,
+            "cache": False,
+        }
+        if not args.ffmpeg_handoff:
+            payload["last_frame_node"] = LAST_FRAME_NODE
+        jobs.append({"id": f"synth-{i:04d}", "input": payload})
+    # Unique ids per run so journals from an earlier run are never resumed.
+    run = time.strftime("%H%M%S")
+    for job in jobs:
+        job["id"] = f"{job['id']}-{run}"
+    return jobs
+
+
+def configure_env(services, tmp):
+    os.environ.update({
+        "COMFY_HOST": "127.0.0.1",
+        "COMFY_PORT": str(services.comfy_port),
+        "SUPABASE_URL": f"http://127.0.0.1:{services.supabase_port}",
+        "SUPABASE_KEY": "fake-service-key",
+        "SUPABASE_BUCKET": "videos",
+        "RESULT_CACHE_ENABLED": "false",
+        "JOB_JOURNAL_DIR": os.path.join(tmp, "state", "journal"),
+        "TIMINGS_JSONL_PATH": os.path.join(tmp, "state", "logs", "timings.jsonl"),
+        "COMFY_OUTPUT_DIR": services.comfy.output_dir,
+        "WORKFLOW_PATH": os.environ.get("WORKFLOW_PATH", os.path.join(ROOT, "src", "workflow.json")),
+    })
+
+
+# ---- drivers -----------------------------------------------------------------
+
+def run_inprocess(jobs, concurrency, services):
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    import handler  # noqa: E402  (reads the env configured above)
+
+    def run(job):
+        start = time.perf_counter()
+        try:
+            return job, handler.handler(job), time.perf_counter() - start, None
+        except Exception as e:
+            return job, None, time.perf_counter() - start, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        yield from (f.result() for f in as_completed([pool.submit(run, j) for j in jobs]))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_api(jobs, concurrency, services):
+    port = free_port()
+    env = dict(os.environ, JOB_CONCURRENCY=str(concurrency))
+    # --rp_api_concurrency > 1 needs uvicorn workers, which the SDK cannot start
+    # from a script; /runsync requests already run concurrently on its loop.
+    cmd = [sys.executable, os.path.join(ROOT, "handler.py"), "--rp_serve_api",
+           "--rp_api_host", "127.0.0.1", "--rp_api_port", str(port)]
+    proc = subprocess.Popen(cmd, env=env, cwd=ROOT)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                requests.get(f"{base}/docs", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.25)
+        else:
+            raise RuntimeError("local RunPod API did not come up")
+
+        def run(job):
+            start = time.perf_counter()
+            try:
+                r = requests.post(f"{base}/runsync", json=job, timeout=24 * 3600)
+                r.raise_for_status()
+                body = r.json()
+                if body.get("status") not in ("COMPLETED", None) or body.get("error"):
+                    raise RuntimeError(body.get("error") or body.get("status"))
+                return job, body.get("output"), time.perf_counter() - start, None
+            except Exception as e:
+                return job, None, time.perf_counter() - start, e
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            yield from (f.result() for f in as_completed([pool.submit(run, j) for j in jobs]))
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+# ---- report ------------------------------------------------------------------
+
+def summarise(results, wall, services):
+    latencies, overheads, rates = [], [], []
+    upload_bytes = upload_secs = 0
+    failures = []
+    for job, output, seconds, error in results:
+        if error is not None:
+            failures.append({"id": job["id"], "error": f"{type(error).__name__}: {error}"})
+            continue
+        latencies.append(seconds)
+        timings = (output or {}).get("timings") or {}
+        prompts = list((timings.get("prompts") or {}).values())
+        # One chunk per batch; a prompt can render several scenes, and cached
+        # batches have no prompt at all.
+        batches = len((output or {}).get("chunk_urls") or []) or len(prompts)
+        if batches:
+            gpu = sum(p.get("queue_wait_s", 0) + p.get("execution_s", 0) for p in prompts)
+            overheads.append(max(0.0, timings.get("total_seconds", seconds) - gpu) / batches)
+        for t in timings.get("transfers") or []:
+            upload_bytes += t["bytes"]
+            upload_secs += t["seconds"]
+            if t["mb_per_s"]:
+                rates.append(t["mb_per_s"])
+
+    def stats(values):
+        if not values:
+            return None
+        return {"p50": round(percentile(values, 50), 3), "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3), "mean": round(statistics.mean(values), 3),
+                "max": round(max(values), 3)}
+
+    return {
+        "jobs": len(results),
+        "succeeded": len(latencies),
+        "failed": len(failures),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_minute": round(len(latencies) / wall * 60, 2) if wall else 0.0,
+        "latency_s": stats(latencies),
+        "handler_overhead_per_batch_s": stats(overheads),
+        "upload": {
+            "per_upload_mb_per_s": stats(rates),
+            "aggregate_mb_per_s": round(upload_bytes / 1024 / 1024 / upload_secs, 2)
+            if upload_secs else None,
+            "received_mb": round(services.supabase.bytes_received / 1024 / 1024, 2),
+            "wall_mb_per_s": round(services.supabase.bytes_received / 1024 / 1024 / wall, 2)
+            if wall else None,
+        },
+        "fake_comfy": {
+            "prompts_executed": services.comfy.executed,
+            "gpu_busy_fraction": round(services.comfy.busy_seconds / wall, 3) if wall else None,
+        },
+        "failures": failures[:20],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--jobs", help="JSONL file of job payloads to replay")
+    parser.add_argument("--synth", type=int, default=0, help="number of synthesised jobs")
+    parser.add_argument("--scenes", type=int, default=3, help="num_scenes for synthesised jobs")
+    parser.add_argument("--frames", type=int, default=81, help="frames_per_scene for synthesised jobs")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--mode", choices=("inprocess", "api"), default="inprocess")
+    parser.add_argument("--exec-seconds", type=float, default=2.0, help="fake prompt duration")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative stddev of that duration")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of prompts that error")
+    parser.add_argument("--supabase-mbps", type=float, default=0.0,
+                        help="per-connection upload bandwidth in MB/s (0 = unthrottled)")
+    parser.add_argument("--tus-concatenation", action="store_true",
+                        help="advertise the TUS concatenation extension")
+    parser.add_argument("--clip", help="mp4 every prompt outputs")
+    parser.add_argument("--clip-seconds", type=float, default=5.0)
+    parser.add_argument("--ffmpeg-handoff", action="store_true")
+    parser.add_argument("--report", help="also write the report JSON here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="harness_") as tmp:
+        os.makedirs(os.path.join(tmp, "state"))
+        clip = args.clip or make_clip(tmp, args.clip_seconds)
+        jobs = load_jobs(args)
+        if not jobs:
+            parser.error("nothing to run: pass --jobs and/or --synth")
+
+        services = FakeServices(tmp, clip, args.exec_seconds, args.jitter, args.fail_rate,
+                                args.supabase_mbps, args.tus_concatenation).start()
+        configure_env(services, tmp)
+        print(f"[harness] fake ComfyUI :{services.comfy_port}, fake Supabase :{services.supabase_port}; "
+              f"{len(jobs)} job(s), concurrency {args.concurrency}, mode {args.mode}")
+        driver = run_api if args.mode == "api" else run_inprocess
+        started = time.perf_counter()
+        results = []
+        try:
+            for result in driver(jobs, args.concurrency, services):
+                job, _, seconds, error = result
+                status = "ok" if error is None else f"FAILED ({error})"
+                print(f"[harness] {job['id']}: {seconds:.2f}s {status}")
+                results.append(result)
+        finally:
+            wall = time.perf_counter() - started
+            services.stop()
+
+        report = summarise(results, wall, services)
+        print(json.dumps(report, indent=2))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+        sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()